@@ -0,0 +1,205 @@
+import itertools
+import logging
+import socket
+from concurrent.futures import Future, TimeoutError
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Union
+
+from AgentProtocol import AgentError, AgentUnreachableError, Connection, decode_state
+from CommandQueue import Submission
+from EventBuffer import EventBuffer
+from Server import ServerState
+
+# Seconds to wait before reconnecting to an agent, doubling after each failed attempt up to MAX_RECONNECT_SECONDS
+RECONNECT_SECONDS = 1
+MAX_RECONNECT_SECONDS = 30
+CONNECT_TIMEOUT = 10
+UNREACHABLE_MESSAGE = "Couldn't reach the host this server is on!"
+
+
+class RemoteServer:
+    """A server managed by an agent on another host, as seen by the web frontend.
+
+    Has the parts of Server's interface that make sense from afar: its state, its events (followed by log streams) and
+    running commands on it.
+    """
+
+    def __init__(self, agent: "AgentClient", remote_name: str, state: ServerState):
+        self.agent: AgentClient = agent
+        self.remote_name: str = remote_name  # Name of the server on its agent
+        self.name: str = state.name
+        self.state: ServerState = state
+        self.events: EventBuffer = EventBuffer()
+
+    @property
+    def users(self) -> frozenset[str]:
+        return self.state.users
+
+    @property
+    def admins(self) -> frozenset[str]:
+        return self.state.admins
+
+    def is_running(self) -> bool:
+        return self.state.running
+
+    def get_log_lines(self) -> list[str]:
+        return self.state.log.splitlines() if self.state.log is not None else []
+
+    def submit_commands(self, commands: list[str]) -> Union[Submission, str]:
+        try:
+            result = self.agent.call("run_commands", {"name": self.remote_name, "commands": commands})
+        except AgentUnreachableError:
+            return UNREACHABLE_MESSAGE
+        except AgentError as e:
+            return str(e)
+        if "error" in result:
+            return result["error"]
+        return Submission(result["seqs"], result["queued"])
+
+
+class AgentClient:
+    """The web frontend's connection to one agent, kept open (and reopened if it drops) for as long as MC Server Web runs.
+
+    The agent's servers are mirrored as RemoteServers, named "<agent name>: <server name>", and kept up to date from
+    the changes the agent sends. While the agent can't be reached, it has no servers.
+    """
+
+    def __init__(self, name: str, host: str, port: int, token: str, call_timeout: float,
+                 on_change: Callable[[bool], None]):
+        self.name: str = name
+        self.host: str = host
+        self.port: int = port
+        self.token: str = token
+        self.call_timeout: float = call_timeout
+        # Called whenever the agent's servers change, with whether servers were added or removed, or their users changed
+        self.on_change: Callable[[bool], None] = on_change
+
+        self.connection: Union[Connection, None] = None
+        self.servers: dict[str, RemoteServer] = {}  # Key is the server's name on the frontend
+        self.pending: dict[int, Future] = {}  # Key is request ID
+        self.ids = itertools.count(1)
+        self.lock: Lock = Lock()
+        self.stopped: Event = Event()
+        self.thread: Union[Thread, None] = None
+
+    def start(self):
+        self.thread = Thread(target=self._run, name=f"mc-server-web-agent-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        connection = self.connection
+        if connection is not None:
+            connection.close()
+
+    def get_servers(self) -> dict[str, RemoteServer]:
+        with self.lock:
+            return dict(self.servers)
+
+    def call(self, method: str, params: dict) -> Any:
+        """Make a request to the agent and wait for its result.
+
+        Raises:
+            AgentUnreachableError: If the agent isn't connected or didn't answer within call_timeout seconds.
+            AgentError: If the agent sent an error.
+        """
+        connection = self.connection
+        if connection is None:
+            raise AgentUnreachableError(f"Agent {self.name} isn't connected")
+        request_id = next(self.ids)
+        future = Future()
+        with self.lock:
+            self.pending[request_id] = future
+        try:
+            if not connection.send({"id": request_id, "method": method, "params": params}):
+                raise AgentUnreachableError(f"Agent {self.name} isn't connected")
+            return future.result(self.call_timeout)
+        except TimeoutError:
+            raise AgentUnreachableError(f"Agent {self.name} didn't answer in time")
+        finally:
+            with self.lock:
+                self.pending.pop(request_id, None)
+
+    def _run(self):
+        delay = RECONNECT_SECONDS
+        while not self.stopped.is_set():
+            connection = None
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+                connection = Connection(sock, self.name)
+                connection.send({"id": 0, "method": "hello", "params": {"token": self.token}})
+                hello = connection.receive()
+                if hello is None or "error" in hello:
+                    raise ValueError(hello.get("error") if hello is not None else "Connection closed")
+                sock.settimeout(None)
+                self.connection = connection
+                logging.info(f"Connected to agent {self.name} at {self.host}:{self.port}")
+                delay = RECONNECT_SECONDS
+                while True:
+                    message = connection.receive()
+                    if message is None:
+                        break
+                    self._on_message(message)
+            except (OSError, ValueError, TypeError, KeyError) as e:
+                if not self.stopped.is_set():
+                    logging.warning(f"Lost connection to agent {self.name} ({e}). Reconnecting in {delay} seconds.")
+            finally:
+                self.connection = None
+                if connection is not None:
+                    connection.close()
+                self._on_disconnect()
+            self.stopped.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_SECONDS)
+
+    def _on_message(self, message: dict):
+        if "id" in message:
+            with self.lock:
+                future = self.pending.get(message["id"])
+            if future is not None and not future.done():
+                if "error" in message:
+                    future.set_exception(AgentError(message["error"]))
+                else:
+                    future.set_result(message.get("result"))
+        elif message.get("event") == "states":
+            self._on_states(message["data"]["changed"], message["data"]["removed"])
+        elif message.get("event") == "server_event":
+            data = message["data"]
+            with self.lock:
+                server = self.servers.get(self.get_name(data["name"]))
+            if server is not None:
+                event_data = data["data"]
+                if data["type"] == "stopping":
+                    # Job IDs are only unique per agent, so they're given the agent's name like /api/manage does
+                    event_data = {**event_data, "job_id": f"{self.name}/{event_data['job_id']}"}
+                server.events.publish(data["type"], event_data)
+
+    def _on_states(self, changed: list[dict], removed: list[str]):
+        servers_changed = False
+        with self.lock:
+            for data in changed:
+                name = self.get_name(data["name"])
+                state = decode_state(data, name)
+                server = self.servers.get(name)
+                if server is None:
+                    self.servers[name] = RemoteServer(self, data["name"], state)
+                    servers_changed = True
+                else:
+                    servers_changed |= server.state.users != state.users or server.state.admins != state.admins
+                    server.state = state
+            for remote_name in removed:
+                servers_changed |= self.servers.pop(self.get_name(remote_name), None) is not None
+        self.on_change(servers_changed)
+
+    def _on_disconnect(self):
+        with self.lock:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(AgentUnreachableError(f"Lost connection to agent {self.name}"))
+            had_servers = len(self.servers) > 0
+            self.servers.clear()
+        if had_servers:
+            self.on_change(True)
+
+    def get_name(self, remote_name: str) -> str:
+        """Get what one of the agent's servers is called on the frontend."""
+        return f"{self.name}: {remote_name}"
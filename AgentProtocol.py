@@ -0,0 +1,111 @@
+import json
+import queue
+import socket
+from threading import Thread
+from typing import Union
+
+from Server import ServerState
+
+# Messages are single lines of JSON. Lines longer than this are refused, and the connection is closed.
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+# Messages waiting to be sent on a connection. If the other end falls this far behind, the connection is closed, and
+# it resyncs when it reconnects.
+MAX_OUTBOX = 10000
+
+
+class AgentError(Exception):
+    """Raised when a request to an agent fails, whether because the agent couldn't be reached or it sent an error."""
+
+
+class AgentUnreachableError(AgentError):
+    """Raised when a request to an agent fails because the agent couldn't be reached or didn't answer in time."""
+
+
+class Connection:
+    """One end of a connection between the web frontend and an agent, carrying one line of JSON per message.
+
+    Requests are {"id": ..., "method": ..., "params": {...}}, and the response to each is {"id": ..., "result": ...} or
+    {"id": ..., "error": "..."}. Responses can arrive in any order, so any number of requests can be in flight at once.
+    Agents also send messages with no ID, {"event": ..., "data": ...}, whenever something changes.
+
+    Messages are sent by a dedicated thread, so a slow peer never blocks whoever is sending.
+    """
+
+    def __init__(self, sock: socket.socket, name: str):
+        self.sock: socket.socket = sock
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.reader = sock.makefile("rb")
+        self.outbox: queue.Queue[Union[bytes, None]] = queue.Queue(MAX_OUTBOX)
+        self.closed: bool = False
+        self.thread: Thread = Thread(target=self._write, name=f"agent-connection-{name}", daemon=True)
+        self.thread.start()
+
+    def send(self, message: dict) -> bool:
+        """Queue a message to be sent.
+
+        Returns:
+            False if the connection is closed (or was just closed because the peer fell too far behind), otherwise True.
+        """
+        if self.closed:
+            return False
+        try:
+            self.outbox.put_nowait(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+            return True
+        except queue.Full:
+            self.close()
+            return False
+
+    def receive(self) -> Union[dict, None]:
+        """Wait for the next message.
+
+        Raises:
+            OSError: If the connection failed.
+            ValueError: If the peer sent something other than a line of JSON.
+
+        Returns:
+            The message, or None if the connection was closed.
+        """
+        line = self.reader.readline(MAX_MESSAGE_BYTES + 1)
+        if len(line) == 0:
+            return None
+        if not line.endswith(b"\n"):
+            raise ValueError("Message is too long")
+        message = json.loads(line)
+        if not isinstance(message, dict):
+            raise ValueError("Message isn't an object")
+        return message
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)  # Wakes up anything blocked reading from or writing to the socket
+        except OSError:
+            pass
+        self.sock.close()
+        try:
+            self.outbox.put_nowait(None)  # Wake the writer thread, so it can exit
+        except queue.Full:
+            pass
+
+    def _write(self):
+        while True:
+            data = self.outbox.get()
+            if data is None or self.closed:
+                return
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.close()
+                return
+
+
+def encode_state(state: ServerState) -> dict:
+    return {**state._asdict(), "users": sorted(state.users), "admins": sorted(state.admins)}
+
+
+def decode_state(data: dict, name: str) -> ServerState:
+    """Turn a server's state from an agent back into a ServerState, renamed to name."""
+    return ServerState(**{**data, "name": name, "users": frozenset(data["users"]),
+                          "admins": frozenset(data["admins"])})
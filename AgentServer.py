@@ -0,0 +1,150 @@
+import logging
+import secrets
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Mapping, Union
+
+from AgentProtocol import AgentError, Connection, encode_state
+from EventBuffer import EventBuffer
+from Server import Server, ServerState
+
+# Seconds the web frontend has to authenticate after connecting
+HELLO_TIMEOUT = 10
+
+
+class AgentServer:
+    """Serves the servers on this host to the web frontend over the agent protocol (see AgentProtocol.Connection).
+
+    The first request on a connection must be hello, with the shared token. After that, the frontend is sent the state
+    of every server, then changes to those states and every server's events (log lines, starts, stops and so on) as
+    they happen, so it never has to poll. Requests are handled on a thread pool, so a slow one (such as starting a
+    server) doesn't hold up the others.
+    """
+
+    def __init__(self, host: str, port: int, token: str, handlers: Mapping[str, Callable[[dict], Any]],
+                 get_states: Callable[[], Mapping[str, ServerState]], get_servers: Callable[[], list[Server]],
+                 push_interval: float):
+        self.host: str = host
+        self.port: int = port
+        self.token: str = token
+        self.handlers: Mapping[str, Callable[[dict], Any]] = handlers  # Key is method name
+        self.get_states: Callable[[], Mapping[str, ServerState]] = get_states
+        self.get_servers: Callable[[], list[Server]] = get_servers
+        self.push_interval: float = push_interval
+
+        self.listener: Union[socket.socket, None] = None
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="mc-server-web-agent")
+        self.connections: set[Connection] = set()
+        self.push_lock: Lock = Lock()  # Held while sending changes, so new connections get everything in order
+        self.last_states: Mapping[str, ServerState] = {}  # The states the connected frontends were last sent
+        self.event_seqs: dict[str, tuple[EventBuffer, int]] = {}  # Key is server name, value is the last event sent
+        self.stopped: Event = Event()
+
+    def start(self):
+        self.listener = socket.create_server((self.host, self.port))
+        Thread(target=self._accept, name="mc-server-web-agent-accept", daemon=True).start()
+        Thread(target=self._push, name="mc-server-web-agent-push", daemon=True).start()
+        logging.info(f"Agent listening on {self.host}:{self.port}")
+
+    def stop(self):
+        self.stopped.set()
+        if self.listener is not None:
+            self.listener.close()
+        with self.push_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _accept(self):
+        while not self.stopped.is_set():
+            try:
+                sock, address = self.listener.accept()
+            except OSError:
+                return  # Closed by stop()
+            Thread(target=self._serve, args=(sock, address), name=f"mc-server-web-agent-{address[0]}",
+                   daemon=True).start()
+
+    def _serve(self, sock: socket.socket, address: tuple):
+        connection = Connection(sock, f"{address[0]}:{address[1]}")
+        try:
+            sock.settimeout(HELLO_TIMEOUT)
+            hello = connection.receive()
+            sock.settimeout(None)
+            params = hello.get("params") if hello is not None else None
+            if hello is None or hello.get("method") != "hello" or not isinstance(params, dict) or \
+                    not secrets.compare_digest(str(params.get("token", "")), self.token):
+                logging.warning(f"Refused agent connection from {address[0]}, which didn't authenticate")
+                connection.send({"id": hello.get("id") if hello is not None else None, "error": "Not authenticated!"})
+                return
+            connection.send({"id": hello.get("id"), "result": {}})
+            with self.push_lock:
+                # Start the frontend off with every server's state. Later changes are sent by _push().
+                connection.send({"event": "states", "data": {"changed": [encode_state(state) for state in
+                                                                         self.last_states.values()], "removed": []}})
+                self.connections.add(connection)
+            logging.info(f"Web frontend connected from {address[0]}")
+            while True:
+                message = connection.receive()
+                if message is None:
+                    return
+                self.executor.submit(self._handle, connection, message)
+        except (OSError, ValueError):
+            return  # The connection failed or the frontend sent garbage. Either way, it can reconnect.
+        finally:
+            with self.push_lock:
+                self.connections.discard(connection)
+            connection.close()
+
+    def _handle(self, connection: Connection, message: dict):
+        request_id = message.get("id")
+        handler = self.handlers.get(message.get("method"))
+        params = message.get("params")
+        if handler is None or not isinstance(params, dict):
+            connection.send({"id": request_id, "error": "Invalid request!"})
+            return
+        try:
+            connection.send({"id": request_id, "result": handler(params)})
+        except AgentError as e:
+            connection.send({"id": request_id, "error": str(e)})
+        except Exception:
+            logging.exception(f"Agent request {message.get('method')} failed!")
+            connection.send({"id": request_id, "error": "Internal error!"})
+
+    def _push(self):
+        while not self.stopped.wait(self.push_interval):
+            try:
+                self._send_changes()
+            except Exception:
+                logging.exception("Failed to send changes to the web frontend!")
+
+    def _send_changes(self):
+        states = self.get_states()
+        events = []
+        servers = self.get_servers()
+        for name in set(self.event_seqs.keys()) - {server.name for server in servers}:
+            del self.event_seqs[name]
+        for server in servers:
+            buffer, seq = self.event_seqs.get(server.name, (None, 0))
+            if buffer is not server.events:
+                # A server (or a new Server for it) that hasn't been followed before. Only follow it from now on.
+                seq = server.events.last_seq
+            for event in server.events.wait_since(seq, 0):
+                events.append({"name": server.name, "type": event.type, "data": event.data})
+                seq = event.seq
+            self.event_seqs[server.name] = (server.events, seq)
+        with self.push_lock:
+            changed = [encode_state(state) for name, state in states.items() if self.last_states.get(name) != state]
+            removed = [name for name in self.last_states if name not in states]
+            self.last_states = states
+            messages = []
+            # States first, so a server's state is already up to date when the frontend hears that it started
+            if len(changed) > 0 or len(removed) > 0:
+                messages.append({"event": "states", "data": {"changed": changed, "removed": removed}})
+            messages.extend({"event": "server_event", "data": event} for event in events)
+            for connection in list(self.connections):
+                for message in messages:
+                    if not connection.send(message):
+                        self.connections.discard(connection)
+                        break
@@ -0,0 +1,137 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Union
+
+from BackupStore import BackupStore, SnapshotInfo, Throttle
+from CommandQueue import Submission
+from Server import Server
+
+# Log line a server writes once save-all flush is done
+SAVED_LOG_TEXT = "Saved the game"
+
+
+class BackupManager:
+    """Takes, prunes and restores snapshots of servers' folders in the background, one at a time.
+
+    A running server is told to save and stop writing its world (save-off, then save-all flush) before its snapshot is
+    taken, and to start saving again (save-on) afterwards, so the snapshot is consistent.
+    """
+
+    def __init__(self, folder: str, keep: int, read_bytes_per_second: Union[float, None], save_timeout: float,
+                 exclude: list[str]):
+        self.store: BackupStore = BackupStore(folder)
+        self.keep: int = keep
+        self.read_bytes_per_second: Union[float, None] = read_bytes_per_second
+        self.save_timeout: float = save_timeout
+        self.exclude: list[str] = exclude
+        # One worker, so backups never compete with each other for the disk, and garbage collection never runs while a
+        # snapshot is being taken
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mc-server-web-backup")
+        self.jobs: dict[str, dict] = {}  # Key is server name, value is the status of its latest backup or restore
+        self.lock: Lock = Lock()
+
+    def back_up(self, server: Server) -> bool:
+        """Start backing up a server in the background.
+
+        Returns:
+            False if the server already has a backup or restore in progress, otherwise True.
+        """
+        return self._submit(server, "backup", self._back_up)
+
+    def restore(self, server: Server, snapshot_id: str) -> bool:
+        """Start restoring a server's folder from a snapshot in the background. The server must not be running.
+
+        Returns:
+            False if the server already has a backup or restore in progress, otherwise True.
+        """
+        return self._submit(server, "restore", lambda s: self._restore(s, snapshot_id))
+
+    def get_status(self, server: Server) -> Union[dict, None]:
+        """Get the status of a server's latest backup or restore, or None if it hasn't had one."""
+        with self.lock:
+            job = self.jobs.get(server.name)
+            return dict(job) if job is not None else None
+
+    def is_restoring(self, server: Server) -> bool:
+        with self.lock:
+            job = self.jobs.get(server.name)
+            return job is not None and job["action"] == "restore" and job["finished_at"] is None
+
+    def list_snapshots(self, server: Server) -> list[SnapshotInfo]:
+        return self.store.list_snapshots(server.folder_path)
+
+    def has_snapshot(self, server: Server, snapshot_id: str) -> bool:
+        return any(info.id == snapshot_id for info in self.list_snapshots(server))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, server: Server, action: str, run: Callable[[Server], dict]) -> bool:
+        with self.lock:
+            job = self.jobs.get(server.name)
+            if job is not None and job["finished_at"] is None:
+                return False
+            self.jobs[server.name] = {"action": action, "status": "queued", "started_at": time.time(),
+                                      "finished_at": None, "error": None, "snapshot": None}
+        self.executor.submit(self._run, server, run)
+        return True
+
+    def _run(self, server: Server, run: Callable[[Server], dict]):
+        self._set_job(server, status="running")
+        try:
+            snapshot = run(server)
+            self._set_job(server, status="done", snapshot=snapshot)
+        except Exception as e:
+            logging.exception(f"Backup job for server {server.name} failed!")
+            self._set_job(server, status="failed", error=str(e))
+        finally:
+            self._set_job(server, finished_at=time.time())
+
+    def _set_job(self, server: Server, **changes):
+        with self.lock:
+            self.jobs[server.name].update(changes)
+
+    def _back_up(self, server: Server) -> dict:
+        saving_paused = self._pause_saving(server)
+        try:
+            info = self.store.snapshot(server.folder_path, self.exclude, Throttle(self.read_bytes_per_second))
+        finally:
+            if saving_paused:
+                server.submit_commands(["save-on"])
+        pruned = self.store.prune(server.folder_path, self.keep)
+        logging.info(f"Backed up server {server.name} in {info.seconds} seconds, reading {info.read_bytes} bytes and "
+                     f"storing {info.new_bytes} new bytes. Pruned {pruned} old snapshots.")
+        return info.get_data()
+
+    def _restore(self, server: Server, snapshot_id: str) -> dict:
+        if server.is_running():
+            raise ValueError("Servers must be stopped before they're restored")
+        if not self.store.restore(server.folder_path, snapshot_id, self.exclude):
+            raise ValueError(f"Snapshot {snapshot_id} not found")
+        logging.info(f"Restored server {server.name} from snapshot {snapshot_id}")
+        return {"id": snapshot_id}
+
+    def _pause_saving(self, server: Server) -> bool:
+        """Have a running server save its world and stop writing to it, waiting up to save_timeout for the save.
+
+        Returns:
+            Whether the server was told to stop saving, in which case it must be told to start again.
+        """
+        seq = server.events.last_seq
+        if not isinstance(server.submit_commands(["save-off", "save-all flush"]), Submission):
+            return False  # Not running, so nothing is writing to the world
+        deadline = time.monotonic() + self.save_timeout
+        while time.monotonic() < deadline:
+            events = server.events.wait_since(seq, deadline - time.monotonic())
+            for event in events:
+                if event.type == "log" and any(SAVED_LOG_TEXT in line for line in event.data):
+                    return True
+                if event.type in ("stopped", "crashed"):
+                    return False
+            if len(events) > 0:
+                seq = events[-1].seq
+        logging.warning(f"Server {server.name} didn't finish saving within {self.save_timeout} seconds. Backing it "
+                        f"up anyway.")
+        return True
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import logging
+import os
+import secrets
+import time
+import zlib
+from typing import NamedTuple, Union
+
+# Files are split into chunks of this many bytes at fixed offsets. Minecraft rewrites region files in place, a sector
+# at a time, so fixed offsets line up with the parts that change.
+CHUNK_SIZE = 256 * 1024
+
+
+class Throttle:
+    """Limits how fast bytes are read, by sleeping whenever reading gets ahead of bytes_per_second."""
+
+    def __init__(self, bytes_per_second: Union[float, None]):
+        self.bytes_per_second: Union[float, None] = bytes_per_second  # None for no limit
+        self.start: float = time.monotonic()
+        self.total: int = 0
+
+    def consume(self, count: int):
+        if self.bytes_per_second is None:
+            return
+        self.total += count
+        ahead = self.total / self.bytes_per_second - (time.monotonic() - self.start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+class SnapshotInfo(NamedTuple):
+    id: str
+    created: float
+    files: int  # Number of files in the snapshot
+    size: int  # Total size of the files in the snapshot
+    new_bytes: int  # Bytes of new chunks the snapshot added to the store
+    read_bytes: int  # Bytes read from files that changed since the previous snapshot
+    seconds: float  # How long the snapshot took
+
+    def get_data(self) -> dict:
+        return self._asdict()
+
+
+class BackupStore:
+    """Content-addressed store of snapshots of server folders.
+
+    Each file is stored as a list of chunks, named by the SHA-256 of their contents and shared between every snapshot
+    (of any server) that has them, so each distinct chunk is only stored once. Files whose size and modification time
+    match the previous snapshot aren't read at all, so snapshots of an unchanged world only cost a walk of the folder.
+
+    Layout of the store folder:
+        chunks/ab/abcdef...  zlib-compressed chunk contents
+        snapshots/<server key>/<snapshot id>.json  The files in a snapshot and their chunks
+    """
+
+    def __init__(self, folder: str):
+        self.folder: str = folder
+
+    @staticmethod
+    def get_key(folder_path: str) -> str:
+        return hashlib.sha256(folder_path.encode()).hexdigest()[:16]
+
+    def snapshot(self, folder_path: str, exclude: list[str], throttle: Throttle) -> SnapshotInfo:
+        """Take a snapshot of a folder.
+
+        Args:
+            folder_path: Folder to take a snapshot of.
+            exclude: Names of files and folders directly in folder_path to leave out, such as "logs".
+            throttle: Limits how fast files are read.
+
+        Returns:
+            Information about the new snapshot.
+        """
+        start = time.monotonic()
+        previous = self._load_latest(folder_path)
+        previous_files = previous["files"] if previous is not None else {}
+        files = {}
+        skipped = []  # Files that couldn't be read, so a restore knows to leave them alone
+        new_bytes = 0
+        read_bytes = 0
+        for path, rel_path in self._walk(folder_path, exclude):
+            try:
+                stat = os.stat(path)
+                old = previous_files.get(rel_path)
+                if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+                    files[rel_path] = old
+                    continue
+                chunks = []
+                size = 0
+                with open(path, "rb") as f:
+                    while True:
+                        data = f.read(CHUNK_SIZE)
+                        if len(data) == 0:
+                            break
+                        throttle.consume(len(data))
+                        chunk_hash, added = self._put_chunk(data)
+                        chunks.append(chunk_hash)
+                        new_bytes += added
+                        size += len(data)
+                read_bytes += size
+                files[rel_path] = {"size": size, "mtime_ns": stat.st_mtime_ns, "chunks": chunks}
+            except OSError:
+                # Such as session.lock, which a running server keeps locked on Windows
+                logging.warning(f"Failed to back up {path}, skipping it")
+                skipped.append(rel_path)
+
+        created = time.time()
+        snapshot_id = (time.strftime("%Y%m%d-%H%M%S", time.localtime(created)) + f"{created % 1:.3f}"[1:] + "-" +
+                       secrets.token_hex(2))
+        info = SnapshotInfo(snapshot_id, created, len(files), sum(file["size"] for file in files.values()), new_bytes,
+                            read_bytes, round(time.monotonic() - start, 3))
+        self._write_json(self._snapshot_path(folder_path, snapshot_id),
+                         {"folder_path": folder_path, "info": info.get_data(), "files": files, "skipped": skipped})
+        return info
+
+    def list_snapshots(self, folder_path: str) -> list[SnapshotInfo]:
+        """Get a folder's snapshots, newest first."""
+        snapshots = []
+        for snapshot_id in self._snapshot_ids(folder_path):
+            manifest = self._load(folder_path, snapshot_id)
+            if manifest is not None:
+                snapshots.append(SnapshotInfo(**manifest["info"]))
+        return sorted(snapshots, key=lambda info: info.created, reverse=True)
+
+    def restore(self, folder_path: str, snapshot_id: str, exclude: list[str]) -> bool:
+        """Put a folder back the way it was in a snapshot. The server must not be running.
+
+        Files that already match the snapshot are left alone, and files that aren't in the snapshot are deleted, other
+        than those in exclude and those that couldn't be read when the snapshot was taken.
+
+        Raises:
+            ValueError: If the store is missing some of the snapshot's chunks, or one of them is corrupt.
+
+        Returns:
+            Whether the snapshot was found.
+        """
+        manifest = self._load(folder_path, snapshot_id)
+        if manifest is None:
+            return False
+        files = manifest["files"]
+        skipped = set(manifest.get("skipped", []))
+        missing = [chunk_hash for file in files.values() for chunk_hash in file["chunks"]
+                   if not os.path.exists(self._chunk_path(chunk_hash))]
+        if len(missing) > 0:
+            # Checked up front, so a damaged store can't leave the folder half restored
+            raise ValueError(f"Snapshot {snapshot_id} is missing {len(missing)} chunks")
+        for path, rel_path in list(self._walk(folder_path, exclude)):
+            if rel_path not in files and rel_path not in skipped:
+                os.remove(path)
+        for rel_path, file in files.items():
+            path = os.path.join(folder_path, *rel_path.split("/"))
+            try:
+                stat = os.stat(path)
+                if stat.st_size == file["size"] and stat.st_mtime_ns == file["mtime_ns"]:
+                    continue
+            except OSError:
+                pass  # Doesn't exist anymore
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = path + ".mc_server_web_restore"
+            with open(temp_path, "wb") as f:
+                for chunk_hash in file["chunks"]:
+                    f.write(self._get_chunk(chunk_hash))
+            os.replace(temp_path, path)
+            # Keep the snapshot's modification time, so the next snapshot knows the file hasn't changed since
+            os.utime(path, ns=(file["mtime_ns"], file["mtime_ns"]))
+        return True
+
+    def prune(self, folder_path: str, keep: int) -> int:
+        """Delete all but a folder's newest keep snapshots, then any chunks no snapshot uses anymore. If keep is 0,
+        every snapshot is kept.
+
+        Returns:
+            The number of snapshots deleted.
+        """
+        if keep <= 0:
+            return 0
+        old = self._snapshot_ids(folder_path)[keep:]
+        for snapshot_id in old:
+            os.remove(self._snapshot_path(folder_path, snapshot_id))
+        if len(old) > 0:
+            self._collect_garbage()
+        return len(old)
+
+    def _collect_garbage(self):
+        used = set()
+        snapshots_folder = os.path.join(self.folder, "snapshots")
+        for key in os.listdir(snapshots_folder):
+            for file_name in os.listdir(os.path.join(snapshots_folder, key)):
+                if file_name.endswith(".json"):
+                    with open(os.path.join(snapshots_folder, key, file_name), "r") as f:
+                        for file in json.load(f)["files"].values():
+                            used.update(file["chunks"])
+        chunks_folder = os.path.join(self.folder, "chunks")
+        for prefix in os.listdir(chunks_folder):
+            for chunk_hash in os.listdir(os.path.join(chunks_folder, prefix)):
+                if chunk_hash not in used:
+                    os.remove(os.path.join(chunks_folder, prefix, chunk_hash))
+
+    @staticmethod
+    def _walk(folder_path: str, exclude: list[str]):
+        """Yield the path of every file in a folder, along with its path relative to the folder using / separators."""
+        for root, dirs, file_names in os.walk(folder_path):
+            rel_root = os.path.relpath(root, folder_path).replace(os.sep, "/")
+            if rel_root == ".":
+                rel_root = ""
+                dirs[:] = [name for name in dirs if name not in exclude]
+                file_names = [name for name in file_names if name not in exclude]
+            for file_name in file_names:
+                if file_name.endswith(".mc_server_web_restore"):
+                    continue  # Left over from a restore that didn't finish
+                yield os.path.join(root, file_name), rel_root + "/" + file_name if rel_root else file_name
+
+    def _chunk_path(self, chunk_hash: str) -> str:
+        return os.path.join(self.folder, "chunks", chunk_hash[:2], chunk_hash)
+
+    def _put_chunk(self, data: bytes) -> tuple[str, int]:
+        """Store a chunk if it isn't already stored.
+
+        Returns:
+            The chunk's hash, and the number of bytes added to the store.
+        """
+        chunk_hash = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(chunk_hash)
+        if os.path.exists(path):
+            return chunk_hash, 0
+        compressed = zlib.compress(data, 1)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(temp_path, path)
+        return chunk_hash, len(compressed)
+
+    def _get_chunk(self, chunk_hash: str) -> bytes:
+        with open(self._chunk_path(chunk_hash), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != chunk_hash:
+            raise ValueError(f"Chunk {chunk_hash} is corrupt")
+        return data
+
+    def _snapshot_path(self, folder_path: str, snapshot_id: str) -> str:
+        return os.path.join(self.folder, "snapshots", self.get_key(folder_path), snapshot_id + ".json")
+
+    def _snapshot_ids(self, folder_path: str) -> list[str]:
+        """Get the IDs of a folder's snapshots, newest first. IDs start with when they were taken, so they sort by age."""
+        try:
+            file_names = os.listdir(os.path.join(self.folder, "snapshots", self.get_key(folder_path)))
+        except OSError:
+            return []
+        return sorted((file_name[:-len(".json")] for file_name in file_names if file_name.endswith(".json")),
+                      reverse=True)
+
+    def _load(self, folder_path: str, snapshot_id: str) -> Union[dict, None]:
+        if snapshot_id not in self._snapshot_ids(folder_path):
+            return None  # Also keeps snapshot_id from being used to read other files
+        try:
+            with open(self._snapshot_path(folder_path, snapshot_id), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logging.exception(f"Failed to read snapshot {snapshot_id}!")
+            return None
+
+    def _load_latest(self, folder_path: str) -> Union[dict, None]:
+        snapshot_ids = self._snapshot_ids(folder_path)
+        return self._load(folder_path, snapshot_ids[0]) if len(snapshot_ids) > 0 else None
+
+    @staticmethod
+    def _write_json(path: str, data: dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
@@ -0,0 +1,122 @@
+import time
+import unicodedata
+from collections import deque
+from threading import Condition, Thread
+from typing import Callable, NamedTuple, TextIO, Union
+
+NOT_RUNNING_MESSAGE = "Server not found or not running!"
+STALLED_MESSAGE = "Server isn't accepting commands!"
+FULL_MESSAGE = "Too many commands are waiting to be sent to the server!"
+
+class Submission(NamedTuple):
+    seqs: list[int]  # Sequence number of each command, in the order they'll be written
+    queued: bool  # Whether the commands have to wait for earlier ones, rather than being written right away
+
+
+class CommandQueue:
+    """Writes commands to a process's stdin on a dedicated thread, so a server that stops reading can't block anyone.
+
+    Commands are numbered in the order they're submitted and written in that order. If stdin stops accepting input
+    (such as a busy server letting the pipe fill up), the write in progress blocks only the writer thread. Once it's
+    been blocked for write_timeout seconds, the queue counts as stalled and turns new commands away, as it does once
+    max_pending commands are waiting.
+    """
+
+    def __init__(self, stdin: TextIO, max_pending: int, write_timeout: float, on_written: Callable[[int, bool], None],
+                 name: str):
+        self.stdin: TextIO = stdin
+        self.max_pending: int = max_pending
+        self.write_timeout: float = write_timeout
+        self.pending: deque[tuple[int, str]] = deque()
+        self.condition: Condition = Condition()
+        self.last_seq: int = 0
+        self.writing_since: Union[float, None] = None  # When the write in progress started, if there is one
+        self.closing: bool = False  # Whether stdin is closed once the pending commands are written
+        self.closed: bool = False
+        self.on_written: Callable[[int, bool], None] = on_written  # Called with each command's seq and whether it worked
+        self.thread: Thread = Thread(target=self._run, name=f"commands-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, commands: list[str]) -> Union[Submission, str]:
+        """Queue commands to be written one after another, without other commands getting in between them.
+
+        Control characters are removed from each command. Either every command is queued, or none are.
+
+        Returns:
+            The queued commands' sequence numbers, or an error message if the commands weren't queued.
+        """
+        commands = ["".join(c for c in command if unicodedata.category(c)[0] != "C") for command in commands]
+        with self.condition:
+            if self.closing or self.closed:
+                return NOT_RUNNING_MESSAGE
+            if self.is_stalled():
+                return STALLED_MESSAGE
+            if len(self.pending) + len(commands) > self.max_pending:
+                return FULL_MESSAGE
+            queued = len(self.pending) > 0 or self.writing_since is not None
+            seqs = []
+            for command in commands:
+                self.last_seq += 1
+                self.pending.append((self.last_seq, command))
+                seqs.append(self.last_seq)
+            self.condition.notify_all()
+        return Submission(seqs, queued)
+
+    def close(self, final_command: Union[str, None] = None):
+        """Close stdin once the pending commands (and final_command, if given) are written.
+
+        final_command is queued even if the queue is full, since it's usually the command that stops the server.
+        """
+        with self.condition:
+            if self.closing or self.closed:
+                return
+            if final_command is not None:
+                self.last_seq += 1
+                self.pending.append((self.last_seq, final_command))
+            self.closing = True
+            self.condition.notify_all()
+
+    def stop(self):
+        """Stop writing commands, such as after the process exited. Pending commands are dropped."""
+        with self.condition:
+            self.closed = True
+            self.pending.clear()
+            self.condition.notify_all()
+
+    def is_stalled(self) -> bool:
+        writing_since = self.writing_since
+        return writing_since is not None and time.monotonic() - writing_since > self.write_timeout
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while len(self.pending) == 0 and not self.closing and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                if len(self.pending) == 0:
+                    break  # Closing, and everything has been written
+                seq, command = self.pending.popleft()
+                self.writing_since = time.monotonic()
+            try:
+                self.stdin.write(command + "\n")
+                self.stdin.flush()
+                ok = True
+            except (OSError, ValueError):
+                ok = False  # stdin was closed as the server stopped
+            with self.condition:
+                self.writing_since = None
+            self.on_written(seq, ok)
+            if not ok:
+                with self.condition:
+                    dropped = [dropped_seq for dropped_seq, _ in self.pending]
+                self.stop()
+                for dropped_seq in dropped:
+                    self.on_written(dropped_seq, False)
+                return
+        try:
+            self.stdin.close()
+        except (OSError, ValueError):
+            pass  # stdin was already closed or the process already exited.
+        with self.condition:
+            self.closed = True
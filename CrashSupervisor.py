@@ -0,0 +1,73 @@
+import logging
+import time
+from collections import deque
+from threading import Lock
+from typing import Union
+
+from Server import Server
+
+
+class CrashSupervisor:
+    """Restarts servers that crash, waiting longer after each crash, and gives up on servers stuck in a crash loop.
+
+    The first crash is restarted after backoff seconds, and each further crash within crash_window seconds doubles the
+    wait, up to max_backoff. Once a server crashes crash_limit times within crash_window seconds, its circuit opens and
+    it isn't restarted again until someone starts it by hand.
+    """
+
+    def __init__(self, backoff: float, max_backoff: float, crash_limit: int, crash_window: float):
+        self.backoff: float = backoff
+        self.max_backoff: float = max_backoff
+        self.crash_limit: int = crash_limit
+        self.crash_window: float = crash_window
+
+        self.crashes: dict[str, deque[float]] = {}  # Key is server name, value is when it recently crashed, oldest first
+        self.restarts: dict[str, float] = {}  # Key is server name, value is when to restart it
+        self.lock: Lock = Lock()
+
+    def on_crash(self, server: Server, now: Union[float, None] = None):
+        """Schedule a restart for a server that just crashed, or open its circuit if it's crashing too often."""
+        now = time.time() if now is None else now
+        with self.lock:
+            crashes = self.crashes.setdefault(server.name, deque())
+            crashes.append(now)
+            while now - crashes[0] > self.crash_window:
+                crashes.popleft()
+            if len(crashes) >= self.crash_limit:
+                self.restarts.pop(server.name, None)
+                server.restart_at = None
+                server.circuit_open = True
+                logging.warning(f"Server {server.name} crashed {len(crashes)} times in {self.crash_window} seconds. "
+                                f"It won't be restarted until it's started by hand.")
+                return
+            delay = min(self.max_backoff, self.backoff * 2 ** (len(crashes) - 1))
+            self.restarts[server.name] = now + delay
+            server.restart_at = now + delay
+        logging.warning(f"Server {server.name} crashed. Restarting it in {delay} seconds.")
+
+    def get_due(self, now: Union[float, None] = None) -> list[str]:
+        """Get the names of the servers whose restart is due, forgetting about those restarts."""
+        now = time.time() if now is None else now
+        with self.lock:
+            due = [name for name, restart_at in self.restarts.items() if restart_at <= now]
+            for name in due:
+                del self.restarts[name]
+            return due
+
+    def cancel(self, server: Server) -> bool:
+        """Cancel a server's pending restart.
+
+        Returns:
+            Whether the server had a pending restart.
+        """
+        with self.lock:
+            server.restart_at = None
+            return self.restarts.pop(server.name, None) is not None
+
+    def reset(self, server: Server):
+        """Forget a server's crashes and close its circuit, such as when it's started by hand."""
+        with self.lock:
+            self.crashes.pop(server.name, None)
+            self.restarts.pop(server.name, None)
+            server.restart_at = None
+            server.circuit_open = False
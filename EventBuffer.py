@@ -0,0 +1,60 @@
+from collections import deque
+from threading import Condition
+from typing import Any, NamedTuple
+
+
+class Event(NamedTuple):
+    seq: int
+    type: str
+    data: Any
+
+
+class EventBuffer:
+    """Bounded buffer of events that any number of readers can follow.
+
+    Events are written once and read by every follower, each keeping track of the sequence number of the last event
+    it has seen. Readers block on a condition variable while waiting, so an idle follower costs no CPU.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.events: deque[Event] = deque(maxlen=capacity)
+        self.condition: Condition = Condition()
+        self.last_seq: int = 0
+
+    def publish(self, event_type: str, data: Any = None) -> int:
+        """Add an event to the buffer and wake up all waiting readers.
+
+        Args:
+            event_type: Type of the event, such as "log" or "stopped".
+            data: JSON-serializable payload of the event.
+
+        Returns:
+            The sequence number of the new event.
+        """
+        with self.condition:
+            self.last_seq += 1
+            self.events.append(Event(self.last_seq, event_type, data))
+            self.condition.notify_all()
+            return self.last_seq
+
+    def can_resume(self, seq: int) -> bool:
+        """Whether every event newer than seq is still buffered, so a reader that last saw seq has missed nothing."""
+        with self.condition:
+            if seq > self.last_seq:
+                return False
+            return seq == self.last_seq or self.events[0].seq <= seq + 1
+
+    def wait_since(self, seq: int, timeout: float) -> list[Event]:
+        """Wait up to timeout seconds for events newer than seq.
+
+        Returns:
+            All buffered events newer than seq, or an empty list if none arrived before the timeout.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.last_seq > seq, timeout)
+            return self._since(seq)
+
+    def _since(self, seq: int) -> list[Event]:
+        if seq >= self.last_seq:
+            return []
+        return [event for event in self.events if event.seq > seq]
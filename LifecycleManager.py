@@ -0,0 +1,74 @@
+import datetime
+import time
+from typing import Mapping, Union
+
+from Server import Server
+
+# Scheduled starts and stops more than this many minutes in the past are skipped rather than caught up on, such as
+# after MC Server Web was down for a while.
+MAX_CATCH_UP_MINUTES = 5
+
+
+class LifecycleManager:
+    """Decides which servers to start and stop according to their lifecycle policies.
+
+    Servers with an idle timeout are stopped once nobody has been online for that long. Scheduled starts, stops and
+    backups happen once per matching minute, even if check() runs more than once in that minute or misses it by a little.
+    """
+
+    def __init__(self):
+        self.idle_since: dict[str, float] = {}  # Key is server name, value is when it was last seen with players
+        self.last_minute: Union[datetime.datetime, None] = None  # The last minute schedules were checked for
+
+    def check(self, servers: Mapping[str, Server], running: Mapping[str, Server],
+              now: Union[float, None] = None) -> tuple[list[Server], list[Server], list[Server]]:
+        """Check every server's policy.
+
+        Args:
+            servers: Every server, keyed by name.
+            running: The running servers, keyed by name.
+            now: Current time, defaulting to time.time().
+
+        Returns:
+            The servers to start, the servers to stop and the servers to back up.
+        """
+        now = time.time() if now is None else now
+        to_start: list[Server] = []
+        to_stop: list[Server] = []
+        to_back_up: list[Server] = []
+
+        for name in set(self.idle_since.keys()) - set(running.keys()):
+            del self.idle_since[name]
+        for name, server in running.items():
+            idle_timeout = server.metadata.policy.idle_timeout
+            if idle_timeout is None or server.stop_job_id is not None:
+                continue
+            if server.get_player_count() > 0:
+                self.idle_since[name] = now
+                continue
+            # A server that just started counts as idle from when it started
+            idle_since = self.idle_since.setdefault(name, now)
+            if now - idle_since >= idle_timeout:
+                to_stop.append(server)
+                del self.idle_since[name]
+
+        minute = datetime.datetime.fromtimestamp(now).replace(second=0, microsecond=0)
+        if self.last_minute is None or minute <= self.last_minute:
+            minutes = [minute] if self.last_minute is None else []
+        else:
+            first = max(self.last_minute + datetime.timedelta(minutes=1),
+                        minute - datetime.timedelta(minutes=MAX_CATCH_UP_MINUTES - 1))
+            count = int((minute - first).total_seconds() // 60) + 1
+            minutes = [first + datetime.timedelta(minutes=i) for i in range(count)]
+        self.last_minute = minute
+        for name, server in servers.items():
+            policy = server.metadata.policy
+            if any(schedule.matches(m) for schedule in policy.stops for m in minutes):
+                if name in running and running[name] not in to_stop:
+                    to_stop.append(running[name])
+            elif any(schedule.matches(m) for schedule in policy.starts for m in minutes):
+                if name not in running:
+                    to_start.append(server)
+            if any(schedule.matches(m) for schedule in policy.backups for m in minutes):
+                to_back_up.append(running.get(name, server))
+        return to_start, to_stop, to_back_up
@@ -0,0 +1,120 @@
+import datetime
+import logging
+from typing import NamedTuple, Union
+
+POLICY_FILE_NAME = "mc_server_web_lifecycle.txt"
+# Lowest and highest value of each cron field: minute, hour, day of month, month and day of week (0 is Sunday)
+FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def parse_field(field: str, low: int, high: int) -> frozenset[int]:
+    """Parse one field of a cron expression, such as "*", "5", "1-5", "*/15" or "0,30"."""
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid step in {field}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"{field} is out of range")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """A cron-style schedule of minute, hour, day of month, month and day of week. For example, "0 18 * * 5" is 6 PM
+    every Friday."""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected 5 fields in {expression}")
+        self.expression: str = expression
+        self.minutes, self.hours, self.days, self.months, days_of_week = (
+            parse_field(field, low, high) for field, (low, high) in zip(fields, FIELD_RANGES))
+        self.days_of_week: frozenset[int] = frozenset(day % 7 for day in days_of_week)  # 7 is also Sunday
+        # Like cron, if both the day of month and day of week are restricted, a day matching either is enough.
+        self.either_day: bool = fields[2] != "*" and fields[4] != "*"
+
+    def matches(self, when: datetime.datetime) -> bool:
+        if when.minute not in self.minutes or when.hour not in self.hours or when.month not in self.months:
+            return False
+        day_matches = when.day in self.days
+        day_of_week_matches = (when.weekday() + 1) % 7 in self.days_of_week
+        if self.either_day:
+            return day_matches or day_of_week_matches
+        return day_matches and day_of_week_matches
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CronSchedule) and self.expression == other.expression
+
+    def __repr__(self) -> str:
+        return f"CronSchedule({self.expression!r})"
+
+
+class LifecyclePolicy(NamedTuple):
+    idle_timeout: Union[float, None]  # Seconds a server can go without players before it's stopped, if it should be
+    starts: tuple[CronSchedule, ...]  # When to start the server
+    stops: tuple[CronSchedule, ...]  # When to stop the server
+    backups: tuple[CronSchedule, ...]  # When to back up the server
+
+
+NO_POLICY = LifecyclePolicy(None, (), (), ())
+
+
+def load_policy(path: str) -> LifecyclePolicy:
+    """Load a server's lifecycle policy.
+
+    The file has one setting per line. Lines starting with # are ignored. For example:
+
+        idle_timeout=30
+        start=0 18 * * 5
+        stop=0 2 * * *
+        backup=30 4 * * *
+
+    idle_timeout is in minutes. There can be any number of start, stop and backup lines.
+
+    Args:
+        path: Path to the policy file. It's okay if the file does not exist.
+
+    Returns:
+        The policy, or NO_POLICY if the file wasn't found.
+    """
+    try:
+        with open(path, "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return NO_POLICY
+    idle_timeout = None
+    starts = []
+    stops = []
+    backups = []
+    for line in lines:
+        line = line.strip()
+        if len(line) == 0 or line.startswith("#"):
+            continue
+        try:
+            key, value = (part.strip() for part in line.split("=", 1))
+            if key == "idle_timeout":
+                idle_timeout = float(value) * 60
+            elif key == "start":
+                starts.append(CronSchedule(value))
+            elif key == "stop":
+                stops.append(CronSchedule(value))
+            elif key == "backup":
+                backups.append(CronSchedule(value))
+            else:
+                raise ValueError(f"Unknown setting {key}")
+        except ValueError:
+            logging.warning(f"Ignoring invalid line \"{line}\" in {path}")
+    return LifecyclePolicy(idle_timeout, tuple(starts), tuple(stops), tuple(backups))
@@ -0,0 +1,421 @@
+import datetime
+import gzip
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+from threading import Lock
+from typing import BinaryIO, Iterable, NamedTuple, Union
+
+from Server import Server
+
+# Upper bound on how many bytes of log (after decompressing rotated logs) are indexed for one server in a single indexing
+# run, so a server with years of rotated logs doesn't hold up indexing the others. Whatever's left is picked up by the
+# next run.
+MAX_INGEST_BYTES = 16 * 1024 * 1024
+# Added to the file_key of a rotated log that's only partly indexed, since it ran out of budget
+PARTIAL_SUFFIX = "#partial"
+INSERT_BATCH_LINES = 5000
+MAX_RESULTS = 200
+# Matches Vanilla/Forge ("[12:34:56] [Server thread/INFO]") and Bukkit/Paper ("[12:34:56 INFO]") log line prefixes
+LINE_REGEX = re.compile(r"^\[(\d{2}):(\d{2}):(\d{2})(?: (\w+))?\](?: \[[^\]]*?/(\w+)\])?")
+ROTATED_LOG_REGEX = re.compile(r"^(\d{4}-\d{2}-\d{2})-\d+\.log\.gz$")
+# Lines that go back in time by more than this are taken to be from the next day
+ROLLOVER_SLACK_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    file_key TEXT,  -- Device and inode of the live log, or modification time and size of a rotated log
+    offset INTEGER NOT NULL DEFAULT 0,  -- Bytes of the file already indexed, after decompressing it if it's rotated
+    last_time REAL,  -- Timestamp of the last indexed line
+    head_hash TEXT  -- Hash of the file's first line, used to recognize the live log once it's rotated
+);
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL,
+    time REAL NOT NULL,
+    level TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lines_time ON lines (time, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5(text, content='lines', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS lines_insert AFTER INSERT ON lines BEGIN
+    INSERT INTO lines_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS lines_delete AFTER DELETE ON lines BEGIN
+    INSERT INTO lines_fts (lines_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+class LogLine(NamedTuple):
+    id: int
+    time: float
+    level: Union[str, None]
+    text: str
+    file: str
+
+    def get_data(self) -> dict:
+        return {"time": self.time, "level": self.level, "text": self.text, "file": self.file}
+
+
+class FileState(NamedTuple):
+    id: int
+    file_key: Union[str, None]
+    offset: int
+    last_time: Union[float, None]
+    head_hash: Union[str, None]
+
+
+def to_fts_query(query: str) -> str:
+    """Turn what a user typed into an FTS5 query matching lines with every word, where a trailing * matches prefixes."""
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*") if prefix else word
+        terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def parse_lines(raw_lines: Iterable[bytes], day: datetime.date, last_time: Union[float, None],
+                level: Union[str, None] = None) -> tuple[list[tuple[float, Union[str, None], str]], Union[float, None]]:
+    """Give log lines timestamps and levels.
+
+    Log lines only carry the time of day, so the date comes from day and is moved forward whenever the time of day goes
+    backwards. Lines without a timestamp (such as stack traces) take the timestamp and level of the line before them.
+
+    Args:
+        raw_lines: Lines without trailing newlines.
+        day: Date of the first line, unless last_time is set.
+        last_time: Timestamp of the line before raw_lines, if there is one.
+        level: Level of the line before raw_lines, if there is one.
+
+    Returns:
+        The time, level and text of each line, and the timestamp of the last line.
+    """
+    if last_time is not None:
+        day = datetime.date.fromtimestamp(last_time)
+    rows = []
+    for raw_line in raw_lines:
+        text = raw_line.rstrip(b"\r").decode("utf-8", errors="replace")
+        if len(text) == 0:
+            continue
+        match = LINE_REGEX.match(text)
+        if match is not None:
+            hour, minute, second = int(match.group(1)), int(match.group(2)), int(match.group(3))
+            line_time = datetime.datetime.combine(day, datetime.time(hour, minute, second)).timestamp()
+            if last_time is not None and line_time + ROLLOVER_SLACK_SECONDS < last_time:
+                day += datetime.timedelta(days=1)
+                line_time += 24 * 60 * 60
+            last_time = line_time
+            level = match.group(5) or match.group(4)
+        elif last_time is None:
+            last_time = datetime.datetime.combine(day, datetime.time()).timestamp()
+        rows.append((last_time, level, text))
+    return rows, last_time
+
+
+def count_rollovers(raw_lines: list[bytes]) -> int:
+    """Count how many times the time of day goes backwards in raw_lines, in other words, how many midnights they span."""
+    rollovers = 0
+    previous = None
+    for raw_line in raw_lines:
+        match = LINE_REGEX.match(raw_line.decode("utf-8", errors="replace"))
+        if match is None:
+            continue
+        seconds = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + int(match.group(3))
+        if previous is not None and seconds + ROLLOVER_SLACK_SECONDS < previous:
+            rollovers += 1
+        previous = seconds
+    return rollovers
+
+
+def hash_line(line: bytes) -> str:
+    return hashlib.sha256(line).hexdigest()
+
+
+class ServerLogIndex:
+    """Full-text index of one server's logs, kept in its own SQLite database.
+
+    The live log is indexed incrementally from where the last run stopped. Rotated (gzipped) logs are indexed once.
+    When the live log is rotated, the part of it that was already indexed is recognized by its first line and skipped
+    when the rotated copy is indexed.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path: str = db_path
+        self.lock: Lock = Lock()  # Held while writing
+        self.connection: sqlite3.Connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def ingest(self, log_path: str) -> int:
+        """Index new output from the live log at log_path and any rotated logs next to it.
+
+        Returns:
+            How many bytes of log were read.
+        """
+        with self.lock:
+            budget = MAX_INGEST_BYTES
+            log_folder = os.path.dirname(log_path)
+            try:
+                rotated = sorted(f for f in os.listdir(log_folder) if f.endswith(".log.gz"))
+            except OSError:
+                rotated = []
+            for file_name in rotated:
+                if budget <= 0:
+                    break
+                budget -= self._ingest_rotated(os.path.join(log_folder, file_name), budget)
+            if budget > 0:
+                budget -= self._ingest_live(log_path, budget)
+            return MAX_INGEST_BYTES - budget
+
+    def search(self, query: str, start: Union[float, None], end: Union[float, None], levels: Union[list[str], None],
+               before: Union[tuple[float, int], None], limit: int) -> list[LogLine]:
+        """Search the indexed lines, newest first.
+
+        Args:
+            query: Words every line must contain. An empty query matches every line.
+            start: Only include lines at or after this timestamp.
+            end: Only include lines before this timestamp.
+            levels: Only include lines with one of these levels.
+            before: Only include lines older than this (time, id) position, used to get the next page of results.
+            limit: Maximum number of lines to return.
+
+        Returns:
+            The matching lines.
+        """
+        conditions = []
+        params: list = []
+        sql = "SELECT lines.id, lines.time, lines.level, lines.text, files.path FROM lines "
+        if len(query.strip()) > 0:
+            sql += "JOIN lines_fts ON lines_fts.rowid = lines.id "
+            conditions.append("lines_fts MATCH ?")
+            params.append(to_fts_query(query))
+        sql += "JOIN files ON files.id = lines.file_id"
+        if start is not None:
+            conditions.append("lines.time >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("lines.time < ?")
+            params.append(end)
+        if levels is not None:
+            conditions.append(f"lines.level IN ({','.join('?' * len(levels))})")
+            params.extend(levels)
+        if before is not None:
+            conditions.append("(lines.time < ? OR (lines.time = ? AND lines.id < ?))")
+            params.extend([before[0], before[0], before[1]])
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY lines.time DESC, lines.id DESC LIMIT ?"
+        params.append(min(limit, MAX_RESULTS))
+        # Searches get their own connection, so they never wait on indexing
+        connection = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            rows = connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+        return [LogLine(row[0], row[1], row[2], row[3], os.path.basename(row[4])) for row in rows]
+
+    def _get_state(self, path: str) -> FileState:
+        row = self.connection.execute("SELECT id, file_key, offset, last_time, head_hash FROM files WHERE path = ?",
+                                      (path,)).fetchone()
+        if row is None:
+            file_id = self.connection.execute("INSERT INTO files (path) VALUES (?)", (path,)).lastrowid
+            return FileState(file_id, None, 0, None, None)
+        return FileState(*row)
+
+    def _save_state(self, state: FileState):
+        self.connection.execute("UPDATE files SET file_key = ?, offset = ?, last_time = ?, head_hash = ? WHERE id = ?",
+                                (state.file_key, state.offset, state.last_time, state.head_hash, state.id))
+
+    def _insert(self, file_id: int, rows: list[tuple[float, Union[str, None], str]]):
+        self.connection.executemany("INSERT INTO lines (file_id, time, level, text) VALUES (?, ?, ?, ?)",
+                                    ((file_id, time, level, text) for time, level, text in rows))
+
+    def _ingest_live(self, path: str, budget: int) -> int:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 0
+        file_key = f"{stat.st_dev}:{stat.st_ino}"
+        state = self._get_state(path)
+        if state.file_key != file_key or stat.st_size < state.offset:
+            if state.offset > 0:
+                # The live log was rotated. Remember what was indexed of it, so its rotated copy isn't indexed twice.
+                retired = self._get_state(path + "#retired")
+                self._save_state(retired._replace(offset=state.offset, last_time=state.last_time,
+                                                  head_hash=state.head_hash))
+            state = FileState(state.id, file_key, 0, None, None)
+        if stat.st_size == state.offset:
+            self._save_state(state)
+            self.connection.commit()
+            return 0
+        try:
+            with open(path, "rb") as f:
+                f.seek(state.offset)
+                data = f.read(min(stat.st_size - state.offset, budget))
+        except OSError:
+            return 0
+        # Only index complete lines. The rest is read again next time.
+        complete = data[:data.rfind(b"\n") + 1]
+        raw_lines = complete.split(b"\n")[:-1]
+        if len(raw_lines) == 0:
+            return len(data)
+        head_hash = state.head_hash if state.offset > 0 else hash_line(raw_lines[0])
+        last_time = state.last_time
+        day = datetime.date.today()
+        if last_time is None:
+            # Newly seen log. Date its lines so the last one falls on the day the log was last written to.
+            day = datetime.date.fromtimestamp(stat.st_mtime) - datetime.timedelta(days=count_rollovers(raw_lines))
+        rows, last_time = parse_lines(raw_lines, day, last_time)
+        self._insert(state.id, rows)
+        self._save_state(FileState(state.id, file_key, state.offset + len(complete), last_time, head_hash))
+        self.connection.commit()
+        return len(data)
+
+    def _ingest_rotated(self, path: str, budget: int) -> int:
+        """Index a rotated log, stopping once about budget bytes of it were read. The next call carries on from there.
+
+        Returns:
+            How many bytes of the log were read, after decompressing it.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 0
+        file_key = f"{stat.st_mtime}:{stat.st_size}"
+        state = self._get_state(path)
+        if state.file_key == file_key:
+            return 0
+        match = ROTATED_LOG_REGEX.match(os.path.basename(path))
+        day = datetime.date.fromisoformat(match.group(1)) if match else datetime.date.fromtimestamp(stat.st_mtime)
+        last_time = None
+        read = 0
+        try:
+            with gzip.open(path, "rb") as f:
+                if state.file_key == file_key + PARTIAL_SUFFIX:
+                    # Carry on from where the last run ran out of budget. Seeking does mean decompressing everything
+                    # before this point again, but it isn't indexed again, so it isn't charged to the budget.
+                    f.seek(state.offset)
+                    read, last_time, finished = self._ingest_stream(f, state.id, day, state.last_time, budget)
+                    self._save_state(FileState(state.id, file_key if finished else file_key + PARTIAL_SUFFIX,
+                                               f.tell(), last_time, None))
+                    self.connection.commit()
+                    return read
+                # Rotated logs shouldn't change, but if this one did, start it over
+                self.connection.execute("DELETE FROM lines WHERE file_id = ?", (state.id,))
+                first_line = f.readline()
+                # If this is a live log we already indexed some of (whether or not we've noticed it was rotated yet),
+                # only index what we hadn't got to.
+                indexed = self.connection.execute("SELECT id, path, offset, last_time FROM files WHERE head_hash = ? "
+                                                  "AND path NOT LIKE '%.gz'",
+                                                  (hash_line(first_line.rstrip(b"\n")),)).fetchone()
+                if indexed is not None:
+                    f.seek(indexed[2])
+                    last_time = indexed[3]
+                    if indexed[1].endswith("#retired"):
+                        self.connection.execute("DELETE FROM files WHERE id = ?", (indexed[0],))
+                    else:
+                        self._save_state(FileState(indexed[0], None, 0, None, None))
+                else:
+                    f.seek(0)
+                read, last_time, finished = self._ingest_stream(f, state.id, day, last_time, budget)
+                self._save_state(FileState(state.id, file_key if finished else file_key + PARTIAL_SUFFIX, f.tell(),
+                                           last_time, None))
+        except (OSError, EOFError):
+            logging.exception(f"Failed to index rotated log {path}!")
+            self.connection.rollback()
+            # Don't try again until the file changes, since a corrupt log isn't going to fix itself.
+            self._save_state(FileState(state.id, file_key, 0, None, None))
+        self.connection.commit()
+        return read
+
+    def _ingest_stream(self, f: BinaryIO, file_id: int, day: datetime.date, last_time: Union[float, None],
+                       budget: int) -> tuple[int, Union[float, None], bool]:
+        """Index lines from f until it ends or budget bytes of it have been read, whichever comes first.
+
+        Returns:
+            How many bytes were read, the timestamp of the last line, and whether the end of f was reached.
+        """
+        level = None
+        batch = []
+        read = 0
+        finished = True
+        while True:
+            if read >= budget:
+                finished = False
+                break
+            raw_line = f.readline()
+            if len(raw_line) == 0:
+                break
+            read += len(raw_line)
+            batch.append(raw_line.rstrip(b"\n"))
+            if len(batch) >= INSERT_BATCH_LINES:
+                rows, last_time = parse_lines(batch, day, last_time, level)
+                if len(rows) > 0:
+                    level = rows[-1][1]
+                self._insert(file_id, rows)
+                batch = []
+        rows, last_time = parse_lines(batch, day, last_time, level)
+        self._insert(file_id, rows)
+        return read, last_time, finished
+
+
+class LogIndexer:
+    """Keeps a ServerLogIndex for every server, each in its own database in folder."""
+
+    def __init__(self, folder: str):
+        self.folder: str = folder
+        self.indexes: dict[str, ServerLogIndex] = {}  # Key is server folder path
+        self.lock: Lock = Lock()
+        self.available: bool = True  # False if this Python's SQLite doesn't support full-text search
+
+    def get_index(self, server: Server) -> Union[ServerLogIndex, None]:
+        """Get the index of a server's logs, creating it if needed.
+
+        Returns:
+            The index, or None if log indexing is unavailable.
+        """
+        if not self.available:
+            return None
+        with self.lock:
+            index = self.indexes.get(server.folder_path)
+            if index is None:
+                os.makedirs(self.folder, exist_ok=True)
+                db_name = hashlib.sha256(server.folder_path.encode()).hexdigest()[:16] + ".sqlite3"
+                try:
+                    index = self.indexes[server.folder_path] = ServerLogIndex(os.path.join(self.folder, db_name))
+                except sqlite3.OperationalError:
+                    logging.exception("Failed to create log index! Log search will be unavailable.")
+                    self.available = False
+                    return None
+            return index
+
+    def index(self, servers: Iterable[Server]):
+        """Index new log output of every server."""
+        for server in servers:
+            log_path = server.metadata.log_path
+            if log_path is None or not os.path.isdir(os.path.dirname(log_path)):
+                continue  # Such as a server that has never been started, so has no logs folder yet
+            index = self.get_index(server)
+            if index is None:
+                return
+            try:
+                index.ingest(log_path)
+            except sqlite3.Error:
+                logging.exception(f"Failed to index logs of server {server.name}!")
+
+    def close(self):
+        with self.lock:
+            for index in self.indexes.values():
+                index.close()
+            self.indexes.clear()
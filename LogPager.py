@@ -0,0 +1,177 @@
+import os
+from bisect import bisect_right
+from threading import Lock
+from typing import NamedTuple, Union
+
+# A checkpoint (the byte offset of a line) is kept every this many lines, so a line number can be turned into an offset
+# (and the other way around) by reading at most this many lines.
+LINES_PER_CHECKPOINT = 1000
+READ_BLOCK_BYTES = 64 * 1024
+# Upper bound on how much is read for a single page, in case of absurdly long lines
+MAX_PAGE_BYTES = 4 * 1024 * 1024
+MAX_PAGE_LINES = 500
+# Upper bound on how much of the log is scanned for checkpoints in a single call to update_index()
+MAX_INDEX_BYTES = 4 * 1024 * 1024
+
+
+class LogPage(NamedTuple):
+    lines: list[str]
+    start: int  # Offset of the first line
+    end: int  # Offset just past the last line
+    size: int  # Size of the log file when the page was read
+    file_id: str  # Identifies the log file, so cursors into a rotated log can be told apart
+    first_line_number: Union[int, None]  # Line number (starting at 0) of the first line, if the index has got that far
+
+    def get_data(self) -> dict:
+        return {"lines": self.lines, "start": self.start, "end": self.end, "size": self.size, "file_id": self.file_id,
+                "first_line_number": self.first_line_number}
+
+
+class LogPager:
+    """Reads pages of lines from anywhere in a server's log file, for scrolling back through it.
+
+    Pages are read with seeks from a byte offset, so reading a page costs the same no matter how big the log is, and
+    nothing more than a page is ever held in memory. A sparse index of line offsets, one for every LINES_PER_CHECKPOINT
+    lines, is built up in the background, so pages can be given line numbers and read starting from a line number.
+    """
+
+    def __init__(self):
+        self.lock: Lock = Lock()
+        self.file_id: Union[str, None] = None
+        self.checkpoints: list[int] = [0]  # checkpoints[i] is the offset of line i * LINES_PER_CHECKPOINT
+        self.indexed_offset: int = 0  # Everything before this offset has been scanned for checkpoints
+        self.indexed_lines: int = 0  # Number of lines that end before indexed_offset
+
+    def update_index(self, path: Union[str, None]):
+        """Scan up to MAX_INDEX_BYTES more of the log for checkpoints."""
+        if path is None:
+            return
+        with self.lock:
+            try:
+                with open(path, "rb") as f:
+                    stat = os.fstat(f.fileno())
+                    self._check_file(stat)
+                    f.seek(self.indexed_offset)
+                    remaining = min(stat.st_size - self.indexed_offset, MAX_INDEX_BYTES)
+                    while remaining > 0:
+                        data = f.read(min(READ_BLOCK_BYTES, remaining))
+                        if len(data) == 0:
+                            break
+                        self._scan(data)
+                        remaining -= len(data)
+            except OSError:
+                return
+
+    def read(self, path: Union[str, None], cursor: Union[int, None], line: Union[int, None], count: int,
+             backward: bool, file_id: Union[str, None] = None) -> Union[LogPage, None]:
+        """Read a page of lines from the log.
+
+        Args:
+            path: Path of the log file.
+            cursor: Offset to read from. Reading backward, this is where the page ends; None means the end of the log.
+                Reading forward, this is where the page starts; None means the start of the log.
+            line: Line number to read from instead of cursor, once the index has got that far.
+            count: Maximum number of lines to read.
+            backward: Whether to read the lines before cursor, rather than the lines from cursor onwards.
+            file_id: The file_id of the page cursor came from, if any.
+
+        Returns:
+            The page, or None if there's no log, or the log was rotated or truncated since the page cursor came from.
+        """
+        if path is None:
+            return None
+        count = max(1, min(count, MAX_PAGE_LINES))
+        with self.lock:
+            try:
+                with open(path, "rb") as f:
+                    stat = os.fstat(f.fileno())
+                    self._check_file(stat)
+                    if file_id is not None and file_id != self.file_id:
+                        return None
+                    if line is not None:
+                        cursor = self._offset_of_line(f, line)
+                    if backward:
+                        lines, start, end = self._read_backward(f, stat.st_size, cursor, count)
+                    else:
+                        lines, start, end = self._read_forward(f, stat.st_size, cursor, count)
+                    first_line_number = self._line_number(f, start)
+            except OSError:
+                return None
+        return LogPage([line.rstrip(b"\r").decode("utf-8", errors="replace") for line in lines], start, end,
+                       stat.st_size, self.file_id, first_line_number)
+
+    def _check_file(self, stat: os.stat_result):
+        """Start the index over if the log file was replaced or truncated."""
+        file_id = f"{stat.st_dev}-{stat.st_ino}"
+        if file_id != self.file_id or stat.st_size < self.indexed_offset:
+            self.file_id = file_id
+            self.checkpoints = [0]
+            self.indexed_offset = 0
+            self.indexed_lines = 0
+
+    def _scan(self, data: bytes):
+        position = 0
+        while True:
+            lines_to_checkpoint = len(self.checkpoints) * LINES_PER_CHECKPOINT - self.indexed_lines
+            newlines = data.count(b"\n", position)
+            if newlines < lines_to_checkpoint:
+                self.indexed_lines += newlines
+                break
+            for _ in range(lines_to_checkpoint):
+                position = data.index(b"\n", position) + 1
+            self.indexed_lines += lines_to_checkpoint
+            self.checkpoints.append(self.indexed_offset + position)
+        self.indexed_offset += len(data)
+
+    def _line_number(self, f, offset: int) -> Union[int, None]:
+        if offset > self.indexed_offset:
+            return None
+        i = bisect_right(self.checkpoints, offset) - 1
+        f.seek(self.checkpoints[i])
+        return i * LINES_PER_CHECKPOINT + f.read(offset - self.checkpoints[i]).count(b"\n")
+
+    def _offset_of_line(self, f, line: int) -> Union[int, None]:
+        i = line // LINES_PER_CHECKPOINT
+        if i >= len(self.checkpoints):
+            return None  # Not indexed that far yet, so read from the end or start instead
+        offset = self.checkpoints[i]
+        f.seek(offset)
+        for _ in range(line % LINES_PER_CHECKPOINT):
+            read = f.readline()
+            if not read.endswith(b"\n"):
+                break
+            offset += len(read)
+        return offset
+
+    @staticmethod
+    def _read_backward(f, size: int, cursor: Union[int, None], count: int) -> tuple[list[bytes], int, int]:
+        end = size if cursor is None else max(0, min(cursor, size))
+        position = end
+        data = b""
+        while position > 0 and data.count(b"\n") <= count and end - position < MAX_PAGE_BYTES:
+            block = min(READ_BLOCK_BYTES, position)
+            position -= block
+            f.seek(position)
+            data = f.read(block) + data
+        if cursor is None and not data.endswith(b"\n"):
+            # Leave out the last line if it's still being written
+            end -= len(data) - (data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+        lines = data.split(b"\n")[:-1]
+        if position > 0:
+            lines = lines[1:]  # Only part of the first line was read
+        lines = lines[-count:]
+        return lines, end - sum(len(line) + 1 for line in lines), end
+
+    @staticmethod
+    def _read_forward(f, size: int, cursor: Union[int, None], count: int) -> tuple[list[bytes], int, int]:
+        start = 0 if cursor is None else max(0, min(cursor, size))
+        f.seek(start)
+        data = b""
+        while data.count(b"\n") < count and len(data) < MAX_PAGE_BYTES:
+            block = f.read(READ_BLOCK_BYTES)
+            if len(block) == 0:
+                break
+            data += block
+        lines = data.split(b"\n")[:-1][:count]  # Leave out the last line if it's incomplete
+        return lines, start, start + sum(len(line) + 1 for line in lines)
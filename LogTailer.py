@@ -0,0 +1,105 @@
+import os
+from collections import deque
+from threading import Lock
+from typing import Union
+
+# When attaching to a log file we haven't seen before, only this many bytes from the end are read.
+# This keeps attaching to a huge log (or one that was rotated while we weren't looking) cheap.
+TAIL_BYTES = 64 * 1024
+# Upper bound on how much new output is read in a single poll.
+MAX_READ_BYTES = 4 * 1024 * 1024
+
+
+class LogTailer:
+    """Follows a server's log file, only reading bytes appended since the last poll.
+
+    The most recent lines are kept in a bounded ring buffer. The tailer remembers the identity (device and inode) of
+    the file it last read, so a log that is replaced (such as latest.log being rotated on restart or at midnight) or
+    truncated is detected and attached to again like a new file, reading only its last TAIL_BYTES.
+    """
+
+    def __init__(self, max_lines: int):
+        self.lines: deque[str] = deque(maxlen=max_lines)
+        self.lock: Lock = Lock()
+
+        self.path: Union[str, None] = None
+        self.file_id: Union[tuple[int, int], None] = None
+        self.offset: int = 0
+        self.partial: bytes = b""
+        self.skip_first_line: bool = False
+
+    def reset(self):
+        """Forget the followed file and all buffered lines."""
+        with self.lock:
+            self.lines.clear()
+            self._detach()
+
+    def poll(self, path: Union[str, None]) -> list[str]:
+        """Read any newly appended output from the log file.
+
+        Args:
+            path: Path of the log file to follow, or None if there's no log to follow.
+
+        Returns:
+            The complete lines read during this poll, without trailing newlines.
+        """
+        with self.lock:
+            if path is None:
+                return []
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return []
+            file_id = (stat.st_dev, stat.st_ino)
+            if path != self.path or file_id != self.file_id or stat.st_size < self.offset:
+                # New file, rotated file, or truncated file. Start over, but only look at its tail.
+                self._detach()
+                self.path = path
+                self.file_id = file_id
+                self.offset = max(0, stat.st_size - TAIL_BYTES)
+                self.skip_first_line = self.offset > 0
+            if stat.st_size == self.offset:
+                return []
+
+            start = max(self.offset, stat.st_size - MAX_READ_BYTES)
+            if start != self.offset:
+                # Too far behind. Drop what we missed rather than reading all of it.
+                self.partial = b""
+                self.skip_first_line = True
+            try:
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    data = f.read(stat.st_size - start)
+            except OSError:
+                return []
+            self.offset = start + len(data)
+
+            data = self.partial + data
+            raw_lines = data.split(b"\n")
+            self.partial = raw_lines.pop()
+            if self.skip_first_line:
+                # We started reading in the middle of a line, so throw that line away.
+                if len(raw_lines) > 0:
+                    raw_lines.pop(0)
+                    self.skip_first_line = False
+                else:
+                    self.partial = b""
+            new_lines = [line.rstrip(b"\r").decode("utf-8", errors="replace") for line in raw_lines]
+            self.lines.extend(new_lines)
+            return new_lines
+
+    def get_lines(self) -> list[str]:
+        with self.lock:
+            return list(self.lines)
+
+    def get_text(self) -> str:
+        """Get the buffered lines as a single string, like they'd appear in the log file."""
+        with self.lock:
+            return "".join(line + "\n" for line in self.lines)
+
+    def _detach(self):
+        self.path = None
+        self.file_id = None
+        self.offset = 0
+        self.partial = b""
+        self.skip_first_line = False
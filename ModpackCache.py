@@ -0,0 +1,73 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Union
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ModpackCache:
+    """Caches the SHA-256 digest of each modpack file.
+
+    Modpacks can be hundreds of MB, so digests are computed on a background thread, once per modpack. A digest is
+    thrown away and computed again when the modpack's modification time or size changes.
+    """
+
+    def __init__(self):
+        # Key is modpack path, value is the (mtime, size) the digest was computed for, and the digest if it's done
+        self.entries: dict[str, tuple[tuple[float, int], Union[bytes, None]]] = {}
+        self.lock: Lock = Lock()
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="modpack-hash")
+
+    def refresh(self, path: str):
+        """Start computing the digest of a modpack, unless it's already known for the modpack's current contents."""
+        key = self._get_key(path)
+        if key is None:
+            return
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == key:
+                return
+            self.entries[path] = (key, None)
+        self.executor.submit(self._hash, path, key)
+
+    def get_digest(self, path: str) -> Union[bytes, None]:
+        """Get the SHA-256 digest of a modpack.
+
+        Returns:
+            The digest, or None if it hasn't been computed yet for the modpack's current contents.
+        """
+        key = self._get_key(path)
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry is None or entry[0] != key:
+            self.refresh(path)
+            return None
+        return entry[1]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _hash(self, path: str, key: tuple[float, int]):
+        digest = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                while chunk := f.read(HASH_CHUNK_SIZE):
+                    digest.update(chunk)
+        except OSError:
+            logging.exception(f"Failed to hash modpack {path}!")
+            return
+        with self.lock:
+            # The modpack may have changed while we were hashing it, in which case a newer hash is already queued.
+            if self.entries.get(path, (None, None))[0] == key:
+                self.entries[path] = (key, digest.digest())
+
+    @staticmethod
+    def _get_key(path: str) -> Union[tuple[float, int], None]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
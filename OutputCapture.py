@@ -0,0 +1,38 @@
+from collections import deque
+from threading import Lock, Thread
+from typing import Callable, TextIO
+
+
+class OutputCapture:
+    """Continuously drains a process's output into a bounded ring buffer of lines.
+
+    Output is read on a dedicated thread for as long as the process runs. Servers hang if nothing reads their output
+    and the pipe fills up, which is why output used to be sent to DEVNULL. Reading it continuously avoids that.
+    """
+
+    def __init__(self, stream: TextIO, max_lines: int, on_line: Callable[[str], None], name: str):
+        self.stream: TextIO = stream
+        self.lines: deque[str] = deque(maxlen=max_lines)
+        self.lock: Lock = Lock()
+        self.on_line: Callable[[str], None] = on_line
+        self.thread: Thread = Thread(target=self._run, name=f"output-{name}", daemon=True)
+        self.thread.start()
+
+    def get_lines(self) -> list[str]:
+        with self.lock:
+            return list(self.lines)
+
+    def get_text(self) -> str:
+        """Get the buffered lines as a single string, like they'd appear in the log file."""
+        with self.lock:
+            return "".join(line + "\n" for line in self.lines)
+
+    def _run(self):
+        try:
+            for line in self.stream:
+                line = line.rstrip("\r\n")
+                with self.lock:
+                    self.lines.append(line)
+                self.on_line(line)
+        except (OSError, ValueError):
+            pass  # The pipe was closed out from under us, which means the process is gone.
@@ -0,0 +1,83 @@
+import time
+from typing import Union
+
+import psutil
+
+from Server import Server
+from StopJob import find_java_child
+
+# Samples taken before looking for a server's Java process again, while only its startup script has been found.
+JAVA_SEARCH_INTERVAL = 3
+
+
+class TrackedProcess:
+    def __init__(self, pid: int):
+        self.pid: int = pid  # PID of the startup script, used to tell when the server was restarted
+        self.process: Union[psutil.Process, None] = None
+        self.is_java: bool = False
+        self.samples_until_search: int = 0
+
+
+class ResourceSampler:
+    """Samples CPU, memory, thread, handle and disk I/O usage of running servers.
+
+    The process to sample (the server's Java process if there is one, otherwise its startup script) is looked up once
+    and cached, so each sample costs one batch of psutil calls per server instead of a walk of the process tree.
+    """
+
+    def __init__(self):
+        self.tracked: dict[str, TrackedProcess] = {}  # Key is server name
+
+    def sample(self, servers: list[Server]):
+        """Take one sample of each server and add it to that server's telemetry."""
+        running_names = set()
+        for server in servers:
+            process = server.process
+            if process is None:
+                continue
+            running_names.add(server.name)
+            tracked = self.tracked.get(server.name)
+            if tracked is None or tracked.pid != process.pid:
+                tracked = self.tracked[server.name] = TrackedProcess(process.pid)
+            sample = self._sample(tracked)
+            if sample is not None:
+                server.add_telemetry(sample)
+        for name in set(self.tracked.keys()) - running_names:
+            del self.tracked[name]
+
+    def _sample(self, tracked: TrackedProcess) -> Union[dict, None]:
+        if not tracked.is_java:
+            if tracked.samples_until_search <= 0:
+                java_child = find_java_child(tracked.pid)
+                if java_child is not None:
+                    tracked.process = java_child
+                    tracked.is_java = True
+                tracked.samples_until_search = JAVA_SEARCH_INTERVAL
+            tracked.samples_until_search -= 1
+            if tracked.process is None:
+                try:
+                    tracked.process = psutil.Process(tracked.pid)
+                except psutil.Error:
+                    return None
+        proc = tracked.process
+        try:
+            with proc.oneshot():
+                sample = {
+                    "time": time.time(),
+                    # The first call for a process always returns 0, which is why the process is cached between samples
+                    "cpu_percent": proc.cpu_percent(None),
+                    "rss": proc.memory_info().rss,
+                    "threads": proc.num_threads(),
+                    "handles": proc.num_handles() if psutil.WINDOWS else proc.num_fds(),
+                }
+                if hasattr(proc, "io_counters"):
+                    io = proc.io_counters()
+                    sample["read_bytes"] = io.read_bytes
+                    sample["write_bytes"] = io.write_bytes
+        except psutil.Error:
+            # The process went away, such as the Java process exiting on restart. Find it again next time.
+            tracked.process = None
+            tracked.is_java = False
+            tracked.samples_until_search = 0
+            return None
+        return sample
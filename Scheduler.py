@@ -0,0 +1,71 @@
+import logging
+import time
+from threading import Event, Lock, Thread
+from typing import Callable, Union
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[], None], interval: float):
+        self.name: str = name
+        self.func: Callable[[], None] = func
+        self.interval: float = interval
+        self.next_run: float = 0
+
+
+class Scheduler:
+    """Runs jobs on a fixed cadence on a single background thread.
+
+    Jobs are run one at a time, so a job never overlaps with itself or with another job. A job that raises is logged
+    and run again at its next interval.
+    """
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.jobs: list[Job] = []
+        self.lock: Lock = Lock()
+        self.stop_event: Event = Event()
+        self.thread: Union[Thread, None] = None
+
+    def add_job(self, name: str, func: Callable[[], None], interval: float):
+        """Add a job to run every interval seconds. The first run happens as soon as possible.
+
+        Args:
+            name: Name of the job, used for logging.
+            func: Function to call.
+            interval: Seconds between the start of each run.
+        """
+        with self.lock:
+            self.jobs.append(Job(name, func, interval))
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stop the scheduler, waiting up to timeout seconds for a running job to finish."""
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            with self.lock:
+                jobs = list(self.jobs)
+            now = time.monotonic()
+            for job in jobs:
+                if job.next_run <= now:
+                    job.next_run = now + job.interval
+                    try:
+                        job.func()
+                    except Exception:
+                        logging.exception(f"Scheduled job {job.name} failed!")
+                    if self.stop_event.is_set():
+                        return
+            with self.lock:
+                next_run = min((job.next_run for job in self.jobs), default=time.monotonic() + 1)
+            self.stop_event.wait(max(0.0, next_run - time.monotonic()))
@@ -1,10 +1,66 @@
 import os
+import re
+import time
+from collections import deque
 from subprocess import Popen
 from threading import Lock
-from typing import Union
+from typing import NamedTuple, Union
+
+import metrics
+from CommandQueue import NOT_RUNNING_MESSAGE, CommandQueue, Submission
+from EventBuffer import EventBuffer
+from LifecyclePolicy import NO_POLICY, LifecyclePolicy
+from LogPager import LogPager
+from LogTailer import LogTailer
+from OutputCapture import OutputCapture
+
+# Matches the log lines for players joining and leaving, such as "[12:34:56] [Server thread/INFO]: Steve joined the game"
+PLAYER_REGEX = re.compile(r"\]: (\w{1,16}) (joined|left) the game$")
+
+
+class ServerState(NamedTuple):
+    """Immutable copy of a server's state, safe to read from any thread without locking."""
+    id: str
+    name: str
+    running: bool
+    stopping: bool
+    log: Union[str, None]
+    has_modpack: bool
+    users: frozenset[str]
+    admins: frozenset[str]
+    telemetry: Union[dict, None]
+    queue_position: Union[int, None]
+    start_error: Union[str, None]
+    status: Union[dict, None]
+    last_crash: Union[dict, None]
+    restart_at: Union[float, None]
+    circuit_open: bool
+
+    def get_data(self, is_admin: bool) -> dict:
+        data = {"id": self.id, "name": self.name, "running": self.running, "stopping": self.stopping,
+                "is_admin": is_admin, "has_modpack": self.has_modpack, "queue_position": self.queue_position,
+                "start_error": self.start_error, "last_crash": self.last_crash, "restart_at": self.restart_at,
+                "circuit_open": self.circuit_open}
+        if self.running:
+            data["log"] = self.log
+            data["telemetry"] = self.telemetry
+            data["status"] = self.status
+        return data
+
+
+class ServerMetadata(NamedTuple):
+    """Files a server is started, stopped and followed with, resolved once by the ServerScanner."""
+    key: tuple  # Modification times the metadata was resolved from. If any of these change, it's resolved again.
+    script_path: Union[str, None]  # Startup script, or None if the server doesn't have one
+    stop_command: str
+    log_path: Union[str, None]
+    status_port: Union[int, None]  # Port to ping for the server's status, or None if it doesn't answer pings
+    policy: LifecyclePolicy  # When to start and stop the server automatically
+
 
 class Server:
-    def __init__(self, id_in: str, folder_path: str, users: list[str], admins: list[str], modpack_path: Union[str, None]):
+    def __init__(self, id_in: str, folder_path: str, users: list[str], admins: list[str], modpack_path: Union[str, None],
+                 max_log_lines: int, telemetry_history: int):
         # Provided by constructor
         self.id: str = id_in
         self.folder_path: str = folder_path
@@ -12,16 +68,55 @@ class Server:
         self.admins: list[str] = admins
         self.modpack_path: Union[str, None] = modpack_path
         self.log = ""
+        self.max_log_lines: int = max_log_lines
 
         # Other initial fields.
         self.process: Union[Popen, None] = None
         self.lock: Lock = Lock()
+        self.log_tailer: LogTailer = LogTailer(max_log_lines)
+        self.log_pager: LogPager = LogPager()  # Reads older parts of the log for scrolling back through it
+        # Replaced wholesale by the ServerScanner whenever the files it was resolved from change
+        self.metadata: ServerMetadata = ServerMetadata((), None, "stop", None, None, NO_POLICY)
+        self.output: Union[OutputCapture, None] = None  # Set while the process's output is being captured
+        self.commands: Union[CommandQueue, None] = None  # Writes commands to the process's stdin while it's running
+        self.telemetry: deque[dict] = deque(maxlen=telemetry_history)  # Resource usage samples, oldest first
+        self.status: Union[dict, None] = None  # Players, MOTD, version and latency from the last ping, if it answered
+        self.log_players: set[str] = set()  # Players online according to the join and leave lines in the log
+        self.queue_position: Union[int, None] = None  # Position in the StartupQueue, starting at 1, if queued
+        self.start_error: Union[str, None] = None  # Why the last attempt to start this server failed, if it did
+        # When the server last crashed, its exit code and the last lines of its log from before it crashed
+        self.last_crash: Union[dict, None] = None
+        self.restart_at: Union[float, None] = None  # When the CrashSupervisor will restart this server, if it will
+        self.circuit_open: bool = False  # Whether the CrashSupervisor gave up restarting this server
+        self.events: EventBuffer = EventBuffer()  # Log lines and state changes, followed by streaming clients
+        self.stop_requested: bool = False  # Whether the current process was asked to stop, rather than crashing
+        self.stop_job_id: Union[str, None] = None  # ID of the StopJob currently stopping this server
         self.name = os.path.split(os.path.split(os.path.normpath(self.folder_path))[0])[1] + " - " + self.id
 
     def set_process(self, process: Union[Popen, None]):
         with self.lock:
             self.process = process
 
+    def on_start(self, process: Popen, commands: CommandQueue):
+        """Track a newly started process for this server.
+
+        If the process's stdout is a pipe, its output is captured and used as this server's log instead of the log file.
+
+        Args:
+            process: The server's process.
+            commands: Queue writing to the process's stdin. Its on_written should be this server's on_command_written.
+        """
+        with self.lock:
+            self.process = process
+            self.commands = commands
+            self.stop_requested = False
+            self.telemetry.clear()
+            self.log_players.clear()
+            if process.stdout is not None:
+                self.output = OutputCapture(process.stdout, self.max_log_lines, lambda line: self.on_log([line]),
+                                            self.id)
+        self.events.publish("started")
+
     def is_running(self):
         return self.process is not None
 
@@ -29,18 +124,125 @@ class Server:
         with self.lock:
             self.log = log
 
-    def on_stop(self):
+    def add_telemetry(self, sample: dict):
+        with self.lock:
+            self.telemetry.append(sample)
+
+    def set_status(self, status: Union[dict, None]):
+        with self.lock:
+            self.status = status
+
+    def get_telemetry(self) -> list[dict]:
         with self.lock:
+            return list(self.telemetry)
+
+    def get_log_lines(self) -> list[str]:
+        output = self.output
+        if output is not None:
+            return output.get_lines()
+        return self.log_tailer.get_lines()
+
+    def poll_log(self):
+        """Read any new output from this server's log file into the log, and index it for scrolling back through.
+
+        The log isn't read if output is being captured, since captured output is added to the log as soon as it's written.
+        """
+        self.log_pager.update_index(self.metadata.log_path)
+        if self.output is not None:
+            return
+        with metrics.timed("log_read_seconds"):
+            new_lines = self.log_tailer.poll(self.metadata.log_path)
+        self.set_log(self.log_tailer.get_text())
+        if len(new_lines) > 0:
+            self.on_log(new_lines)
+
+    def submit_commands(self, commands: list[str]) -> Union[Submission, str]:
+        """Queue commands to be run on the server, in order.
+
+        Returns:
+            The commands' sequence numbers, or an error message if they weren't queued.
+        """
+        queue = self.commands
+        if queue is None:
+            return NOT_RUNNING_MESSAGE
+        return queue.submit(commands)
+
+    def on_command_written(self, seq: int, ok: bool):
+        self.events.publish("command", {"seq": seq, "ok": ok})
+
+    def on_log(self, lines: list[str]):
+        """Handle new lines of log output, keeping track of who's online and passing them on to streaming clients."""
+        for line in lines:
+            match = PLAYER_REGEX.search(line.rstrip())
+            if match is not None:
+                with self.lock:
+                    if match.group(2) == "joined":
+                        self.log_players.add(match.group(1))
+                    else:
+                        self.log_players.discard(match.group(1))
+        self.events.publish("log", lines)
+
+    def get_player_count(self) -> int:
+        """Get how many players are online, from the last ping if the server answered it, or otherwise from the log."""
+        with self.lock:
+            if self.status is not None and isinstance(self.status.get("online"), int):
+                return self.status["online"]
+            return len(self.log_players)
+
+    def on_stop(self) -> bool:
+        """Clean up after the server's process exited.
+
+        Returns:
+            Whether the server crashed, rather than being stopped.
+        """
+        with self.lock:
+            exit_code = self.process.poll() if self.process is not None else None
+            # Exiting with code 0 is treated as a clean stop, such as someone running stop from the in-game console.
+            crashed = not self.stop_requested and exit_code != 0
+        if crashed:
+            self.poll_log()  # Pick up whatever the server wrote right before it crashed
+            last_lines = self.get_log_lines()
+        with self.lock:
+            if crashed:
+                self.last_crash = {"time": time.time(), "exit_code": exit_code, "lines": last_lines}
             self.log = None
             self.process = None
+            self.output = None
+            commands = self.commands
+            self.commands = None
+            self.status = None
+            self.stop_requested = False
+        if commands is not None:
+            commands.stop()
+        self.log_tailer.reset()
+        self.events.publish("crashed" if crashed else "stopped", {"exit_code": exit_code})
+        return crashed
+
+    def inherit(self, old: "Server"):
+        """Carry crash history and the last start error over from the Server this one replaces, after the server's folder
+        was rescanned. Its place in the StartupQueue is handed over by StartupQueue.replace()."""
+        with old.lock:
+            last_crash, restart_at, circuit_open = old.last_crash, old.restart_at, old.circuit_open
+            start_error = old.start_error
+        with self.lock:
+            self.last_crash, self.restart_at, self.circuit_open = last_crash, restart_at, circuit_open
+            self.start_error = start_error
 
     def has_modpack(self):
         return self.modpack_path is not None
 
+    def get_state(self) -> ServerState:
+        with self.lock:
+            log = self.output.get_text() if self.output is not None else self.log
+            return ServerState(id=self.id, name=self.name, running=self.process is not None,
+                               stopping=self.stop_job_id is not None, log=log,
+                               has_modpack=self.has_modpack(), users=frozenset(self.users),
+                               admins=frozenset(self.admins),
+                               telemetry=self.telemetry[-1] if len(self.telemetry) > 0 else None,
+                               queue_position=self.queue_position, start_error=self.start_error,
+                               status=self.status, last_crash=self.last_crash, restart_at=self.restart_at,
+                               circuit_open=self.circuit_open)
+
     def get_data(self, is_admin: bool) -> dict:
-        data = {"id": self.id, "name": self.name, "running": self.is_running(), "is_admin": is_admin,
-                "has_modpack": self.has_modpack()}
-        if self.is_running():
-            data["log"] = self.log
-        return data
+        return self.get_state().get_data(is_admin)
 
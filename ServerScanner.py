@@ -0,0 +1,227 @@
+import os
+import re
+from copy import deepcopy
+from typing import NamedTuple, Tuple, Union
+
+from LifecyclePolicy import POLICY_FILE_NAME, load_policy
+from Server import Server, ServerMetadata
+
+MODPACK_REGEX = re.compile(r"^.+_modpack\..+$")
+STOP_COMMAND_FILE_NAME = "stop_command.txt"
+LOG_LOCATION_FILE_NAME = "log_location.txt"
+PROPERTIES_FILE_NAME = "server.properties"
+DEFAULT_PORT = 25565
+
+
+def get_mtime(path: str) -> Union[float, None]:
+    """Get the modification time of path, or None if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def get_whitelisted_and_admin_users(path: str) -> Tuple[list[str], list[str]]:
+    """Get all whitelisted and admin users in the file.
+
+    Args:
+        path: File path to whitelist file. It's okay if the file does not exist.
+
+    Returns:
+        A list of whitelisted users and admin users in that order, or an empty list if the file wasn't found.
+    """
+    if not os.path.exists(path) or not os.path.isfile(path):
+        return [], []
+    with open(path, "r") as f:
+        lines = f.readlines()
+        if len(lines) == 0:
+            return [], []
+        elif len(lines) == 1:
+            return lines[0].strip().split(","), []
+        else:
+            return lines[0].strip().split(","), lines[1].strip().split(",")
+
+
+def find_modpack_file_path(server_folder: str) -> Union[str, None]:
+    for f in os.listdir(server_folder):
+        if MODPACK_REGEX.match(f):
+            return os.path.join(server_folder, f)
+    return None
+
+
+def resolve_metadata(server_folder: str, script_names: list[str], key: tuple) -> ServerMetadata:
+    """Find the startup script, stop command, log file, status port and lifecycle policy of the server in server_folder.
+
+    Args:
+        server_folder: Folder of the server.
+        script_names: Names of potential startup scripts, in order of preference.
+        key: Modification times to store with the metadata.
+
+    Returns:
+        The server's metadata.
+    """
+    script_path: Union[str, None] = None
+    for script_name in script_names:
+        path = os.path.join(server_folder, script_name)
+        if os.path.isfile(path):
+            script_path = path
+            break
+
+    stop_command = "stop"
+    try:
+        with open(os.path.join(server_folder, STOP_COMMAND_FILE_NAME), "r") as f:
+            stop_command = f.readline().strip()
+    except OSError:
+        pass
+
+    # logs/latest.log is used even if logs/ doesn't exist yet, since servers create it when they first boot.
+    log_path: Union[str, None] = os.path.join(server_folder, "logs", "latest.log")
+    try:
+        with open(os.path.join(server_folder, LOG_LOCATION_FILE_NAME), "r") as f:
+            extra_path = f.readline().strip().split("/")
+            log_path = os.path.join(server_folder, *extra_path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        log_path = None
+    return ServerMetadata(key, script_path, stop_command, log_path, get_status_port(server_folder),
+                          load_policy(os.path.join(server_folder, POLICY_FILE_NAME)))
+
+
+def get_status_port(server_folder: str) -> Union[int, None]:
+    """Get the port a Minecraft server answers status pings on, from its server.properties.
+
+    Returns:
+        The port, or None if the server has no server.properties (so probably isn't a Minecraft server) or has status
+        pings turned off.
+    """
+    properties = {}
+    try:
+        with open(os.path.join(server_folder, PROPERTIES_FILE_NAME), "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if "=" in line and not line.startswith("#"):
+                    name, value = line.split("=", 1)
+                    properties[name.strip()] = value.strip()
+    except OSError:
+        return None
+    if properties.get("enable-status", "true") == "false":
+        return None
+    try:
+        return int(properties.get("server-port", DEFAULT_PORT))
+    except ValueError:
+        return DEFAULT_PORT
+
+
+class FolderEntry(NamedTuple):
+    mtime: Union[float, None]
+    whitelist_mtime: Union[float, None]
+    whitelisted_users: list[str]
+    admin_users: list[str]
+    server_folders: list[str]
+
+
+class ServerEntry(NamedTuple):
+    # Anything that affects the Server built from a folder. If any of these change, the Server is rebuilt.
+    key: tuple
+    server: Server
+
+
+class ServerScanner:
+    """Discovers servers in the server folders, only re-reading what changed since the last scan.
+
+    A folder is only listed again when its modification time changes, which happens when entries are added to or
+    removed from it. Whitelist files are only read again when their own modification time changes. Servers whose
+    folder, whitelist and parent folder whitelist are all unchanged keep their existing Server instance.
+
+    Each server's metadata (startup script, stop command, log file, status port and lifecycle policy) is resolved here
+    too, and only resolved again when the server folder or one of the files it came from changes, so starting,
+    stopping, following and pinging a server don't need to look for these files.
+    """
+
+    def __init__(self, folders: list[str], script_names: list[str], whitelist_file_name: str, max_log_lines: int,
+                 telemetry_history: int):
+        self.folders: list[str] = folders
+        self.script_names: list[str] = script_names
+        self.whitelist_file_name: str = whitelist_file_name
+        self.max_log_lines: int = max_log_lines
+        self.telemetry_history: int = telemetry_history
+        self.folder_entries: dict[str, FolderEntry] = {}
+        self.server_entries: dict[str, ServerEntry] = {}
+
+    def invalidate(self):
+        """Forget everything, so the next scan re-reads every folder and whitelist."""
+        self.folder_entries.clear()
+        self.server_entries.clear()
+
+    def scan(self) -> Tuple[dict[str, Server], bool]:
+        """Scan the server folders for servers.
+
+        Returns:
+            A dict from server name to every discovered Server, and whether anything changed since the last scan.
+        """
+        changed = False
+        found: dict[str, Server] = {}
+        seen_server_folders: set[str] = set()
+        for folder in self.folders:
+            folder_entry = self._scan_folder(folder)
+            if folder_entry is not self.folder_entries.get(folder):
+                changed = True
+                self.folder_entries[folder] = folder_entry
+            for server_folder in folder_entry.server_folders:
+                seen_server_folders.add(server_folder)
+                server_entry = self._scan_server(server_folder, folder_entry)
+                if server_entry is None:
+                    continue
+                if server_entry is not self.server_entries.get(server_folder):
+                    changed = True
+                    self.server_entries[server_folder] = server_entry
+                self._refresh_metadata(server_entry)
+                found.setdefault(server_entry.server.name, server_entry.server)
+        for removed in set(self.server_entries.keys()) - seen_server_folders:
+            changed = True
+            del self.server_entries[removed]
+        return found, changed
+
+    def _refresh_metadata(self, server_entry: ServerEntry):
+        server = server_entry.server
+        folder_mtime = server_entry.key[0]
+        key = (folder_mtime, get_mtime(os.path.join(server.folder_path, STOP_COMMAND_FILE_NAME)),
+               get_mtime(os.path.join(server.folder_path, LOG_LOCATION_FILE_NAME)),
+               get_mtime(os.path.join(server.folder_path, PROPERTIES_FILE_NAME)),
+               get_mtime(os.path.join(server.folder_path, POLICY_FILE_NAME)))
+        if server.metadata.key != key:
+            server.metadata = resolve_metadata(server.folder_path, self.script_names, key)
+
+    def _scan_folder(self, folder: str) -> FolderEntry:
+        old = self.folder_entries.get(folder)
+        mtime = get_mtime(folder)
+        whitelist_mtime = get_mtime(os.path.join(folder, self.whitelist_file_name))
+        if old is not None and old.mtime == mtime and old.whitelist_mtime == whitelist_mtime:
+            return old
+        whitelisted_users, admin_users = get_whitelisted_and_admin_users(os.path.join(folder, self.whitelist_file_name))
+        if old is not None and old.mtime == mtime:
+            server_folders = old.server_folders
+        else:
+            try:
+                server_folders = [os.path.join(folder, f) for f in os.listdir(folder)
+                                  if os.path.isdir(os.path.join(folder, f))]
+            except OSError:
+                server_folders = []
+        return FolderEntry(mtime, whitelist_mtime, whitelisted_users, admin_users, server_folders)
+
+    def _scan_server(self, server_folder: str, folder_entry: FolderEntry) -> Union[ServerEntry, None]:
+        mtime = get_mtime(server_folder)
+        if mtime is None:
+            return None  # Removed since its parent folder was listed
+        key = (mtime, get_mtime(os.path.join(server_folder, self.whitelist_file_name)), folder_entry.whitelist_mtime)
+        old = self.server_entries.get(server_folder)
+        if old is not None and old.key == key:
+            return old
+        file_whitelisted_users, file_admin_users = get_whitelisted_and_admin_users(os.path.join(server_folder, self.whitelist_file_name))
+        admins = list(set(deepcopy(folder_entry.admin_users + file_admin_users)))
+        users = list(set(deepcopy(folder_entry.whitelisted_users + file_whitelisted_users + admins)))
+        modpack_path = find_modpack_file_path(server_folder)
+        server = Server(id_in=os.path.basename(server_folder), folder_path=server_folder, users=users, admins=admins,
+                        modpack_path=modpack_path, max_log_lines=self.max_log_lines,
+                        telemetry_history=self.telemetry_history)
+        return ServerEntry(key, server)
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import time
+from threading import Lock
+from typing import Union
+
+
+class SessionStore:
+    """Maps login tokens to Discord IDs, with expiry and write-behind persistence.
+
+    A reverse index from Discord ID to tokens keeps revoking all of a user's tokens cheap. Changes only mark the store
+    as dirty, and flush() (run in the background) writes it out atomically, so requests never do file I/O.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path: str = path
+        self.ttl: float = ttl
+        self.tokens: dict[str, tuple[str, float]] = {}  # Key is token, value is Discord ID and expiry time
+        self.by_discord_id: dict[str, set[str]] = {}  # Key is Discord ID, value is that user's tokens
+        self.lock: Lock = Lock()
+        self.flush_lock: Lock = Lock()  # Held while writing, so only one flush touches the files at a time
+        self.dirty: bool = False
+
+    def load(self):
+        """Load sessions from disk. Tokens saved without an expiry time get a fresh one."""
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        current_time = time.time()
+        with self.lock:
+            for token, value in data.items():
+                if isinstance(value, str):
+                    discord_id, expires_at = value, current_time + self.ttl
+                    self.dirty = True
+                else:
+                    discord_id, expires_at = value
+                if expires_at > current_time:
+                    self._add(token, discord_id, expires_at)
+
+    def get(self, token: Union[str, None]) -> Union[str, None]:
+        """Get the Discord ID a token belongs to.
+
+        Returns:
+            The Discord ID, or None if the token doesn't exist or has expired.
+        """
+        if token is None:
+            return None
+        session = self.tokens.get(token)
+        if session is None:
+            return None
+        discord_id, expires_at = session
+        if expires_at <= time.time():
+            self.revoke(token)
+            return None
+        return discord_id
+
+    def add(self, token: str, discord_id: str):
+        """Add a token for a user, revoking any tokens they already had."""
+        with self.lock:
+            for old_token in self.by_discord_id.pop(discord_id, set()):
+                self.tokens.pop(old_token, None)
+            self._add(token, discord_id, time.time() + self.ttl)
+            self.dirty = True
+
+    def revoke(self, token: str):
+        with self.lock:
+            session = self.tokens.pop(token, None)
+            if session is None:
+                return
+            user_tokens = self.by_discord_id.get(session[0])
+            if user_tokens is not None:
+                user_tokens.discard(token)
+                if len(user_tokens) == 0:
+                    del self.by_discord_id[session[0]]
+            self.dirty = True
+
+    def expire(self):
+        """Remove all expired tokens."""
+        current_time = time.time()
+        with self.lock:
+            expired = [token for token, (_, expires_at) in self.tokens.items() if expires_at <= current_time]
+        for token in expired:
+            self.revoke(token)
+
+    def flush(self):
+        """Write the sessions to disk if they changed since the last flush.
+
+        The file is written to a temporary file first, then renamed over the old one, so a crash mid-write can't leave
+        a corrupt datastore behind.
+        """
+        with self.flush_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                data = {token: [discord_id, expires_at] for token, (discord_id, expires_at) in self.tokens.items()}
+                self.dirty = False
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, "w") as f:
+                    f.write(json.dumps(data))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+            except OSError:
+                logging.exception(f"Failed to write sessions to {self.path}!")
+                with self.lock:
+                    self.dirty = True  # Try again next flush
+
+    def _add(self, token: str, discord_id: str, expires_at: float):
+        self.tokens[token] = (discord_id, expires_at)
+        self.by_discord_id.setdefault(discord_id, set()).add(token)
@@ -0,0 +1,139 @@
+import logging
+import time
+from collections import deque
+from threading import Condition, Thread
+from typing import Callable, Union
+
+import psutil
+
+import metrics
+from Server import Server
+
+# Seconds to wait before checking again whether a queued server can be started
+ADMISSION_RECHECK_SECONDS = 5
+
+
+class StartupQueue:
+    """Starts servers one after another, only when the host has room for another one.
+
+    A queued server is started once fewer than max_booting servers have started within the last boot_seconds, at least
+    stagger_seconds have passed since the last start, and the host has at least min_free_memory_mb of memory available.
+    A server that exits (such as by crashing) before boot_seconds are up stops counting as booting straight away.
+    """
+
+    def __init__(self, launch: Callable[[Server], str], on_change: Callable[[], None], max_booting: int,
+                 boot_seconds: float, stagger_seconds: float, min_free_memory_mb: int):
+        self.launch: Callable[[Server], str] = launch  # Starts a server, returning an error message or ""
+        self.on_change: Callable[[], None] = on_change  # Called whenever queue positions change
+        self.max_booting: int = max_booting
+        self.boot_seconds: float = boot_seconds
+        self.stagger_seconds: float = stagger_seconds
+        self.min_free_memory_mb: int = min_free_memory_mb
+
+        self.queue: deque[Server] = deque()
+        # Each server started recently and when it was started, oldest first
+        self.start_times: deque[tuple[Server, float]] = deque()
+        self.condition: Condition = Condition()
+        self.stopped: bool = False
+        self.thread: Union[Thread, None] = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = Thread(target=self._run, name="mc-server-web-startup-queue", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(10)
+            self.thread = None
+
+    def enqueue(self, server: Server) -> int:
+        """Queue a server to be started.
+
+        Returns:
+            The server's position in the queue, starting at 1. If it was already queued, this is its existing position.
+        """
+        with self.condition:
+            if server not in self.queue:
+                self.queue.append(server)
+                self._update_positions()
+                self.condition.notify_all()
+            position = server.queue_position
+        self.on_change()
+        return position
+
+    def cancel(self, server: Server) -> bool:
+        """Remove a server from the queue.
+
+        Returns:
+            Whether the server was queued.
+        """
+        with self.condition:
+            if server not in self.queue:
+                return False
+            self.queue.remove(server)
+            server.queue_position = None
+            self._update_positions()
+        self.on_change()
+        return True
+
+    def replace(self, old: Server, new: Server):
+        """Put new in old's place in the queue, if old is queued. Used when a server's folder is rescanned, so the
+        Server that's started is the current one, and it still shows as queued."""
+        with self.condition:
+            if old not in self.queue:
+                return
+            self.queue[self.queue.index(old)] = new
+            old.queue_position = None
+            self._update_positions()
+
+    def _update_positions(self):
+        for i, server in enumerate(self.queue):
+            server.queue_position = i + 1
+
+    def _wait_reason(self) -> Union[str, None]:
+        """Get why the next server can't be started yet, or None if it can be."""
+        current_time = time.monotonic()
+        # Servers that already exited aren't booting anymore, so they don't hold up the queue, or stagger the next start
+        self.start_times = deque((server, started_at) for server, started_at in self.start_times
+                                 if current_time - started_at <= self.boot_seconds and server.is_running())
+        if len(self.start_times) >= self.max_booting:
+            return f"{len(self.start_times)} servers are still booting"
+        if len(self.start_times) > 0 and current_time - self.start_times[-1][1] < self.stagger_seconds:
+            return "staggering starts"
+        available_mb = psutil.virtual_memory().available // (1024 * 1024)
+        if available_mb < self.min_free_memory_mb:
+            return f"only {available_mb} MB of memory available"
+        return None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.stopped or len(self.queue) > 0)
+                if self.stopped:
+                    return
+                reason = self._wait_reason()
+                if reason is not None:
+                    self.condition.wait(ADMISSION_RECHECK_SECONDS)
+                    continue
+                server = self.queue.popleft()
+                server.queue_position = None
+                self._update_positions()
+                started_at = time.monotonic()
+                self.start_times.append((server, started_at))
+            try:
+                error = self.launch(server)
+            except Exception as e:
+                logging.exception(f"Failed to start server {server.name}!")
+                error = str(e)
+            server.start_error = error if error else None
+            if error:
+                metrics.inc("server_start_failures_total")
+                with self.condition:
+                    self.start_times.remove((server, started_at))  # It isn't booting, so it shouldn't hold up the queue
+                server.events.publish("start_failed", {"message": error})
+            self.on_change()
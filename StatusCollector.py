@@ -0,0 +1,149 @@
+import json
+import logging
+import re
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import BinaryIO, Union
+
+from Server import Server
+
+# Protocol version sent in the handshake. Servers answer status requests whatever the version, so any will do.
+PROTOCOL_VERSION = 765
+MAX_RESPONSE_BYTES = 1024 * 1024
+FORMATTING_CODE_REGEX = re.compile("§.")
+
+
+def encode_varint(value: int) -> bytes:
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value == 0:
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+
+def read_varint(f: BinaryIO) -> int:
+    value = 0
+    for i in range(5):
+        byte = f.read(1)
+        if len(byte) == 0:
+            raise EOFError("Connection closed mid-packet")
+        value |= (byte[0] & 0x7F) << (7 * i)
+        if not byte[0] & 0x80:
+            return value - (1 << 32) if value & (1 << 31) else value
+    raise ValueError("VarInt is too big")
+
+
+def read_exactly(f: BinaryIO, length: int) -> bytes:
+    data = f.read(length)
+    if len(data) != length:
+        raise EOFError("Connection closed mid-packet")
+    return data
+
+
+def make_packet(data: bytes) -> bytes:
+    return encode_varint(len(data)) + data
+
+
+def flatten_text(component: Union[dict, list, str]) -> str:
+    """Turn a chat component (such as a server's MOTD) into plain text, without formatting codes."""
+    if isinstance(component, str):
+        return FORMATTING_CODE_REGEX.sub("", component)
+    if isinstance(component, list):
+        return "".join(flatten_text(part) for part in component)
+    if isinstance(component, dict):
+        return flatten_text(component.get("text", "")) + flatten_text(component.get("extra", []))
+    return ""
+
+
+def ping(host: str, port: int, timeout: float) -> dict:
+    """Get a server's status with the Server List Ping protocol (Minecraft 1.7 and up).
+
+    Raises:
+        OSError: If the server couldn't be reached or timed out.
+        ValueError: If the server sent something other than a valid status response.
+        EOFError: If the server closed the connection early.
+
+    Returns:
+        The server's player counts, the names of some of its players, its MOTD and version, and the ping latency.
+    """
+    with socket.create_connection((host, port), timeout=timeout) as sock, sock.makefile("rb") as f:
+        host_bytes = host.encode("utf-8")
+        handshake = (b"\x00" + encode_varint(PROTOCOL_VERSION) + encode_varint(len(host_bytes)) + host_bytes +
+                     struct.pack(">H", port) + encode_varint(1))
+        sock.sendall(make_packet(handshake) + make_packet(b"\x00"))
+        read_varint(f)  # Packet length
+        if read_varint(f) != 0:
+            raise ValueError("Expected a status response")
+        length = read_varint(f)
+        if not 0 <= length <= MAX_RESPONSE_BYTES:
+            raise ValueError("Status response is too big")
+        status = json.loads(read_exactly(f, length).decode("utf-8"))
+
+        start = time.perf_counter()
+        sock.sendall(make_packet(b"\x01" + struct.pack(">q", int(start * 1000))))
+        read_varint(f)
+        if read_varint(f) != 1:
+            raise ValueError("Expected a pong")
+        read_exactly(f, 8)
+        latency = time.perf_counter() - start
+
+    players = status.get("players", {})
+    version = status.get("version", {})
+    return {
+        "online": players.get("online"),
+        "max": players.get("max"),
+        "players": [player.get("name") for player in players.get("sample", []) if isinstance(player, dict)],
+        "motd": flatten_text(status.get("description", "")),
+        "version": version.get("name") if isinstance(version, dict) else None,
+        "latency_ms": round(latency * 1000, 1),
+    }
+
+
+class StatusCollector:
+    """Pings running servers in the background, caching the result on each Server as its status.
+
+    Pings run on a small thread pool, so one slow server can't hold up the others, and collect() never waits for them.
+    A server isn't pinged again while its last ping is still in progress.
+    """
+
+    def __init__(self, timeout: float, max_workers: int = 4):
+        self.timeout: float = timeout
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix="mc-server-web-status")
+        self.in_flight: set[str] = set()  # Names of servers being pinged
+        self.lock: Lock = Lock()
+
+    def collect(self, servers: list[Server]):
+        """Start pinging every server in servers that has a status port."""
+        for server in servers:
+            port = server.metadata.status_port
+            if port is None:
+                continue
+            with self.lock:
+                if server.name in self.in_flight:
+                    continue
+                self.in_flight.add(server.name)
+            self.executor.submit(self._ping, server, port)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _ping(self, server: Server, port: int):
+        try:
+            status = ping("127.0.0.1", port, self.timeout)
+        except (OSError, ValueError, EOFError):
+            status = None  # Most likely still starting up
+        except Exception:
+            logging.exception(f"Failed to ping server {server.name}!")
+            status = None
+        finally:
+            with self.lock:
+                self.in_flight.discard(server.name)
+        server.set_status(status if server.is_running() else None)
@@ -0,0 +1,91 @@
+import os
+import secrets
+import time
+from subprocess import Popen, TimeoutExpired
+from typing import Callable, Union
+
+import psutil
+
+import metrics
+from Server import Server
+
+
+def find_java_child(pid: int) -> Union[psutil.Process, None]:
+    """Find the Java process started by a server's startup script.
+
+    Args:
+        pid: PID of the startup script's process.
+
+    Returns:
+        The first Java process found among the descendants of pid, or None if there isn't one.
+    """
+    try:
+        shell_process = psutil.Process(pid)
+        for child in shell_process.children(recursive=True):
+            if "java" in os.path.basename(child.exe()):
+                return child
+    except psutil.Error:
+        pass
+    return None
+
+
+class StopJob:
+    """Stops a server in the background, reporting its progress as it goes.
+
+    The stop command is sent first. If the server hasn't exited after stop_timeout seconds, it gets save_grace more
+    seconds if it's still running Java (in case it's still saving), and is then killed.
+    """
+
+    def __init__(self, server: Server, stop_command: str, stop_timeout: float, save_grace: float,
+                 on_done: Callable[[Server], None]):
+        self.id: str = secrets.token_urlsafe(16)
+        self.server: Server = server
+        self.stop_command: str = stop_command
+        self.stop_timeout: float = stop_timeout
+        self.save_grace: float = save_grace
+        self.on_done: Callable[[Server], None] = on_done
+        self.status: str = "queued"
+        self.finished_at: Union[float, None] = None
+
+    def is_done(self) -> bool:
+        return self.finished_at is not None
+
+    def set_status(self, status: str):
+        self.status = status
+        self.server.events.publish("stopping", {"job_id": self.id, "status": status})
+
+    def get_data(self) -> dict:
+        return {"job_id": self.id, "name": self.server.name, "status": self.status, "done": self.is_done()}
+
+    def run(self):
+        proc: Union[Popen, None] = self.server.process
+        try:
+            if proc is None:
+                return
+            self.set_status("stopping")
+            try:
+                # Not using communicate(), since that would also read stdout out from under an OutputCapture. The stop
+                # command goes through the server's command queue, so it can't block if the server stopped reading.
+                commands = self.server.commands
+                if commands is not None:
+                    commands.close(self.stop_command)
+                proc.wait(timeout=self.stop_timeout)
+            except TimeoutExpired:
+                java_child = find_java_child(proc.pid)
+                if java_child is not None:
+                    self.set_status("saving")
+                    time.sleep(self.save_grace)  # Give the server extra time in case it's still saving (unlikely)
+                    try:
+                        java_child.kill()
+                    except psutil.Error:
+                        pass
+                proc.kill()  # If no Java was found, the server is definitely gone, so kill it ASAP.
+                proc.wait()
+                self.status = "killed"
+                metrics.inc("server_stop_kills_total")
+        finally:
+            self.on_done(self.server)
+            if self.status != "killed":
+                self.status = "stopped"
+            self.finished_at = time.time()
+            self.server.events.publish("stopping", {"job_id": self.id, "status": self.status})
@@ -0,0 +1,48 @@
+from typing import Any, Callable, Union
+
+from AgentProtocol import AgentError
+from CommandQueue import NOT_RUNNING_MESSAGE, Submission
+import config
+
+
+def manage(params: dict) -> dict:
+    server = config.get_server_by_name(params.get("name"))
+    if server is None:
+        # Such as when the server's folder was just removed, and the frontend hasn't heard yet
+        return {"response": {"message": f"Server {params.get('name')} not found!"}, "code": 404}
+    response, code = config.manage_server(server, params.get("action"))
+    return {"response": response, "code": code}
+
+
+def stop_status(params: dict) -> Union[dict, None]:
+    job = config.get_stop_job(str(params.get("job_id")))
+    return job.get_data() if job is not None else None
+
+
+def run_commands(params: dict) -> dict:
+    commands = params.get("commands")
+    if not isinstance(commands, list) or not all(isinstance(command, str) for command in commands):
+        raise AgentError("Invalid commands!")
+    with config.running_servers_lock:
+        server = config.running_servers.get(params.get("name"))
+    if server is None:
+        return {"error": NOT_RUNNING_MESSAGE}
+    result = server.submit_commands(commands)
+    if isinstance(result, Submission):
+        return {"seqs": result.seqs, "queued": result.queued}
+    return {"error": result}
+
+
+def refresh_servers(params: dict) -> dict:
+    config.load_servers(full=True)
+    config.publish_snapshot()
+    return {}
+
+
+# Requests the web frontend can make, by method name. See AgentServer.
+HANDLERS: dict[str, Callable[[dict], Any]] = {
+    "manage": manage,
+    "stop_status": stop_status,
+    "run_commands": run_commands,
+    "refresh_servers": refresh_servers,
+}
@@ -1,19 +1,28 @@
-from flask import Flask, jsonify, redirect, request, send_file, send_from_directory, session, url_for
-from typing import Any, Union
-import os
-import psutil
+from flask import Flask, Response, g, jsonify, redirect, request, send_file, send_from_directory, session, url_for
+from typing import Any, Mapping, Union
+import base64
+import hashlib
+import json
 import requests
 import secrets
-from subprocess import DEVNULL, PIPE, Popen, CREATE_NO_WINDOW, TimeoutExpired, NORMAL_PRIORITY_CLASS
+import sqlite3
 import sys
-import unicodedata
 from urllib.parse import urlencode
-from time import sleep
+from werkzeug.wsgi import ClosingIterator
+from time import monotonic, perf_counter
 
 import config
-from Server import Server
+import metrics
+from AgentClient import UNREACHABLE_MESSAGE, RemoteServer
+from AgentProtocol import AgentError, AgentUnreachableError
+from CommandQueue import FULL_MESSAGE, STALLED_MESSAGE, Submission
+from LogIndexer import MAX_RESULTS as MAX_SEARCH_RESULTS
+from Server import Server, ServerState
 
 app = Flask(__name__)
+app.config["USE_X_SENDFILE"] = config.USE_X_SENDFILE
+# Status codes for why commands weren't queued, other than the server not running
+COMMAND_ERROR_CODES = {FULL_MESSAGE: 429, STALLED_MESSAGE: 503, UNREACHABLE_MESSAGE: 502}
 
 
 def make_message(msg: str, code: int):
@@ -31,7 +40,23 @@ def get_val_err(key: str) -> Any:
     return val
 
 
-def is_user_whitelisted(server: Server) -> bool:
+class AuthContext:
+    """Who the current request is from. Resolved once per request by before_request and stored as g.auth."""
+
+    def __init__(self, token: Union[str, None]):
+        self.token: Union[str, None] = token
+        self.discord_id: Union[str, None] = config.sessions.get(token)
+        self.name: Union[str, None] = config.ALLOWED_USERS.get(self.discord_id) if self.discord_id is not None else None
+        self.is_global_admin: bool = self.discord_id is not None and self.discord_id in config.ADMINS
+        # Key is the name of each server this user can see, value is whether they're an admin of it
+        self.visible_servers: Mapping[str, bool] = config.get_visible_servers(self.name)
+        self.admin_servers: frozenset[str] = config.get_administered_servers(self.name)
+
+    def is_logged_in(self) -> bool:
+        return self.discord_id is not None
+
+
+def is_user_whitelisted(server: Union[Server, ServerState, RemoteServer]) -> bool:
     """Whether the current request's user is whitelist for this server.
 
     Args:
@@ -40,13 +65,10 @@ def is_user_whitelisted(server: Server) -> bool:
     Returns:
         Whether the current user is whitelisted in the whitelist.
     """
-    token = get_cookie("token")
-    this_user = config.name_from_token(token)
-    discord_token = config.token_to_discord_id[token]
-    return this_user in server.users or discord_token in config.ADMINS
+    return server.name in g.auth.visible_servers or g.auth.is_global_admin
 
 
-def is_user_server_admin(server: Server) -> bool:
+def is_user_server_admin(server: Union[Server, ServerState, RemoteServer]) -> bool:
     """Whether the current request's user is an admin for this server.
 
     Args:
@@ -55,24 +77,7 @@ def is_user_server_admin(server: Server) -> bool:
     Returns:
         Whether the current user is admin for this server. Does not account for global admins.
     """
-    token = get_cookie("token")
-    this_user = config.name_from_token(token)
-    return this_user in server.admins
-
-
-def send_command(process: Popen, command: str):
-    """Run a command on a given process representing a Minecraft server.
-
-    The command run will be filtered to remove control characters.
-
-    Args:
-        process: Process instance for a Minecraft server.
-        command: The command to run.
-
-    """
-    command = "".join(c for c in command if unicodedata.category(c)[0] != "C")
-    process.stdin.write(command + "\n")
-    process.stdin.flush()
+    return server.name in g.auth.admin_servers
 
 
 def get_cookie(name: str, default: Any = None):
@@ -93,15 +98,18 @@ def get_cookie(name: str, default: Any = None):
 
 @app.before_request
 def before_request():
-    # If GET, handle the token (clear token if server restarted, etc.)
+    g.request_start = perf_counter()
+    g.profile = metrics.start_profile() if metrics.profiling_enabled else None
     token = get_cookie("token")
+    g.auth = AuthContext(token)
+    # If GET, handle the token (clear token if server restarted, etc.)
     if request.method == "GET":
-        if token is not None and token not in config.token_to_discord_id:
+        if token is not None and not g.auth.is_logged_in():
             resp = redirect(url_for("index"))
             resp.delete_cookie("token")
             return resp
     elif request.method == "POST":
-        if token is None or token not in config.token_to_discord_id:
+        if not g.auth.is_logged_in():
             resp = make_message("Not authenticated!", 403)
             if token is not None:
                 resp[0].delete_cookie("token")
@@ -110,25 +118,47 @@ def before_request():
         return make_message("Method not supported!", 405)
 
 
+@app.after_request
+def after_request(resp: Response) -> Response:
+    metrics.inc("http_requests_total", endpoint=request.endpoint or "unknown", status=str(resp.status_code))
+    return resp
+
+
+@app.teardown_request
+def teardown_request(exc: Union[BaseException, None]):
+    # Runs even if the request raised, so a profile is always finished.
+    endpoint = request.endpoint or "unknown"
+    metrics.observe("http_request_seconds", perf_counter() - g.request_start, endpoint=endpoint)
+    if exc is not None:
+        metrics.inc("http_requests_total", endpoint=endpoint, status="500")  # after_request doesn't run for these
+    if g.profile is not None:
+        metrics.finish_profile(g.profile, f"{request.method} {request.path}")
+
+
 @app.route("/v2")
 @app.route("/")
 @app.route("/index.html")
 @app.route("/index")
 def index():
-    return send_from_directory("react-frontend/dist", "index.html")
+    # Always revalidated, so a new build is picked up right away. Flask answers revalidation with 304 if unchanged.
+    resp = send_from_directory("react-frontend/dist", "index.html")
+    resp.cache_control.no_cache = True
+    return resp
 
 @app.route("/assets/<path:path>")
 def bundle(path):
-    return send_from_directory("react-frontend/dist/assets", path)
+    # Vite puts a content hash in every asset's file name, so an asset at a given path never changes.
+    resp = send_from_directory("react-frontend/dist/assets", path, max_age=60*60*24*365)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
 
 @app.route("/auth/info", methods=["GET"])
 def get_auth_data():
-    token = get_cookie("token")
-    name = config.name_from_token(token)
     return jsonify({
-        "logged_in": token is not None,
-        "name": name,
-        "admin": config.is_admin(token)
+        "logged_in": g.auth.token is not None,
+        "name": g.auth.name,
+        "admin": g.auth.is_global_admin
     }), 200
 
 @app.route("/auth/authorize")
@@ -160,13 +190,14 @@ def oauth2_redirect():
         return "There was an error (missing code) while logging in!", 500
 
     # Get access token from authorization code
-    r = requests.post(config.OAUTH_TOKEN_URL, data={
-        "client_id": config.OAUTH_CLIENT_ID,
-        "client_secret": config.OAUTH_CLIENT_SECRET,
-        "code": request.args["code"],
-        "grant_type": "authorization_code",
-        "redirect_uri": url_for("oauth2_redirect", _external=True)
-    }, headers={"Accept": "application/json"})
+    with metrics.timed("oauth_request_seconds", call="token"):
+        r = requests.post(config.OAUTH_TOKEN_URL, data={
+            "client_id": config.OAUTH_CLIENT_ID,
+            "client_secret": config.OAUTH_CLIENT_SECRET,
+            "code": request.args["code"],
+            "grant_type": "authorization_code",
+            "redirect_uri": url_for("oauth2_redirect", _external=True)
+        }, headers={"Accept": "application/json"})
     if r.status_code != 200:
         return "There was an error (failed token retrieval) while logging in!", 500
     token = r.json().get("access_token", None)
@@ -175,9 +206,10 @@ def oauth2_redirect():
         return "There was an error (token or token type not found) while logging in!", 500
 
     # Get user ID from token
-    r = requests.get(config.API_ENDPOINT + "/users/@me", headers={
-        "authorization": f"{token_type} {token}"
-    })
+    with metrics.timed("oauth_request_seconds", call="user"):
+        r = requests.get(config.API_ENDPOINT + "/users/@me", headers={
+            "authorization": f"{token_type} {token}"
+        })
     if r.status_code != 200:
         return "There was an error (failed to get user ID) while logging in!", 500
     discord_user_id = r.json()["id"]
@@ -188,23 +220,16 @@ def oauth2_redirect():
     token = secrets.token_urlsafe(128)
 
     session.pop("state")
-    to_del = []
-    for key in config.token_to_discord_id:
-        val = config.token_to_discord_id[key]
-        if val == discord_user_id:
-            to_del.append(key)
-    for key in to_del:
-        del config.token_to_discord_id[key]
-    config.token_to_discord_id[token] = discord_user_id
-    config.maybe_write_datastore()
+    config.sessions.add(token, discord_user_id)  # Also logs the user out everywhere else
 
     resp = redirect(url_for("index"))
-    resp.set_cookie("token", token, max_age=60*60*24*30)
+    resp.set_cookie("token", token, max_age=config.SESSION_TTL)
     return resp
 
 
 @app.route("/auth/logout", methods=["POST"])
 def logout():
+    config.sessions.revoke(g.auth.token)
     resp = make_message("Logged out!", 200)
     resp[0].delete_cookie("token")
     return resp
@@ -212,23 +237,38 @@ def logout():
 
 @app.route("/api/refresh_servers", methods=["POST"])
 def refresh_servers():
-    if not config.is_admin(get_cookie("token")):
+    if not g.auth.is_global_admin:
         return make_message("Only admins can refresh the list of available servers!", 403)
     else:
-        config.load_servers()
-        config.maybe_poll_running_servers(True)
+        config.load_servers(full=True)
+        config.poll_running_servers()
+        for agent in config.agents.values():
+            try:
+                agent.call("refresh_servers", {})
+            except AgentError:
+                pass  # It'll pick up changes on its own once it's back
         return make_message("Servers refreshed!", 200)
 
 
 @app.route("/api/list", methods=["POST"])
 def list_servers():
-    config.maybe_poll_running_servers()
+    # The response differs per user, so the user is part of the ETag too.
+    user_hash = hashlib.sha256(str(g.auth.name).encode()).hexdigest()[:8]
+    etag = f"{config.get_version()}-{user_hash}"
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
     servers = []
-    with config.servers_lock:
-        for server in config.servers:
-            if is_user_whitelisted(server):
-                servers.append(server.get_data(is_user_server_admin(server)))
-    return jsonify({"message": "Got servers!", "data": sorted(servers, key=lambda s: s["name"])}), 200
+    snapshot = config.snapshot
+    for name, is_admin in g.auth.visible_servers.items():
+        server = snapshot.get(name)
+        if server is not None:
+            servers.append(server.get_data(is_admin))
+    resp = jsonify({"message": "Got servers!", "data": sorted(servers, key=lambda s: s["name"])})
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp, 200
 
 
 @app.route("/api/manage", methods=["POST"])
@@ -238,95 +278,333 @@ def manage_server():
     if action not in ["start", "stop"]:
         return make_message(f"Invalid server action!", 400)
 
+    remote = config.get_remote_server(name)
+    if remote is not None:
+        if not is_user_whitelisted(remote):
+            return make_message(f"Server {name} not found!", 404)
+        # The agent the server is on does the actual managing
+        try:
+            with metrics.timed("manage_server_seconds", action=action):
+                result = remote.agent.call("manage", {"name": remote.remote_name, "action": action})
+        except AgentUnreachableError:
+            return make_message(UNREACHABLE_MESSAGE, 502)
+        except AgentError as e:
+            return make_message(str(e), 400)  # The agent got the request, but refused it
+        response = result["response"]
+        if "job_id" in response:
+            response["job_id"] = f"{remote.agent.name}/{response['job_id']}"
+        return jsonify(response), result["code"]
+
     server = config.get_server_by_name(name)
     if server is None or not is_user_whitelisted(server):
         return make_message(f"Server {name} not found!", 404)
 
-    # Ifs for which action we're performing
-    if action == "start":
-        with config.start_server_lock:
-            config.maybe_poll_running_servers(force_poll=True)
-            if name in config.running_servers:
-                return make_message(f"Server {name} already running!", 400)
-            script_path: Union[str, None] = None
-            for script_name in config.STARTUP_SCRIPT_NAMES:
-                script_path = os.path.join(server.folder_path, script_name)
-                if os.path.exists(script_path) and os.path.isfile(script_path):
-                    break
-                else:
-                    script_path = None
-            if script_path is None:
-                return make_message(f"Server does not contain a startup script.", 500)
-            try:
-                # stdout and stderr MUST be sent to DEVNULL. From testing:
-                # Vanilla 1.20.4 servers don't boot if stdout and stderr aren't sent somewhere
-                # Forge 1.20.1 servers don't boot if stdout or stderr are sent to PIPE
-                # Haven't checked whether "stdout and stderr" is an "or" instead.
-                args = [script_path]
-                if script_path.endswith(".ps1"):
-                    args = ["powershell.exe", script_path]
-                p = Popen(args, cwd=server.folder_path, stdin=PIPE, stdout=DEVNULL, stderr=DEVNULL,
-                          creationflags=CREATE_NO_WINDOW | NORMAL_PRIORITY_CLASS, universal_newlines=True)
-                server.process = p
-            except FileNotFoundError:
-                return make_message(f"Failed to start server!", 500)
-            if p.poll():
-                return make_message(f"Failed to start server!", 500)
-            with config.running_servers_lock:
-                config.running_servers[name] = server
-            app.logger.info(f"Started server {name}")
-            return make_message("Server started!", 200)
-    elif action == "stop":
-        config.maybe_poll_running_servers()
-        if name not in config.running_servers:
-            return make_message(f"Server {name} not running!", 400)
-        proc = config.running_servers[name].process
-        custom_stop_command_file = os.path.join(server.folder_path, "stop_command.txt")
-        stop_command = "stop"
-        if os.path.isfile(custom_stop_command_file):
-            try:
-                with open(custom_stop_command_file, "r") as f:
-                    stop_command = f.readline().strip()
-            except OSError:
-                pass
+    with metrics.timed("manage_server_seconds", action=action):
+        response, code = config.manage_server(server, action)
+    return jsonify(response), code
+
+
+@app.route("/api/stop_status", methods=["POST"])
+def stop_status():
+    job_id: str = get_val_err("job_id")
+    if isinstance(job_id, str) and "/" in job_id:
+        # A job on an agent, with the agent's name in front
+        agent_name, remote_job_id = job_id.rsplit("/", 1)
+        agent = config.agents.get(agent_name)
+        if agent is None:
+            return make_message("Stop job not found!", 404)
         try:
-            proc.communicate(input=f"{stop_command}\n", timeout=10)
-        except TimeoutExpired:
-            has_java = False
-            try:
-                shell_process = psutil.Process(proc.pid)
-                shell_children = shell_process.children(recursive=True)
-                java_child = None
-                for child in shell_children:
-                    if "java" in os.path.basename(child.exe()):
-                        has_java = True
-                        java_child = child
-                        break
-            except psutil.NoSuchProcess:
-                pass
-            if has_java:
-                sleep(10)  # Give the server an extra 10 seconds in case it's still saving (unlikely)
-                if java_child is not None:
-                    java_child.kill()
-                proc.kill()
-            else:
-                proc.kill()  # No Java found, so the server is definitely gone. Kill it ASAP.
-        return make_message("Server stopped!", 200)
+            data = agent.call("stop_status", {"job_id": remote_job_id})
+        except AgentUnreachableError:
+            return make_message(UNREACHABLE_MESSAGE, 502)
+        except AgentError as e:
+            return make_message(str(e), 400)
+        remote = config.get_remote_server(agent.get_name(data["name"])) if data is not None else None
+        if remote is None or not is_user_whitelisted(remote):
+            return make_message("Stop job not found!", 404)
+        return jsonify({"message": "Got stop status!", "data": {**data, "job_id": job_id, "name": remote.name}}), 200
+    job = config.get_stop_job(job_id)
+    if job is None or not is_user_whitelisted(job.server):
+        return make_message("Stop job not found!", 404)
+    return jsonify({"message": "Got stop status!", "data": job.get_data()}), 200
+
+
+@app.route("/api/telemetry", methods=["POST"])
+def get_telemetry():
+    name: str = get_val_err("name")
+    server = config.get_server_by_name(name)
+    if server is None or not is_user_whitelisted(server):
+        return make_message(f"Server {name} not found!", 404)
+    return jsonify({"message": "Got telemetry!", "data": server.get_telemetry()}), 200
+
+
+@app.route("/api/log_range", methods=["POST"])
+def get_log_range():
+    """Get a page of lines from a server's log, for scrolling back through it.
+
+    Takes the server name, and optionally cursor (a byte offset from an earlier page's start or end, along with that
+    page's file_id), line (a line number to read from instead of cursor), lines (how many lines to read) and direction
+    ("backward" to read the lines before cursor, the default, or "forward" to read the lines from cursor onwards).
+    """
+    name: str = get_val_err("name")
+    server = config.get_server_by_name(name)
+    if server is None or not is_user_whitelisted(server):
+        return make_message(f"Server {name} not found!", 404)
+    direction = get_val("direction", "backward")
+    if direction not in ["backward", "forward"]:
+        return make_message("Invalid direction!", 400)
+    try:
+        cursor = get_val("cursor")
+        line = get_val("line")
+        with metrics.timed("log_range_seconds"):
+            page = server.log_pager.read(server.metadata.log_path, int(cursor) if cursor is not None else None,
+                                         int(line) if line is not None else None, int(get_val("lines", 100)),
+                                         direction == "backward", get_val("file_id"))
+    except (TypeError, ValueError):
+        return make_message("Invalid log range!", 400)
+    if page is None:
+        # Either there's no log, or it was replaced since the cursor was handed out. Either way, start over.
+        return make_message("Log not found or has changed!", 409)
+    return jsonify({"message": "Got log range!", "data": page.get_data()}), 200
+
+
+@app.route("/api/logs/search", methods=["POST"])
+def search_logs():
+    """Search a server's indexed log history, newest first.
+
+    Takes the server name, and optionally query (words every line must contain), start and end (Unix timestamps),
+    levels (such as ["WARN", "ERROR"]), limit and cursor (the next_cursor of the previous page).
+    """
+    name: str = get_val_err("name")
+    server = config.get_server_by_name(name)
+    if server is None or not is_user_whitelisted(server):
+        return make_message(f"Server {name} not found!", 404)
+    if not g.auth.is_global_admin and not is_user_server_admin(server):
+        return make_message("Logs can only be searched by admins!", 403)
+    index = config.log_indexer.get_index(server) if config.LOG_INDEX_ENABLED else None
+    if index is None:
+        return make_message("Log search is unavailable!", 503)
+    cursor: Union[str, None] = get_val("cursor")
+    before = None
+    if cursor is not None:
+        try:
+            if not isinstance(cursor, str):
+                raise ValueError("Cursor must be a string")
+            cursor_time, cursor_id = cursor.split(":")
+            before = (float(cursor_time), int(cursor_id))
+        except ValueError:
+            return make_message("Invalid cursor!", 400)
+    levels: Union[list[str], None] = get_val("levels")
+    if levels is not None and (not isinstance(levels, list) or not all(isinstance(level, str) for level in levels)):
+        return make_message("Levels must be a list of strings!", 400)
+    try:
+        limit = int(get_val("limit", 50))
+        if limit <= 0:
+            return make_message("Limit must be positive!", 400)
+        limit = min(limit, MAX_SEARCH_RESULTS)  # The index never returns more than this, so page by it instead
+        start = get_val("start")
+        end = get_val("end")
+        with metrics.timed("log_search_seconds"):
+            lines = index.search(str(get_val("query", "")), float(start) if start is not None else None,
+                                 float(end) if end is not None else None, levels, before, limit)
+    except (TypeError, ValueError, sqlite3.Error):
+        return make_message("Invalid search!", 400)
+    next_cursor = f"{lines[-1].time}:{lines[-1].id}" if len(lines) > 0 and len(lines) == limit else None
+    return jsonify({"message": "Searched logs!", "data": [line.get_data() for line in lines],
+                    "next_cursor": next_cursor}), 200
+
+
+@app.route("/api/backups", methods=["POST"])
+def list_backups():
+    """Get a server's backups, newest first, along with the status of its latest backup or restore."""
+    name: str = get_val_err("name")
+    server = config.get_server_by_name(name)
+    if server is None or not is_user_whitelisted(server):
+        return make_message(f"Server {name} not found!", 404)
+    if not g.auth.is_global_admin and not is_user_server_admin(server):
+        return make_message("Servers can only be backed up by admins!", 403)
+    snapshots = [info.get_data() for info in config.backup_manager.list_snapshots(server)]
+    return jsonify({"message": "Got backups!", "data": {"snapshots": snapshots,
+                                                       "status": config.backup_manager.get_status(server)}}), 200
+
+
+@app.route("/api/backup", methods=["POST"])
+def back_up_server():
+    name: str = get_val_err("name")
+    server = config.get_server_by_name(name)
+    if server is None or not is_user_whitelisted(server):
+        return make_message(f"Server {name} not found!", 404)
+    if not g.auth.is_global_admin and not is_user_server_admin(server):
+        return make_message("Servers can only be backed up by admins!", 403)
+    if not config.backup_manager.back_up(server):
+        return make_message("Server is already being backed up or restored!", 409)
+    return make_message("Backing up server...", 202)
+
+
+@app.route("/api/restore", methods=["POST"])
+def restore_server():
+    """Restore a stopped server's folder from one of its backups. Takes the server name and snapshot (a backup's id)."""
+    name: str = get_val_err("name")
+    server = config.get_server_by_name(name)
+    if server is None or not is_user_whitelisted(server):
+        return make_message(f"Server {name} not found!", 404)
+    if not g.auth.is_global_admin and not is_user_server_admin(server):
+        return make_message("Servers can only be restored by admins!", 403)
+    snapshot_id: str = get_val_err("snapshot")
+    if server.is_running() or server.queue_position is not None:
+        return make_message("Servers must be stopped before they're restored!", 400)
+    if not isinstance(snapshot_id, str) or not config.backup_manager.has_snapshot(server, snapshot_id):
+        return make_message("Backup not found!", 404)
+    if not config.backup_manager.restore(server, snapshot_id):
+        return make_message("Server is already being backed up or restored!", 409)
+    return make_message("Restoring server...", 202)
 
 
 @app.route("/api/run_command", methods=["POST"])
 def run_command():
-    token: str = get_cookie("token")
     name: str = get_val_err("name")
     command: str = get_val_err("command")
-    if name not in config.running_servers:
+    server = config.get_running_servers().get(name)
+    if server is None:
         return make_message("Server not found or not running!", 404)
-    if not config.is_admin(token) and not is_user_server_admin(config.running_servers[name]):
+    if not g.auth.is_global_admin and not is_user_server_admin(server):
         return make_message("Commands can only be run by admins!", 403)
-    with config.running_servers_lock:
-        server: Server = config.running_servers[name]
-        send_command(server.process, command)
-        return make_message("Ran command successfully!", 200)
+    submission = server.submit_commands([command])
+    if not isinstance(submission, Submission):
+        return make_message(submission, COMMAND_ERROR_CODES.get(submission, 404))
+    status = get_submission_status(submission)
+    return jsonify({"message": f"Command {status}!", "status": status, "seq": submission.seqs[0]}), 202
+
+
+def get_submission_status(submission: Submission) -> str:
+    """Whether submitted commands were accepted to be run right away, or queued behind earlier ones."""
+    return "queued" if submission.queued else "accepted"
+
+
+@app.route("/api/run_commands", methods=["POST"])
+def run_commands():
+    """Run commands on many servers at once.
+
+    Takes either commands, a list of {"name": ..., "command": ...}, or command along with servers, a list of server
+    names or "running" for every running server the user is an admin of. Commands for the same server are run in the
+    order given. Returns a result for each command, with its sequence number if it was queued.
+    """
+    pairs = get_val("commands")
+    if pairs is None:
+        command = get_val("command")
+        servers = get_val("servers")
+        if not isinstance(command, str) or servers is None:
+            return make_message("Either commands, or command and servers, must be given!", 400)
+        if servers == "running":
+            servers = sorted(config.get_running_servers().keys())
+            if not g.auth.is_global_admin:
+                servers = [name for name in servers if name in g.auth.admin_servers]
+        pairs = [{"name": name, "command": command} for name in servers] if isinstance(servers, list) else None
+    if not isinstance(pairs, list) or not all(isinstance(pair, dict) and isinstance(pair.get("name"), str)
+                                              and isinstance(pair.get("command"), str) for pair in pairs):
+        return make_message("Invalid commands!", 400)
+    if len(pairs) > config.MAX_BATCH_COMMANDS:
+        return make_message(f"At most {config.MAX_BATCH_COMMANDS} commands can be run at once!", 400)
+
+    with metrics.timed("run_commands_seconds"):
+        results: list[Union[dict, None]] = [None] * len(pairs)
+        by_server: dict[str, list[int]] = {}  # Key is server name, value is the indexes of its commands in pairs
+        running = config.get_running_servers()
+        for i, pair in enumerate(pairs):
+            name = pair["name"]
+            if name not in running or not is_user_whitelisted(running[name]):
+                results[i] = {**pair, "ok": False, "message": "Server not found or not running!"}
+            elif not g.auth.is_global_admin and not is_user_server_admin(running[name]):
+                results[i] = {**pair, "ok": False, "message": "Commands can only be run by admins!"}
+            else:
+                by_server.setdefault(name, []).append(i)
+        # Queueing never waits on the servers, so a server that stopped reading commands can't hold up the others.
+        # Servers on other hosts do wait on their agents, but agents answer as soon as the commands are queued.
+        for name, indexes in by_server.items():
+            submission = running[name].submit_commands([pairs[i]["command"] for i in indexes])
+            for n, i in enumerate(indexes):
+                if isinstance(submission, Submission):
+                    status = get_submission_status(submission)
+                    results[i] = {**pairs[i], "ok": True, "message": f"Command {status}!", "status": status,
+                                  "seq": submission.seqs[n]}
+                else:
+                    results[i] = {**pairs[i], "ok": False, "message": submission}
+    return jsonify({"message": "Ran commands!", "data": results}), 200
+
+
+def format_event(event_type: str, data: Any, seq: Union[int, None] = None) -> str:
+    """Format an event for a text/event-stream response.
+
+    Args:
+        event_type: Name of the event.
+        data: JSON-serializable data for the event.
+        seq: Sequence number to send as the event ID, so a reconnecting client can resume after it.
+
+    Returns:
+        The event, ready to be written to the stream.
+    """
+    event_id = f"id: {seq}\n" if seq is not None else ""
+    return f"{event_id}event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/api/stream/<path:name>", methods=["GET"])
+def stream_server(name: str):
+    if not g.auth.is_logged_in():
+        return make_message("Not authenticated!", 403)
+    # Servers on other hosts have their events forwarded by their agents, so they can be streamed just the same
+    server = config.get_server_by_name(name) or config.get_remote_server(name)
+    if server is None or not is_user_whitelisted(server):
+        return make_message(f"Server {name} not found!", 404)
+    if not config.stream_slots.acquire(blocking=False):
+        metrics.inc("stream_rejections_total")
+        return make_message("Too many open log streams!", 503)
+
+    last_event_id = request.headers.get("Last-Event-ID", default=None)
+
+    def generate():
+        if last_event_id is not None and last_event_id.isdigit() and server.events.can_resume(int(last_event_id)):
+            seq = int(last_event_id)
+        else:
+            # New client, or one that missed more than we still have buffered. Start it off with the current state.
+            seq = server.events.last_seq
+            yield "retry: 1000\n" + format_event("snapshot", {"running": server.is_running(),
+                                                              "lines": server.get_log_lines(),
+                                                              "max_lines": config.MAX_LOG_LINES}, seq)
+        end_time = monotonic() + config.STREAM_MAX_SECONDS
+        while monotonic() < end_time:
+            events = server.events.wait_since(seq, config.STREAM_KEEPALIVE)
+            if len(events) == 0:
+                yield ": keepalive\n\n"
+            for event in events:
+                yield format_event(event.type, event.data, event.seq)
+                seq = event.seq
+
+    resp = Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Runs when waitress closes the response, even if the client went away before the stream started.
+    resp.call_on_close(config.stream_slots.release)
+    return resp
+
+
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    if not g.auth.is_global_admin:
+        return make_message("Only admins can view metrics!", 403)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/metrics/settings", methods=["POST"])
+def metrics_settings():
+    """Turn metrics or per-request profiling on or off, and get the most recent request profiles."""
+    if not g.auth.is_global_admin:
+        return make_message("Only admins can change metrics settings!", 403)
+    metrics.enabled = bool(get_val("metrics", metrics.enabled))
+    metrics.profiling_enabled = bool(get_val("profiling", metrics.profiling_enabled))
+    return jsonify({"message": "Updated metrics settings!", "data": {
+        "metrics": metrics.enabled,
+        "profiling": metrics.profiling_enabled,
+        "profiles": [{"request": label, "profile": profile} for label, profile in metrics.recent_profiles]
+    }}), 200
 
 
 @app.route("/api/download_modpack", methods=["GET"])
@@ -337,7 +615,24 @@ def download_modpack():
         return make_message(f"Server {name} not found!", 404)
     elif not server.has_modpack():
         return make_message(f"Server {name} does not have a modpack!", 404)
-    return send_file(server.modpack_path)
+    if not config.download_slots.acquire(blocking=False):
+        resp = make_message("Too many modpack downloads at once! Try again soon.", 503)
+        resp[0].headers["Retry-After"] = "30"
+        return resp
+    try:
+        # Flask answers Range and If-Range requests with 206, so interrupted downloads can be resumed.
+        digest = config.modpack_cache.get_digest(server.modpack_path)
+        if digest is not None:
+            resp = send_file(server.modpack_path, etag=digest.hex())
+            resp.headers["Repr-Digest"] = f"sha-256=:{base64.b64encode(digest).decode()}:"
+        else:
+            resp = send_file(server.modpack_path)
+    except OSError:
+        config.download_slots.release()
+        return make_message(f"Server {name} does not have a modpack!", 404)
+    # send_file responses skip call_on_close, so release the slot when the body itself is closed instead.
+    resp.response = ClosingIterator(resp.response, config.download_slots.release)
+    return resp
 
 
 if __name__ == "__main__":
@@ -346,4 +641,7 @@ if __name__ == "__main__":
         app.logger.critical(config_err)
         sys.exit(1)
     app.secret_key = config.FLASK_SECRET_KEY
-    app.run("0.0.0.0", config.PORT)
+    try:
+        app.run("0.0.0.0", config.PORT)
+    finally:
+        config.shutdown()
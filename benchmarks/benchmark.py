@@ -0,0 +1,441 @@
+"""Load and soak benchmark for MC Server Web.
+
+Generates fake server folders (with whitelists, modpacks and a fake_server.py startup script), stubs Discord's OAuth
+endpoints locally, logs users in through them, then drives /api/list, /api/run_command and starting/stopping servers
+concurrently against waitress. Throughput, latency percentiles, lock contention (from /api/metrics) and this process's
+memory and thread usage are printed and saved as JSON, so runs can be compared with --compare.
+
+Usage: python benchmarks/benchmark.py --servers 10 --workers 16 --duration 30
+       python benchmarks/benchmark.py --duration 3600 --compare benchmarks/results/<earlier run>.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from typing import Union
+from urllib.parse import parse_qs, urlparse
+
+import psutil
+import requests
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+FAKE_SERVER_PATH = os.path.join(BENCHMARK_DIR, "fake_server.py")
+SERVER_FOLDER_NAME = "bench"  # Servers are named "bench - server0" and so on
+ADMIN_DISCORD_ID = "1000"
+METRIC_LINE_REGEX = re.compile(r'^mc_server_web_(lock_(?:wait|held)_seconds)_(sum|count|bucket)\{(.*)\} (\S+)$')
+LABEL_REGEX = re.compile(r'(\w+)="([^"]*)"')
+
+
+class OperationStats:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.statuses: dict[str, int] = {}
+        self.errors: int = 0
+        self.lock: Lock = Lock()
+
+    def record(self, latency: float, status: Union[int, str]):
+        with self.lock:
+            self.latencies.append(latency)
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            if not isinstance(status, int) or status >= 500:
+                self.errors += 1
+
+    def summarize(self, duration: float) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "count": len(latencies),
+            "errors": self.errors,
+            "statuses": self.statuses,
+            "throughput": len(latencies) / duration,
+            "mean_ms": sum(latencies) / len(latencies) * 1000 if len(latencies) > 0 else None,
+            "p50_ms": percentile(latencies, 50),
+            "p90_ms": percentile(latencies, 90),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": latencies[-1] * 1000 if len(latencies) > 0 else None,
+        }
+
+
+def percentile(sorted_values: list[float], p: float) -> Union[float, None]:
+    """Get the p-th percentile of sorted_values in milliseconds, using the nearest-rank method."""
+    if len(sorted_values) == 0:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)] * 1000
+
+
+class OAuthStubHandler(BaseHTTPRequestHandler):
+    """Stands in for Discord. The authorization code is the Discord ID to log in as, and is also the access token."""
+
+    def do_POST(self):
+        if self.path != "/api/oauth2/token":
+            self._send(404, {})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        code = parse_qs(body).get("code", [None])[0]
+        self._send(200, {"access_token": code, "token_type": "Bearer"})
+
+    def do_GET(self):
+        if self.path != "/api/v10/users/@me":
+            self._send(404, {})
+            return
+        self._send(200, {"id": self.headers["authorization"].split(" ", 1)[1]})
+
+    def _send(self, code: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_servers(root: str, count: int, user_names: list[str], log_rate: float, modpack_kb: int) -> list[str]:
+    """Create the server folders.
+
+    Returns:
+        The names of the created servers.
+    """
+    folder = os.path.join(root, SERVER_FOLDER_NAME)
+    os.makedirs(folder)
+    with open(os.path.join(folder, "mc_server_web.txt"), "w") as f:
+        f.write(",".join(user_names))
+    names = []
+    for i in range(count):
+        server_folder = os.path.join(folder, f"server{i}")
+        os.makedirs(server_folder)
+        # Each server is visible to every user, and admin'd by one of them
+        with open(os.path.join(server_folder, "mc_server_web.txt"), "w") as f:
+            f.write(",".join(user_names) + "\n" + user_names[i % len(user_names)])
+        with open(os.path.join(server_folder, "Bench_modpack.zip"), "wb") as f:
+            f.write(os.urandom(modpack_kb * 1024))
+        command = f'"{sys.executable}" "{FAKE_SERVER_PATH}" --log-rate {log_rate}'
+        if sys.platform == "win32":
+            with open(os.path.join(server_folder, "run.bat"), "w") as f:
+                f.write(f"@echo off\n{command}\n")
+        else:
+            script_path = os.path.join(server_folder, "run.sh")
+            with open(script_path, "w") as f:
+                f.write(f"#!/bin/sh\nexec {command}\n")
+            os.chmod(script_path, os.stat(script_path).st_mode | stat.S_IEXEC)
+        names.append(f"{SERVER_FOLDER_NAME} - server{i}")
+    return names
+
+
+def log_in(base_url: str, discord_id: str) -> requests.Session:
+    """Log in through the stubbed OAuth flow, the same way a browser would."""
+    session = requests.Session()
+    r = session.get(base_url + "/auth/authorize", allow_redirects=False)
+    state = parse_qs(urlparse(r.headers["Location"]).query)["state"][0]
+    r = session.get(base_url + "/auth/redirect", params={"code": discord_id, "state": state}, allow_redirects=False)
+    if "token" not in session.cookies:
+        raise RuntimeError(f"Failed to log in as {discord_id}: {r.status_code} {r.text}")
+    return session
+
+
+def copy_session(session: requests.Session) -> requests.Session:
+    """requests.Session isn't thread-safe, so every worker gets its own copy."""
+    new_session = requests.Session()
+    new_session.cookies.update(session.cookies)
+    return new_session
+
+
+def scrape_locks(session: requests.Session, base_url: str) -> dict:
+    """Get the lock metrics from /api/metrics.
+
+    Returns:
+        Maps (metric, lock name) to the sum, count and buckets of that lock's histogram.
+    """
+    locks = {}
+    for line in session.get(base_url + "/api/metrics").text.splitlines():
+        match = METRIC_LINE_REGEX.match(line)
+        if match is None:
+            continue
+        metric, part, labels, value = match.groups()
+        labels = dict(LABEL_REGEX.findall(labels))
+        entry = locks.setdefault((metric, labels["lock"]), {"sum": 0.0, "count": 0, "buckets": {}})
+        if part == "bucket":
+            entry["buckets"][labels["le"]] = float(value)
+        else:
+            entry[part] = float(value)
+    return locks
+
+
+def diff_locks(before: dict, after: dict) -> dict:
+    """Summarize lock metrics over the benchmark, taking the p99 from the histogram buckets' upper bounds."""
+    result = {}
+    for (metric, lock), entry in sorted(after.items()):
+        old = before.get((metric, lock), {"sum": 0.0, "count": 0, "buckets": {}})
+        count = entry["count"] - old["count"]
+        total = entry["sum"] - old["sum"]
+        p99 = None
+        for bound, cumulative in entry["buckets"].items():
+            if count > 0 and cumulative - old["buckets"].get(bound, 0) >= 0.99 * count:
+                p99 = bound
+                break
+        result.setdefault(lock, {})[metric] = {
+            "count": count,
+            "total_seconds": total,
+            "mean_ms": total / count * 1000 if count > 0 else None,
+            "p99_le_seconds": p99,
+        }
+    return result
+
+
+class ProcessSampler:
+    """Samples this process's memory and thread count, so soak runs can spot leaks."""
+
+    def __init__(self, interval: float):
+        self.interval: float = interval
+        self.samples: list[tuple[float, int, int]] = []  # Time, RSS and thread count
+        self.stopped: Event = Event()
+        self.process: psutil.Process = psutil.Process()
+        self.thread: Thread = Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        start = time.monotonic()
+        while not self.stopped.is_set():
+            self.samples.append((time.monotonic() - start, self.process.memory_info().rss, self.process.num_threads()))
+            self.stopped.wait(self.interval)
+
+    def summarize(self) -> dict:
+        rss = [sample[1] for sample in self.samples]
+        threads = [sample[2] for sample in self.samples]
+        return {
+            "rss_start": rss[0],
+            "rss_end": rss[-1],
+            "rss_max": max(rss),
+            "threads_start": threads[0],
+            "threads_end": threads[-1],
+            "threads_max": max(threads),
+            "samples": self.samples,
+        }
+
+
+def wait_until(predicate, timeout: float) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def run_worker(worker_id: int, user_session: requests.Session, admin_session: requests.Session, base_url: str,
+               mix: list[tuple[str, int]], steady_servers: list[str], cycle_servers: list[str], end_time: float,
+               stats: dict[str, OperationStats]):
+    rand = random.Random(worker_id)
+    operations = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    etag = None
+    while time.monotonic() < end_time:
+        operation = rand.choices(operations, weights)[0]
+        if operation == "command" and len(steady_servers) == 0 or operation == "cycle" and len(cycle_servers) == 0:
+            continue
+        start = time.perf_counter()
+        try:
+            if operation == "list":
+                # Like the frontend, remember the ETag so unchanged lists come back as 304s
+                headers = {"If-None-Match": etag} if etag is not None else {}
+                r = user_session.post(base_url + "/api/list", json={}, headers=headers)
+                etag = r.headers.get("ETag", etag)
+            elif operation == "command":
+                r = admin_session.post(base_url + "/api/run_command",
+                                       json={"name": rand.choice(steady_servers), "command": f"say {worker_id}"})
+            else:
+                name = rand.choice(cycle_servers)
+                r = user_session.post(base_url + "/api/manage", json={"name": name, "action": "start"})
+                if r.status_code == 400:  # Already running, so stop it instead
+                    r = user_session.post(base_url + "/api/manage", json={"name": name, "action": "stop"})
+            status = r.status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        stats[operation].record(time.perf_counter() - start, status)
+
+
+def print_report(result: dict, previous: Union[dict, None]):
+    print(f"\n{'operation':<10}{'count':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+          f"{'max ms':>10}")
+    for name, op in result["operations"].items():
+        values = [op["p50_ms"], op["p90_ms"], op["p99_ms"], op["max_ms"]]
+        formatted = "".join(f"{v:>10.2f}" if v is not None else f"{'-':>10}" for v in values)
+        print(f"{name:<10}{op['count']:>9}{op['errors']:>8}{op['throughput']:>10.1f}{formatted}")
+        if previous is not None and name in previous["operations"]:
+            old = previous["operations"][name]
+            changes = []
+            for key in ["throughput", "p50_ms", "p99_ms"]:
+                if old[key] and op[key] is not None:
+                    changes.append(f"{key} {(op[key] - old[key]) / old[key] * 100:+.1f}%")
+            print(f"{'':<10}vs previous: {', '.join(changes)}")
+    print(f"\n{'lock':<18}{'acquired':>10}{'wait total s':>14}{'wait mean ms':>14}{'held total s':>14}")
+    for lock, lock_metrics in result["locks"].items():
+        wait = lock_metrics.get("lock_wait_seconds", {})
+        held = lock_metrics.get("lock_held_seconds", {})
+        wait_mean = f"{wait['mean_ms']:>14.3f}" if wait.get("mean_ms") is not None else f"{'-':>14}"
+        print(f"{lock:<18}{wait.get('count', 0):>10.0f}{wait.get('total_seconds', 0):>14.3f}{wait_mean}"
+              f"{held.get('total_seconds', 0):>14.3f}")
+    process = result["process"]
+    print(f"\nRSS {process['rss_start'] / 2 ** 20:.1f} MB -> {process['rss_end'] / 2 ** 20:.1f} MB "
+          f"(max {process['rss_max'] / 2 ** 20:.1f} MB), threads {process['threads_start']} -> "
+          f"{process['threads_end']} (max {process['threads_max']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and soak benchmark for MC Server Web.")
+    parser.add_argument("--servers", type=int, default=10, help="Number of fake servers to create")
+    parser.add_argument("--users", type=int, default=20, help="Number of users to log in")
+    parser.add_argument("--workers", type=int, default=16, help="Number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run for. Use a long duration to soak.")
+    parser.add_argument("--log-rate", type=float, default=10, help="Log lines each fake server writes per second")
+    parser.add_argument("--modpack-kb", type=int, default=64, help="Size of each fake modpack in KB")
+    parser.add_argument("--mix", default="list=80,command=15,cycle=5",
+                        help="Relative weights of each operation: list, command and cycle (start or stop a server)")
+    parser.add_argument("--output", default=None, help="File to save the results to. Defaults to benchmarks/results/.")
+    parser.add_argument("--compare", default=None, help="Results of an earlier run to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated server folders")
+    args = parser.parse_args()
+
+    mix = [(name, int(weight)) for name, weight in (part.split("=") for part in args.mix.split(","))]
+    for name, _ in mix:
+        if name not in ["list", "command", "cycle"]:
+            parser.error(f"Unknown operation {name} in --mix")
+
+    work_dir = tempfile.mkdtemp(prefix="mc-server-web-bench-")
+    user_ids = [ADMIN_DISCORD_ID] + [str(1001 + i) for i in range(args.users)]
+    user_names = ["BenchAdmin"] + [f"User{i}" for i in range(args.users)]
+    server_names = create_servers(work_dir, args.servers, user_names, args.log_rate, args.modpack_kb)
+    with open(os.path.join(work_dir, "user_ids.txt"), "w") as f:
+        f.write(f"{ADMIN_DISCORD_ID}~BenchAdmin\n")
+        f.write("\n".join(f"{discord_id}={name}" for discord_id, name in zip(user_ids[1:], user_names[1:])))
+
+    oauth_stub = ThreadingHTTPServer(("127.0.0.1", 0), OAuthStubHandler)
+    Thread(target=oauth_stub.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{oauth_stub.server_address[1]}"
+
+    os.environ.update({
+        "MC_SERVER_WEB_PORT": "0",
+        "MC_SERVER_WEB_FOLDERS": os.path.join(work_dir, SERVER_FOLDER_NAME),
+        "MC_SERVER_WEB_SCRIPTS": "run.bat" if sys.platform == "win32" else "run.sh",
+        "MC_SERVER_WEB_OAUTH_CLIENT_ID": "bench",
+        "MC_SERVER_WEB_OAUTH_CLIENT_SECRET": "bench",
+        "MC_SERVER_WEB_OAUTH_REDIRECT_URI": "http://127.0.0.1/auth/redirect",
+        "MC_SERVER_WEB_FLASK_SECRET_KEY": "bench",
+    })
+    # config reads user_ids.txt and the datastore from the working directory, and the environment when imported.
+    os.chdir(work_dir)
+    sys.path.insert(0, REPO_DIR)
+    import app
+    import config
+    from waitress.server import create_server
+
+    config.OAUTH_TOKEN_URL = stub_url + "/api/oauth2/token"
+    config.API_ENDPOINT = stub_url + "/api/v10"
+    # Start servers as fast as they're asked for, since the benchmark measures MC Server Web rather than the host.
+    config.startup_queue.max_booting = args.servers
+    config.startup_queue.stagger_seconds = 0
+    config.startup_queue.min_free_memory_mb = 0
+    config_err = config.startup()
+    if config_err:
+        sys.exit(config_err)
+    app.app.secret_key = config.FLASK_SECRET_KEY
+    waitress_server = create_server(app.app, host="127.0.0.1", port=0, threads=config.WAITRESS_THREADS)
+    Thread(target=waitress_server.run, daemon=True).start()
+    base_url = f"http://127.0.0.1:{waitress_server.effective_port}"
+
+    try:
+        login_stats = OperationStats()
+        sessions = []
+        login_start = time.monotonic()
+        for discord_id in user_ids:
+            start = time.perf_counter()
+            sessions.append(log_in(base_url, discord_id))
+            login_stats.record(time.perf_counter() - start, 200)
+        login_duration = time.monotonic() - login_start
+        admin_session = sessions[0]
+
+        # Half the servers stay running for commands, the other half are started and stopped by the cycle operation
+        steady_servers = server_names[:len(server_names) // 2]
+        cycle_servers = server_names[len(server_names) // 2:]
+        for name in steady_servers:
+            admin_session.post(base_url + "/api/manage", json={"name": name, "action": "start"})
+        if not wait_until(lambda: all(name in config.running_servers for name in steady_servers), 60):
+            sys.exit("Servers didn't start within 60 seconds!")
+
+        stats = {name: OperationStats() for name, _ in mix}
+        locks_before = scrape_locks(admin_session, base_url)
+        sampler = ProcessSampler(max(1.0, args.duration / 300))
+        sampler.thread.start()
+        print(f"Running {args.workers} workers against {args.servers} servers for {args.duration} seconds...")
+        start = time.monotonic()
+        end_time = start + args.duration
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            for worker_id in range(args.workers):
+                user_session = copy_session(sessions[1 + worker_id % args.users] if args.users > 0 else admin_session)
+                executor.submit(run_worker, worker_id, user_session, copy_session(admin_session), base_url, mix,
+                                steady_servers, cycle_servers, end_time, stats)
+        duration = time.monotonic() - start
+        sampler.stopped.set()
+        sampler.thread.join()
+        locks_after = scrape_locks(admin_session, base_url)
+
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                    text=True).stdout.strip()
+        except OSError:
+            commit = None
+        operations = {name: op_stats.summarize(duration) for name, op_stats in stats.items()}
+        operations["login"] = login_stats.summarize(login_duration)  # Logins all happen before the benchmark starts
+        result = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": commit,
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "args": vars(args),
+            "duration": duration,
+            "total_throughput": sum(op_stats.summarize(duration)["throughput"] for op_stats in stats.values()),
+            "operations": operations,
+            "locks": diff_locks(locks_before, locks_after),
+            "process": sampler.summarize(),
+        }
+    finally:
+        with config.running_servers_lock:
+            still_running = list(config.running_servers.values())
+        for server in still_running:
+            config.stop_server(server, server.metadata.stop_command)
+        config.shutdown()
+        waitress_server.close()
+        oauth_stub.shutdown()
+        os.chdir(REPO_DIR)
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    previous = None
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+    print_report(result, previous)
+    output = args.output
+    if output is None:
+        os.makedirs(os.path.join(BENCHMARK_DIR, "results"), exist_ok=True)
+        output = os.path.join(BENCHMARK_DIR, "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Stand-in for a Minecraft server, used by benchmark.py.
+
+Writes Minecraft-style lines to logs/latest.log (and stdout) at a fixed rate, logs every command it reads from stdin,
+and exits cleanly when it reads the stop command.
+
+Usage: python fake_server.py [--log-rate LINES_PER_SECOND] [--stop-command COMMAND]
+"""
+import argparse
+import os
+import sys
+import time
+from threading import Lock, Thread
+
+log_lock = Lock()
+
+
+def log(f, message: str):
+    line = f"[{time.strftime('%H:%M:%S')}] [Server thread/INFO]: {message}\n"
+    with log_lock:
+        f.write(line)
+        f.flush()
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def write_ticks(f, log_rate: float):
+    tick = 0
+    while True:
+        time.sleep(1 / log_rate)
+        tick += 1
+        log(f, f"Tick {tick}: 0 players online, {tick % 20} chunks saved")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log-rate", type=float, default=10, help="Log lines written per second")
+    parser.add_argument("--stop-command", default="stop")
+    args = parser.parse_args()
+
+    os.makedirs("logs", exist_ok=True)
+    with open(os.path.join("logs", "latest.log"), "w") as f:
+        log(f, "Starting minecraft server version 1.20.4")
+        log(f, "Done (0.001s)! For help, type \"help\"")
+        if args.log_rate > 0:
+            Thread(target=write_ticks, args=(f, args.log_rate), daemon=True).start()
+        for line in sys.stdin:
+            command = line.strip()
+            log(f, f"[Server] {command}")
+            if command == args.stop_command:
+                log(f, "Stopping server")
+                return
+        # stdin was closed without a stop command, which a real server would also treat as a stop
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,40 @@
-import json
 import logging
 import os
-import re
+import secrets
+import subprocess
+from subprocess import DEVNULL, PIPE, STDOUT, Popen
 import sys
-from threading import Lock
-from copy import deepcopy
+from threading import BoundedSemaphore, Lock
 import time
-from typing import List, Type, Union, Tuple
-
-from Server import Server
-
-MODPACK_REGEX = re.compile(r"^.+_modpack\..+$")
-
-
-def get_env(key: str, typ: Type) -> any:
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import List, Mapping, Type, Union
+
+import metrics
+from AgentClient import AgentClient, RemoteServer
+from Scheduler import Scheduler
+from Server import Server, ServerState
+from BackupManager import BackupManager
+from CommandQueue import CommandQueue
+from CrashSupervisor import CrashSupervisor
+from LifecycleManager import LifecycleManager
+from LogIndexer import LogIndexer
+from ModpackCache import ModpackCache
+from ResourceSampler import ResourceSampler
+from ServerScanner import ServerScanner
+from SessionStore import SessionStore
+from StatusCollector import StatusCollector
+from StartupQueue import StartupQueue
+from StopJob import StopJob
+
+
+def get_env(key: str, typ: Type, default: any = None) -> any:
+    """Get a setting from an environment variable. If it isn't set, default is used, or if there's no default, MC Server
+    Web exits."""
     value = os.getenv(key, default=None)
     if value is None:
+        if default is not None:
+            return default
         logging.critical(f"Environment variable {key} not provided!")
         sys.exit(1)
     if not isinstance(key, typ):
@@ -26,26 +45,138 @@ def get_env(key: str, typ: Type) -> any:
     return value
 
 
+# Whether this is an agent (run_agent.py) managing the servers on its host for a web frontend on another host, rather
+# than the web frontend. Agents don't need the web frontend's settings. Set by run_agent.py.
+IS_AGENT: bool = os.getenv("MC_SERVER_WEB_ROLE", "web") == "agent"
+WEB_ONLY = "" if IS_AGENT else None  # Default for settings only the web frontend needs
+
 # User-Configured Settings
 
+# Agents managing servers on other hosts, as comma-separated name=host:port. The name is shown before the names of
+# that agent's servers. Example: "box2=10.0.0.2:25580,box3=10.0.0.3:25580". Leave unset to only manage servers here.
+AGENTS: List[str] = [agent for agent in get_env("MC_SERVER_WEB_AGENTS", str, "").split(",") if agent != ""]
+# Secret shared by the web frontend and its agents, which they authenticate each other with. Anything that can reach an
+# agent's port and knows this can control its servers, so keep agents on a private network. Example: The output of
+# secrets.token_urlsafe(32)
+AGENT_TOKEN: str = get_env("MC_SERVER_WEB_AGENT_TOKEN", str, None if IS_AGENT or len(AGENTS) > 0 else "")
+# Address and port an agent listens for the web frontend on. Example: "0.0.0.0" and "25580".
+AGENT_HOST: str = get_env("MC_SERVER_WEB_AGENT_HOST", str, "0.0.0.0")
+AGENT_PORT: int = get_env("MC_SERVER_WEB_AGENT_PORT", int, 25580)
 # Port to run this web server on. Example: "25565".
-PORT: int = get_env("MC_SERVER_WEB_PORT", int)
-# Comma-separated list of all folders that servers are contained in. Example: "C:\MyDir1,C:\MyDir2"
-SERVER_FOLDERS: List[str] = get_env("MC_SERVER_WEB_FOLDERS", str).split(",")
+PORT: int = get_env("MC_SERVER_WEB_PORT", int, 0 if IS_AGENT else None)
+# Comma-separated list of all folders that servers are contained in. Example: "C:\MyDir1,C:\MyDir2". Can be left unset
+# if all servers are managed by agents.
+SERVER_FOLDERS: List[str] = [folder for folder in get_env("MC_SERVER_WEB_FOLDERS", str, "" if len(AGENTS) > 0 else None)
+                             .split(",") if folder != ""]
 # Comma-separated list of all names of potential startup scripts to start the server. Example: "run.bat,start.bat"
-STARTUP_SCRIPT_NAMES: List[str] = get_env("MC_SERVER_WEB_SCRIPTS", str).split(",")
+STARTUP_SCRIPT_NAMES: List[str] = get_env("MC_SERVER_WEB_SCRIPTS", str, "" if len(AGENTS) > 0 else None).split(",")
 # OAuth Client ID from the Discord application.
-OAUTH_CLIENT_ID = get_env("MC_SERVER_WEB_OAUTH_CLIENT_ID", str)
+OAUTH_CLIENT_ID = get_env("MC_SERVER_WEB_OAUTH_CLIENT_ID", str, WEB_ONLY)
 # OAuth Client Secret from the Discord application.
-OAUTH_CLIENT_SECRET = get_env("MC_SERVER_WEB_OAUTH_CLIENT_SECRET", str)
+OAUTH_CLIENT_SECRET = get_env("MC_SERVER_WEB_OAUTH_CLIENT_SECRET", str, WEB_ONLY)
 # Redirect URI. Example: http://mydomain.com/auth/redirect
-OAUTH_REDIRECT_URI = get_env("MC_SERVER_WEB_OAUTH_REDIRECT_URI", str)
+OAUTH_REDIRECT_URI = get_env("MC_SERVER_WEB_OAUTH_REDIRECT_URI", str, WEB_ONLY)
 # Flask secret key. Can be anything. Example: The output of secrets.token_urlsafe(32)
-FLASK_SECRET_KEY = get_env("MC_SERVER_WEB_FLASK_SECRET_KEY", str)
-# Datastore file name. Used to store the token_to_discord_id map to persist between server restarts.
+FLASK_SECRET_KEY = get_env("MC_SERVER_WEB_FLASK_SECRET_KEY", str, WEB_ONLY)
+# Datastore file name. Used to store login sessions to persist between server restarts.
 DATASTORE_NAME = "datastore.json"
+# Seconds a login lasts before the user has to log in again
+SESSION_TTL = 60 * 60 * 24 * 30
+# Seconds between each background write of changed login sessions to the datastore
+SESSION_FLUSH_INTERVAL = 5
 # Maximum number of lines to send from the log to clients
 MAX_LOG_LINES = 10
+# Seconds between each background check of running servers for liveness and new log output
+POLL_INTERVAL = 3
+# Seconds between each background check of the server folders for added, removed or changed servers
+DISCOVERY_INTERVAL = 30
+# Number of threads waitress serves requests with. Every open log stream and modpack download occupies one of these.
+WAITRESS_THREADS = 20
+# Maximum number of log streams open at once. Keep MAX_STREAMS + MAX_MODPACK_DOWNLOADS below WAITRESS_THREADS so API
+# requests always have threads left.
+MAX_STREAMS = 10
+# Maximum number of modpack downloads at once. Further downloads are told to retry later.
+MAX_MODPACK_DOWNLOADS = 4
+# Whether to hand modpack downloads off to a reverse proxy in front of MC Server Web with the X-Sendfile header, so the
+# proxy can send the file itself. Only enable this if the proxy is configured for it.
+USE_X_SENDFILE = False
+# Seconds between keepalive messages on an idle log stream. This is also how quickly a closed tab frees its thread.
+STREAM_KEEPALIVE = 15
+# Seconds a log stream stays open before the client is told to reconnect, so streams can't hold threads forever.
+STREAM_MAX_SECONDS = 300
+
+# Maximum number of commands that can be sent in one batch
+MAX_BATCH_COMMANDS = 200
+# Maximum number of commands waiting to be sent to a server. Further commands are turned away until it catches up.
+MAX_PENDING_COMMANDS = 100
+# Seconds a server can go without accepting a command before further commands are turned away
+COMMAND_WRITE_TIMEOUT = 5
+
+# Seconds to wait for a server to exit after sending it the stop command
+STOP_TIMEOUT = 10
+# Extra seconds given to a server that's still running Java after STOP_TIMEOUT, in case it's still saving
+STOP_SAVE_GRACE = 10
+
+# Seconds between each sample of running servers' CPU, memory, thread, handle and disk usage
+TELEMETRY_INTERVAL = 10
+# Number of resource usage samples kept for each running server
+TELEMETRY_HISTORY = 360
+# Seconds between each background ping of running servers for their player counts, MOTD and version
+STATUS_INTERVAL = 10
+# Seconds to wait for a server to answer a ping
+STATUS_TIMEOUT = 3
+# Whether to capture server output directly rather than reading the log file. Captured output (including responses to
+# commands) shows up immediately, but servers that print something other than their log to the console will show that
+# instead.
+CAPTURE_OUTPUT = False
+
+# Whether to index server logs (including rotated ones) in the background, so admins can search them
+LOG_INDEX_ENABLED = True
+# Folder the log indexes are kept in, one database per server
+LOG_INDEX_FOLDER = "log_index"
+# Seconds between each background indexing of new log output
+LOG_INDEX_INTERVAL = 60
+
+# Seconds between each check of servers' lifecycle policies (mc_server_web_lifecycle.txt) for idle servers to stop
+# and scheduled starts, stops and backups
+LIFECYCLE_INTERVAL = 20
+
+# Folder backups are kept in. Backups of every server share it, so files that are the same across servers (such as
+# mods) are only stored once.
+BACKUP_FOLDER = "backups"
+# Number of backups kept for each server. Older backups are deleted after each new one. 0 to keep every backup.
+BACKUP_KEEP = 10
+# Megabytes per second a backup reads server files at, at most, so it doesn't slow running servers down. None for no
+# limit.
+BACKUP_READ_MB_PER_SECOND = 50
+# Seconds to wait for a running server to save its world before backing it up anyway
+BACKUP_SAVE_TIMEOUT = 60
+# Files and folders directly in a server's folder that aren't backed up, or touched when restoring a backup
+BACKUP_EXCLUDE = ["logs", "crash-reports"]
+
+# Whether to restart servers that crash (exit on their own with a non-zero exit code)
+AUTO_RESTART = True
+# Seconds to wait before restarting a server that crashed. This doubles with each further crash in CRASH_LOOP_WINDOW.
+RESTART_BACKOFF = 10
+# Maximum seconds to wait before restarting a server that crashed
+MAX_RESTART_BACKOFF = 600
+# A server that crashes this many times within CRASH_LOOP_WINDOW seconds isn't restarted until it's started by hand
+CRASH_LOOP_LIMIT = 5
+CRASH_LOOP_WINDOW = 60 * 30
+
+# Maximum number of servers booting at once. Servers queued to start beyond this wait for earlier ones to boot.
+MAX_CONCURRENT_STARTS = 1
+# Seconds a server counts as booting after it's started
+BOOT_SECONDS = 120
+# Minimum seconds between starting one server and starting the next
+START_STAGGER_SECONDS = 30
+# Megabytes of memory that must be available on the host before another server is started
+MIN_FREE_MEMORY_MB = 4096
+
+# Seconds between each check by an agent for changes to send to the web frontend
+AGENT_PUSH_INTERVAL = 0.5
+# Seconds the web frontend waits for an agent to answer a request
+AGENT_CALL_TIMEOUT = 15
 
 # End User-Configured Settings
 
@@ -55,15 +186,52 @@ API_ENDPOINT = "https://discord.com/api/v10"
 ALLOWED_USERS: dict[str, str] = {}  # Key is Discord ID, value is friendly name
 ADMINS: dict[str, str] = {}  # Same format as ALLOWED_USERS
 WHITELIST_FILE_NAME = "mc_server_web.txt"
-
-token_to_discord_id: dict[str, str] = {}  # Key is tokens sent to web clients, value is Discord IDs
-last_datastore_write: int = 0
-servers: List[Server] = []
-servers_lock = Lock()
+# Flags servers are started with, so they don't open a console window. These only exist on Windows, so agents on other
+# platforms go without.
+CREATION_FLAGS = getattr(subprocess, "CREATE_NO_WINDOW", 0) | getattr(subprocess, "NORMAL_PRIORITY_CLASS", 0)
+
+sessions = SessionStore(DATASTORE_NAME, SESSION_TTL)  # Maps tokens sent to web clients to Discord IDs
+servers: Mapping[str, Server] = MappingProxyType({})  # Key is server name. Replaced wholesale by load_servers().
+servers_lock = metrics.TimedLock("servers")  # Used so only one thread can reload the servers at a time.
+# Key is a user's friendly name, value maps the name of every server that user can see to whether they're an admin of
+# it. Rebuilt whenever the servers (and so their whitelists) are reloaded.
+visibility_index: Mapping[str, Mapping[str, bool]] = MappingProxyType({})
+admin_index: Mapping[str, frozenset[str]] = MappingProxyType({})  # Key is a user's friendly name, value is the servers they're admin of
 running_servers: dict[str, Server] = {}
-running_servers_lock = Lock()  # Used so only one request can modify the running_servers dict.
-last_server_poll: int = 0
-start_server_lock = Lock()  # Lock to prevent multiple threads from starting a server at close to the exact same time.
+running_servers_lock = metrics.TimedLock("running_servers")  # Used so only one request can modify the running_servers dict.
+# Held for a whole poll, so a server that exited is cleaned up before anything else (such as launch_server()) can poll
+poll_lock = Lock()
+# Immutable view of every server's state, rebuilt by the background poller. Replaced wholesale, so it can be read
+# without taking any lock.
+snapshot: Mapping[str, ServerState] = MappingProxyType({})
+snapshot_lock = Lock()  # Used so only one thread can publish a snapshot at a time.
+# Bumped whenever the snapshot or the servers change, so clients can tell if anything changed since they last asked.
+# BOOT_ID keeps versions from before a restart from matching versions after it.
+BOOT_ID = secrets.token_hex(4)
+snapshot_version: int = 0
+servers_version: int = 0
+scheduler = Scheduler("mc-server-web-poller")
+stream_slots = BoundedSemaphore(MAX_STREAMS)  # Limits open log streams so they can't starve the waitress threads.
+scanner = ServerScanner(SERVER_FOLDERS, STARTUP_SCRIPT_NAMES, WHITELIST_FILE_NAME, MAX_LOG_LINES, TELEMETRY_HISTORY)
+resource_sampler = ResourceSampler()
+status_collector = StatusCollector(STATUS_TIMEOUT)
+lifecycle_manager = LifecycleManager()
+backup_manager = BackupManager(BACKUP_FOLDER, BACKUP_KEEP,
+                               BACKUP_READ_MB_PER_SECOND * 1024 * 1024 if BACKUP_READ_MB_PER_SECOND is not None else None,
+                               BACKUP_SAVE_TIMEOUT, BACKUP_EXCLUDE)
+crash_supervisor = CrashSupervisor(RESTART_BACKOFF, MAX_RESTART_BACKOFF, CRASH_LOOP_LIMIT, CRASH_LOOP_WINDOW)
+log_indexer = LogIndexer(LOG_INDEX_FOLDER)
+# Indexing months of rotated logs can take a while the first time, so it gets its own thread rather than holding up
+# the poller.
+index_scheduler = Scheduler("mc-server-web-log-indexer")
+modpack_cache = ModpackCache()
+download_slots = BoundedSemaphore(MAX_MODPACK_DOWNLOADS)  # Limits modpack downloads so they can't starve the API.
+stop_executor = ThreadPoolExecutor(thread_name_prefix="mc-server-web-stop")
+stop_jobs: dict[str, StopJob] = {}  # Key is job ID
+stop_jobs_lock = Lock()
+# Lock to prevent multiple threads from starting a server at close to the exact same time.
+start_server_lock = metrics.TimedLock("start_server")
+agents: dict[str, AgentClient] = {}  # Key is agent name. Filled in by startup().
 
 # Expand vars for server folders
 for i in range(len(SERVER_FOLDERS)):
@@ -71,126 +239,334 @@ for i in range(len(SERVER_FOLDERS)):
 
 
 def get_server_by_name(name: str) -> Union[Server, None]:
-    with servers_lock:
-        return get_server_by_name_no_lock(name)
+    return servers.get(name)
+
+
+def get_remote_servers() -> dict[str, RemoteServer]:
+    """Get every server managed by an agent on another host, keyed by name."""
+    remote_servers = {}
+    for agent in agents.values():
+        remote_servers.update(agent.get_servers())
+    return remote_servers
+
+
+def get_remote_server(name: str) -> Union[RemoteServer, None]:
+    return get_remote_servers().get(name)
 
 
-def get_server_by_name_no_lock(name: str) -> Union[Server, None]:
-    for server in servers:
-        if server.name == name:
-            return server
-    return None
+def get_running_servers() -> dict[str, Union[Server, RemoteServer]]:
+    """Get every running server, both here and on agents, keyed by name."""
+    with running_servers_lock:
+        running: dict[str, Union[Server, RemoteServer]] = dict(running_servers)
+    running.update({name: server for name, server in get_remote_servers().items() if server.is_running()})
+    return running
 
 
-def get_whitelisted_and_admin_users(path: str) -> Tuple[list[str], list[str]]:
-    """Get all whitelisted and admin users in the file.
+def get_visible_servers(name: Union[str, None]) -> Mapping[str, bool]:
+    """Get the servers a user can see.
 
     Args:
-        path: File path to whitelist file. It's okay if the file does not exist.
+        name: Friendly name of the user.
 
     Returns:
-        A list of whitelisted users and admin users in that order, or an empty list if the file wasn't found.
+        A mapping from the name of each server the user can see to whether the user is an admin for that server.
+        Does not account for global admins being admins of every server.
     """
-    if not os.path.exists(path) or not os.path.isfile(path):
-        return [], []
-    with open(path, "r") as f:
-        lines = f.readlines()
-        if len(lines) == 0:
-            return [], []
-        elif len(lines) == 1:
-            return lines[0].strip().split(","), []
-        else:
-            return lines[0].strip().split(","), lines[1].split(",")
-
-
-def load_servers():
-    with servers_lock:
-        with running_servers_lock:
-            servers.clear()
-            currently_running = list(running_servers.values())
-            for cr in currently_running:
-                servers.append(cr)
-            for folder in SERVER_FOLDERS:
-                folder_whitelisted_users, folder_admin_users = get_whitelisted_and_admin_users(os.path.join(folder, WHITELIST_FILE_NAME))
-                for f in os.listdir(folder):
-                    server_folder = os.path.join(folder, f)
-                    if os.path.isdir(server_folder):
-                        file_whitelisted_users, file_admin_users = get_whitelisted_and_admin_users(os.path.join(folder, f, WHITELIST_FILE_NAME))
-                        admins = list(set(deepcopy(folder_admin_users + file_admin_users)))
-                        users = list(set(deepcopy(folder_whitelisted_users + file_whitelisted_users + admins)))
-                        modpack_path = find_modpack_file_path(os.path.join(folder, f))
-                        new_server = Server(id_in=f, folder_path=server_folder, users=users, admins=admins,
-                                            modpack_path=modpack_path)
-                        if get_server_by_name_no_lock(new_server.name) is None:
-                            servers.append(new_server)
-
-
-def find_modpack_file_path(server_folder: str) -> Union[str, None]:
-    for f in os.listdir(server_folder):
-        if MODPACK_REGEX.match(f):
-            return os.path.join(server_folder, f)
-    return None
-
-
-def maybe_poll_running_servers(force_poll=False):
-    global last_server_poll
-    current_time = time.time()
-    if current_time - last_server_poll > 3 or force_poll:
-        last_server_poll = current_time
+    return visibility_index.get(name, MappingProxyType({}))
+
+
+def get_administered_servers(name: Union[str, None]) -> frozenset[str]:
+    """Get the names of the servers a user is admin for. Does not account for global admins."""
+    return admin_index.get(name, frozenset())
+
+
+def build_visibility_index(all_servers: Mapping[str, Union[Server, RemoteServer]]) -> Mapping[str, Mapping[str, bool]]:
+    index: dict[str, dict[str, bool]] = {}
+    for server in all_servers.values():
+        for user in server.users:
+            index.setdefault(user, {})[server.name] = user in server.admins
+    # Global admins can see every server, but are only marked as admin of the servers they're admin for.
+    for admin_name in ADMINS.values():
+        index[admin_name] = {server.name: admin_name in server.admins for server in all_servers.values()}
+    return MappingProxyType({user: MappingProxyType(visible) for user, visible in index.items()})
+
+
+def build_admin_index(index: Mapping[str, Mapping[str, bool]]) -> Mapping[str, frozenset[str]]:
+    return MappingProxyType({user: frozenset(name for name, is_admin in visible.items() if is_admin)
+                             for user, visible in index.items()})
+
+
+def load_servers(full: bool = False):
+    """Discover servers in the server folders and swap them in.
+
+    Args:
+        full: Whether to re-read every folder and whitelist, rather than only the ones that changed since the last load.
+    """
+    global servers
+    with metrics.timed("load_servers_seconds"), servers_lock:
+        if full:
+            scanner.invalidate()
+        new_servers, changed = scanner.scan()
         with running_servers_lock:
-            to_remove = []
+            # A running server's folder may have changed since it started, in which case the scanner built a new Server
+            # for it. Hand the new metadata over, so the running server follows the right log file and so on.
             for name, running_server in running_servers.items():
+                scanned = new_servers.get(name)
+                if scanned is not None and scanned is not running_server:
+                    running_server.metadata = scanned.metadata
+            if not changed:
+                return
+            for name, server in new_servers.items():
+                old_server = servers.get(name)
+                if old_server is not None and old_server is not server:
+                    server.inherit(old_server)
+                    startup_queue.replace(old_server, server)
+            # Keep the Server instances of running servers, since they own the running process.
+            new_servers.update(running_servers)
+            servers = MappingProxyType(new_servers)
+        rebuild_indexes()
+    for server in new_servers.values():
+        if server.modpack_path is not None:
+            modpack_cache.refresh(server.modpack_path)
+
+
+def rebuild_indexes():
+    """Rebuild the visibility and admin indexes from the servers here and on agents. Call with servers_lock held."""
+    global visibility_index, admin_index, servers_version
+    visibility_index = build_visibility_index({**servers, **get_remote_servers()})
+    admin_index = build_admin_index(visibility_index)
+    servers_version += 1
+
+
+def on_agent_change(servers_changed: bool):
+    """Called by an AgentClient whenever its servers change.
+
+    Args:
+        servers_changed: Whether servers were added or removed, or their users changed.
+    """
+    if servers_changed:
+        with servers_lock:
+            rebuild_indexes()
+    publish_snapshot()
+
+
+def poll_running_servers():
+    """Check running servers for liveness, read their new log output, then publish a new snapshot."""
+    with metrics.timed("poll_running_servers_seconds"), poll_lock:
+        with running_servers_lock:
+            exited = []
+            for name, running_server in list(running_servers.items()):
                 process = running_server.process
-                if process is None or process.poll() is not None:
-                    to_remove.append(name)
-            for name in to_remove:
-                running_servers[name].on_stop()
-                del running_servers[name]
-            for name, running_server in running_servers.items():
-                logs_path = os.path.join(running_server.folder_path, "logs")
-                custom_logs_file = os.path.join(running_server.folder_path, "log_location.txt")
-                if os.path.isfile(custom_logs_file):
-                    try:
-                        with open(custom_logs_file, "r") as f:
-                            extra_path = f.readline().strip().split("/")
-                            log_path = os.path.join(running_server.folder_path, *extra_path)
-                    except OSError:
-                        pass
-                else:
-                    if os.path.isdir(logs_path):
-                        log_path = os.path.join(logs_path, "latest.log")
-                if os.path.isfile(log_path):
-                    with open(log_path, "r") as f:
-                        lines = f.readlines()
-                        if len(lines) >= MAX_LOG_LINES:
-                            lines = lines[-MAX_LOG_LINES:]
-                        running_server.set_log("".join(lines))
-
-
-def maybe_write_datastore():
-    global last_datastore_write
-    current_time = time.time()
-    if current_time - last_datastore_write > 10:
-        last_datastore_write = current_time
-        with open(DATASTORE_NAME, "w") as f:
-            f.write(json.dumps(token_to_discord_id))
-
-
-def name_from_token(token: str) -> Union[str, None]:
-    if token not in token_to_discord_id:
-        return None
-    discord_id = token_to_discord_id[token]
-    if discord_id not in ALLOWED_USERS:
-        return None
-    name = ALLOWED_USERS[discord_id]
-    return name
-
-
-def is_admin(token: str) -> bool:
-    if token not in token_to_discord_id:
-        return False
-    discord_id = token_to_discord_id[token]
-    return discord_id in ADMINS
+                # Servers being stopped by a StopJob are cleaned up by that job once it's done.
+                if (process is None or process.poll() is not None) and running_server.stop_job_id is None:
+                    exited.append(running_server)
+                    del running_servers[name]
+            still_running = list(running_servers.values())
+        # Cleaning up reads the log of servers that crashed, so it happens outside the lock too.
+        crashed = [server for server in exited if server.on_stop()]
+        metrics.inc("server_crashes_total", len(crashed))
+        if AUTO_RESTART:
+            for server in crashed:
+                crash_supervisor.on_crash(server)
+        # Log I/O happens outside the lock so it never holds up requests that need running_servers.
+        for running_server in still_running:
+            running_server.poll_log()
+        publish_snapshot()
+
+
+def sample_resources():
+    with running_servers_lock:
+        still_running = list(running_servers.values())
+    with metrics.timed("sample_resources_seconds"):
+        resource_sampler.sample(still_running)
+
+
+def collect_status():
+    with running_servers_lock:
+        still_running = list(running_servers.values())
+    status_collector.collect(still_running)
+
+
+def index_logs():
+    with running_servers_lock:
+        current_servers = {**servers, **running_servers}
+    with metrics.timed("index_logs_seconds"):
+        log_indexer.index(current_servers.values())
+
+
+def publish_snapshot():
+    global snapshot, snapshot_version
+    with running_servers_lock:
+        current_servers = {**servers, **running_servers}
+    new_snapshot = {name: server.get_state() for name, server in current_servers.items()}
+    new_snapshot.update({name: server.state for name, server in get_remote_servers().items()})
+    with snapshot_lock:
+        if new_snapshot != snapshot:
+            # Snapshot first, then version. Readers read the version before the snapshot, so they can pair an old
+            # version with a new snapshot (costing the client one extra full response), but never the other way around.
+            snapshot = MappingProxyType(new_snapshot)
+            snapshot_version += 1
+
+
+def get_version() -> str:
+    """Get the current version of the servers and their states. Read this before reading the snapshot."""
+    return f"{BOOT_ID}-{servers_version}-{snapshot_version}"
+
+
+def stop_server(server: Server, stop_command: str) -> StopJob:
+    """Start stopping a server in the background.
+
+    Args:
+        server: The running server to stop.
+        stop_command: Command to send to the server to make it stop.
+
+    Returns:
+        The job stopping the server. If the server was already being stopped, this is the existing job.
+    """
+    with stop_jobs_lock:
+        if server.stop_job_id in stop_jobs:
+            return stop_jobs[server.stop_job_id]
+        # Forget jobs that finished more than 10 minutes ago
+        current_time = time.time()
+        old_jobs = [job_id for job_id, job in stop_jobs.items() if job.is_done() and current_time - job.finished_at > 600]
+        for job_id in old_jobs:
+            del stop_jobs[job_id]
+        server.stop_requested = True
+        job = StopJob(server, stop_command, STOP_TIMEOUT, STOP_SAVE_GRACE, finish_stop)
+        stop_jobs[job.id] = job
+        server.stop_job_id = job.id
+    stop_executor.submit(job.run)
+    return job
+
+
+def finish_stop(server: Server):
+    with running_servers_lock:
+        server.on_stop()
+        if running_servers.get(server.name) is server:
+            del running_servers[server.name]
+    server.stop_job_id = None
+    publish_snapshot()
+
+
+def launch_server(server: Server) -> str:
+    """Start a server's process. Called by the startup_queue once the server is admitted.
+
+    Returns:
+        An empty string if the server was started or an error message if it wasn't.
+    """
+    with metrics.timed("launch_server_seconds"), start_server_lock:
+        poll_running_servers()
+        if server.name in running_servers:
+            return ""
+        if backup_manager.is_restoring(server):
+            return "Server is being restored from a backup."
+        script_path = server.metadata.script_path
+        if script_path is None:
+            return "Server does not contain a startup script."
+        try:
+            # stdout and stderr MUST be sent somewhere that's always drained. From testing:
+            # Vanilla 1.20.4 servers don't boot if stdout and stderr aren't sent somewhere
+            # Forge 1.20.1 servers don't boot if stdout or stderr are sent to PIPE and nothing reads from it
+            # Haven't checked whether "stdout and stderr" is an "or" instead.
+            # When capturing output, both go to one PIPE that an OutputCapture thread reads from continuously.
+            args = [script_path]
+            if script_path.endswith(".ps1"):
+                args = ["powershell.exe", script_path]
+            output = PIPE if CAPTURE_OUTPUT else DEVNULL
+            errors = STDOUT if CAPTURE_OUTPUT else DEVNULL
+            p = Popen(args, cwd=server.folder_path, stdin=PIPE, stdout=output, stderr=errors,
+                      creationflags=CREATION_FLAGS, universal_newlines=True,
+                      errors="replace")
+            server.on_start(p, CommandQueue(p.stdin, MAX_PENDING_COMMANDS, COMMAND_WRITE_TIMEOUT,
+                                            server.on_command_written, server.id))
+        except FileNotFoundError:
+            return "Failed to start server!"
+        if p.poll():
+            return "Failed to start server!"
+        with running_servers_lock:
+            running_servers[server.name] = server
+    publish_snapshot()
+    logging.info(f"Started server {server.name}")
+    return ""
+
+
+# Servers waiting to be started. Defined here rather than with the other globals since it needs launch_server().
+startup_queue = StartupQueue(launch_server, publish_snapshot, MAX_CONCURRENT_STARTS, BOOT_SECONDS, START_STAGGER_SECONDS,
+                             MIN_FREE_MEMORY_MB)
+
+
+def manage_server(server: Server, action: str) -> tuple[dict, int]:
+    """Start or stop a server, as asked for through /api/manage (or by the web frontend, if this is an agent).
+
+    Args:
+        server: The server to manage.
+        action: "start" to queue the server to start, or "stop" to stop it, take it out of the start queue or cancel its
+            restart after a crash.
+
+    Returns:
+        The response to send, and its status code.
+    """
+    if action == "start":
+        poll_running_servers()
+        if server.name in running_servers:
+            return {"message": f"Server {server.name} already running!"}, 400
+        if backup_manager.is_restoring(server):
+            return {"message": f"Server {server.name} is being restored from a backup!"}, 409
+        # Starting a server by hand gives it a fresh start, even if it was stuck in a crash loop
+        crash_supervisor.reset(server)
+        position = startup_queue.enqueue(server)
+        return {"message": "Server queued to start!", "position": position}, 202
+    elif action == "stop":
+        restart_cancelled = crash_supervisor.cancel(server)
+        if startup_queue.cancel(server):
+            return {"message": "Server removed from the start queue!"}, 200
+        if restart_cancelled:
+            publish_snapshot()
+            return {"message": "Server will no longer be restarted!"}, 200
+        running_server = running_servers.get(server.name)
+        if running_server is None:
+            return {"message": f"Server {server.name} not running!"}, 400
+        job = stop_server(running_server, running_server.metadata.stop_command)
+        return {"message": "Stopping server...", "job_id": job.id}, 202
+    return {"message": "Invalid server action!"}, 400
+
+
+def get_stop_job(job_id: str) -> Union[StopJob, None]:
+    with stop_jobs_lock:
+        return stop_jobs.get(job_id)
+
+
+def manage_lifecycle():
+    """Stop idle servers, and start, stop and back up servers on schedule, according to their lifecycle policies."""
+    with running_servers_lock:
+        running = dict(running_servers)
+    to_start, to_stop, to_back_up = lifecycle_manager.check(servers, running)
+    for server in to_back_up:
+        logging.info(f"Backing up server {server.name} because of its lifecycle policy")
+        backup_manager.back_up(server)
+    for server in to_stop:
+        logging.info(f"Stopping server {server.name} because of its lifecycle policy")
+        stop_server(server, server.metadata.stop_command)
+    for server in to_start:
+        logging.info(f"Starting server {server.name} because of its lifecycle policy")
+        startup_queue.enqueue(server)
+
+
+def restart_crashed_servers():
+    """Queue the servers the crash_supervisor is done waiting to restart."""
+    for name in crash_supervisor.get_due():
+        with running_servers_lock:
+            server = running_servers.get(name, servers.get(name))
+            if server is None or name in running_servers:
+                continue
+        server.restart_at = None
+        logging.info(f"Restarting server {name} after it crashed")
+        startup_queue.enqueue(server)
+
+
+def flush_sessions():
+    sessions.expire()
+    sessions.flush()
 
 
 def startup() -> str:
@@ -202,11 +578,11 @@ def startup() -> str:
     Returns:
         An empty string if the config file is OK or an error message if it isn't.
     """
-    if len(SERVER_FOLDERS) == 0:
-        return "No server folders configured!"
-    for fol in SERVER_FOLDERS:
-        if not os.path.exists(fol):
-            return f"Server folder {fol} does not exist!"
+    if len(SERVER_FOLDERS) == 0 and len(AGENTS) == 0:
+        return "No server folders or agents configured!"
+    folder_err = check_server_folders()
+    if folder_err:
+        return folder_err
     if not os.path.isfile("user_ids.txt"):
         with open("user_ids.txt", "w") as f:
             f.write("123456789012345678~MeTheAdmin\n876543210987654321=MyFriend")
@@ -232,10 +608,79 @@ def startup() -> str:
         if len(ALLOWED_USERS) == 0:
             return "No allowed users added!"
 
-    if os.path.isfile(DATASTORE_NAME):
-        with open(DATASTORE_NAME, "r") as f:
-            token_to_discord_id.update(json.load(f))
+    sessions.load()
 
-    load_servers()
+    for agent_spec in AGENTS:
+        try:
+            agent_name, address = agent_spec.split("=", 1)
+            host, port = address.rsplit(":", 1)
+            port = int(port)
+        except ValueError:
+            return f"Invalid agent {agent_spec}! Agents should look like name=host:port."
+        if agent_name in agents:
+            return f"Agent name {agent_name} found multiple times!"
+        agents[agent_name] = AgentClient(agent_name, host, port, AGENT_TOKEN, AGENT_CALL_TIMEOUT, on_agent_change)
 
+    scheduler.add_job("flush_sessions", flush_sessions, SESSION_FLUSH_INTERVAL)
+    start_background_work()
+    for agent in agents.values():
+        agent.start()
+
+    return ""
+
+
+def agent_startup() -> str:
+    """Perform startup for an agent, which manages the servers on this host for a web frontend on another host.
+
+    Returns:
+        An empty string if the config file is OK or an error message if it isn't.
+    """
+    if len(SERVER_FOLDERS) == 0:
+        return "No server folders configured!"
+    folder_err = check_server_folders()
+    if folder_err:
+        return folder_err
+    if AGENT_TOKEN == "":
+        return "No agent token configured!"
+    start_background_work()
     return ""
+
+
+def check_server_folders() -> str:
+    for fol in SERVER_FOLDERS:
+        if not os.path.exists(fol):
+            return f"Server folder {fol} does not exist!"
+    return ""
+
+
+def start_background_work():
+    """Load the servers, then start polling them, managing them and so on in the background."""
+    load_servers()
+    publish_snapshot()
+    scheduler.add_job("poll_running_servers", poll_running_servers, POLL_INTERVAL)
+    scheduler.add_job("load_servers", load_servers, DISCOVERY_INTERVAL)
+    scheduler.add_job("sample_resources", sample_resources, TELEMETRY_INTERVAL)
+    scheduler.add_job("collect_status", collect_status, STATUS_INTERVAL)
+    scheduler.add_job("manage_lifecycle", manage_lifecycle, LIFECYCLE_INTERVAL)
+    scheduler.add_job("restart_crashed_servers", restart_crashed_servers, POLL_INTERVAL)
+    scheduler.start()
+    if LOG_INDEX_ENABLED:
+        index_scheduler.add_job("index_logs", index_logs, LOG_INDEX_INTERVAL)
+        index_scheduler.start()
+    startup_queue.start()
+
+
+def shutdown():
+    """Stop all background work started by startup() or agent_startup(). Servers that are being stopped are allowed to
+    finish stopping."""
+    for agent in agents.values():
+        agent.stop()
+    scheduler.stop()
+    index_scheduler.stop()
+    log_indexer.close()
+    startup_queue.stop()
+    stop_executor.shutdown(wait=True)
+    status_collector.shutdown()
+    backup_manager.shutdown()
+    modpack_cache.shutdown()
+    sessions.flush()
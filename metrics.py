@@ -0,0 +1,161 @@
+import cProfile
+import io
+import pstats
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from typing import Union
+
+# Whether to record metrics. Can be switched at runtime. When off, timers and locks do nothing extra.
+enabled: bool = True
+# Whether to profile requests. Can be switched at runtime. Only one request is profiled at a time.
+profiling_enabled: bool = False
+
+PREFIX = "mc_server_web_"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MAX_PROFILES = 20
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts: list[int] = [0] * len(BUCKETS)
+        self.sum: float = 0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class TimedLock:
+    """A Lock that records how long threads wait for it and how long it's held."""
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.lock: Lock = Lock()
+        self.acquired_at: Union[float, None] = None
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if not enabled:
+            return self.lock.acquire(blocking, timeout)
+        start = time.perf_counter()
+        acquired = self.lock.acquire(blocking, timeout)
+        if acquired:
+            self.acquired_at = time.perf_counter()
+            observe("lock_wait_seconds", self.acquired_at - start, lock=self.name)
+        return acquired
+
+    def release(self):
+        acquired_at = self.acquired_at
+        self.acquired_at = None
+        self.lock.release()
+        if acquired_at is not None:
+            observe("lock_held_seconds", time.perf_counter() - acquired_at, lock=self.name)
+
+    def locked(self) -> bool:
+        return self.lock.locked()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+_lock = Lock()
+_counters: dict[str, dict[LabelKey, float]] = {}
+_histograms: dict[str, dict[LabelKey, Histogram]] = {}
+_profile_lock = Lock()
+recent_profiles: deque[tuple[str, str]] = deque(maxlen=MAX_PROFILES)  # Request label and profile output
+
+
+def inc(name: str, value: float = 1, **labels: str):
+    """Increment a counter."""
+    if not enabled:
+        return
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        counter = _counters.setdefault(name, {})
+        counter[key] = counter.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels: str):
+    """Record a value, such as a duration in seconds, into a histogram."""
+    if not enabled:
+        return
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        histogram = _histograms.setdefault(name, {}).get(key)
+        if histogram is None:
+            histogram = _histograms[name][key] = Histogram()
+        histogram.observe(value)
+
+
+@contextmanager
+def timed(name: str, **labels: str):
+    """Record how long the body of the with statement takes into a histogram."""
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def start_profile() -> Union[cProfile.Profile, None]:
+    """Start profiling the current request, if profiling is on and no other request is being profiled."""
+    if not profiling_enabled or not _profile_lock.acquire(blocking=False):
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        _profile_lock.release()  # Some other profiler is already running
+        return None
+    return profile
+
+
+def finish_profile(profile: cProfile.Profile, label: str):
+    profile.disable()
+    _profile_lock.release()
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(30)
+    recent_profiles.append((label, output.getvalue()))
+
+
+def render() -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name, series in sorted(_counters.items()):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for key, value in series.items():
+                lines.append(f"{PREFIX}{name}{_format_labels(key)} {value}")
+        for name, series in sorted(_histograms.items()):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(key + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(key: LabelKey) -> str:
+    if len(key) == 0:
+        return ""
+    escaped = (name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for name, value in key)
+    return "{" + ",".join(escaped) + "}"
@@ -1,5 +1,5 @@
 import Header from "./Header.tsx";
-import {useEffect, useState} from "react";
+import {useEffect, useRef, useState} from "react";
 import ServerSelection from "./ServerSelection.tsx";
 import {Button, Col, Container, Modal, Row} from "react-bootstrap";
 import Console from "./Console.tsx";
@@ -10,9 +10,10 @@ function App() {
     const [isGlobalAdmin, setIsGlobalAdmin] = useState(false);
     const [server, setServer] = useState<string>("");
     const [servers, setServers] = useState<Array<any>>([]);
-    const [log, setLog] = useState<string | null>(null);
+    const [running, setRunning] = useState(false);
     const [didInit, setDidInit] = useState(false);
     const [alert, setAlert] = useState("");
+    const listEtag = useRef<string | null>(null);
 
     async function init() {
         const html = document.getElementById("html");
@@ -30,7 +31,12 @@ function App() {
     }
 
     async function updateServersAndLog() {
-        const [data, status] = await post("/api/list", null, false);
+        const headers : Record<string, string> = listEtag.current !== null ? {"If-None-Match": listEtag.current} : {};
+        const [data, status, respHeaders] = await post("/api/list", null, false, headers);
+        if (status === 304) {
+            return;
+        }
+        listEtag.current = respHeaders.get("ETag");
         if (status === 200) {
             setServers(data.data);
             // Ensures dropdown state is matched to what's shown on first page load
@@ -63,21 +69,21 @@ function App() {
         if (!didInit) {
             init();
         }
-        let newLog = null;
+        let newRunning = false;
         for (const s of servers) {
             if (s.name === server) {
-                if (s.running) {
-                    newLog = s.log;
-                    break;
-                }
+                newRunning = s.running;
+                break;
             }
         }
-        setLog(newLog);
-        const interval = setInterval(updateServersAndLog, 3000);
+        setRunning(newRunning);
+        // Log output and state changes for the selected server are streamed by the console, so the list itself
+        // only needs refreshing occasionally.
+        const interval = setInterval(updateServersAndLog, 15000);
         return () => clearInterval(interval);
     });
 
-    const console = log !== null ? <Console server={server} admin={isAdminForCurrentServer()} log={log}/> : <></>;
+    const console = running ? <Console server={server} admin={isAdminForCurrentServer()} onStateChange={updateServersAndLog}/> : <></>;
     const loggedInPage = name !== null ? (
         <Container fluid>
             <br/>
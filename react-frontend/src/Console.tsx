@@ -1,20 +1,77 @@
-import { Form } from "react-bootstrap";
-import {useState} from "react";
+import {Button, Form} from "react-bootstrap";
+import {useEffect, useRef, useState} from "react";
 import {post} from "./util.ts";
 
 type ConsoleProps = {
-    log : string;
     admin : boolean;
     server : string;
+    onStateChange : () => void;
 }
 
+const OLDER_PAGE_LINES = 100;
+
 const Console = (props : ConsoleProps) => {
     const [command, setCommand] = useState("");
+    const [lines, setLines] = useState<Array<string>>([]);
+    // Lines from scrolling back through the log, shown above the live lines
+    const [olderLines, setOlderLines] = useState<Array<string>>([]);
+    const [hasOlder, setHasOlder] = useState(true);
+    // Where the oldest loaded page starts, and which log file it's from
+    const olderCursor = useRef<{start: number, file_id: string} | null>(null);
+    const scrolledBack = useRef(false);
+
+    useEffect(() => {
+        let maxLines = 10;
+        setOlderLines([]);
+        setHasOlder(true);
+        olderCursor.current = null;
+        scrolledBack.current = false;
+        const source = new EventSource(`/api/stream/${encodeURIComponent(props.server)}`);
+        source.addEventListener("snapshot", (event) => {
+            const data = JSON.parse(event.data);
+            maxLines = data.max_lines;
+            setLines(data.lines);
+        });
+        source.addEventListener("log", (event) => {
+            const newLines : Array<string> = JSON.parse(event.data);
+            // Once scrolled back, keep every live line so there's no gap between the older lines and the live ones
+            setLines((oldLines) => scrolledBack.current ? oldLines.concat(newLines) : oldLines.concat(newLines).slice(-maxLines));
+        });
+        for (const state of ["started", "stopped", "crashed"]) {
+            source.addEventListener(state, () => props.onStateChange());
+        }
+        return () => source.close();
+    }, [props.server]);
+
+    async function loadOlder() {
+        const cursor = olderCursor.current;
+        const data = {"name": props.server, "lines": OLDER_PAGE_LINES, "direction": "backward",
+            ...(cursor === null ? {} : {"cursor": cursor.start, "file_id": cursor.file_id})};
+        const [resp, status] = await post("/api/log_range", data, false);
+        if (status !== 200) {
+            setHasOlder(false);
+            return;
+        }
+        const page = resp.data;
+        if (cursor === null) {
+            // The first page ends at the end of the log, so it replaces the live lines shown so far
+            scrolledBack.current = true;
+            setLines([]);
+        }
+        olderCursor.current = {start: page.start, file_id: page.file_id};
+        setOlderLines((oldLines) => page.lines.concat(oldLines));
+        setHasOlder(page.start > 0);
+    }
 
     async function onKeyDown(event: any) {
         if (event.key === "Enter") {
             if (command !== "") {
-                await post("/api/run_command", {"name": props.server, "command": command}, false);
+                const [resp, status] = await post("/api/run_command", {"name": props.server, "command": command}, false);
+                if (status >= 400) {
+                    // Most likely the server has too many commands waiting, or stopped accepting them
+                    alert(resp.message);
+                    return;
+                }
                 setCommand("");
             }
         }
@@ -25,10 +82,11 @@ const Console = (props : ConsoleProps) => {
         : <></>;
     return (
         <>
-            <span style={{"whiteSpace": "pre-line"}}>{props.log}</span>
+            {hasOlder ? <Button variant="link" size="sm" onClick={loadOlder}>Load older lines</Button> : <></>}
+            <span style={{"whiteSpace": "pre-line"}}>{olderLines.concat(lines).join("\n")}</span>
             {input}
         </>
     )
 }
 
-export default Console;
\ No newline at end of file
+export default Console;
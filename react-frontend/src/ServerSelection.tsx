@@ -11,7 +11,9 @@ type ServerSelectionProps = {
 const ServerSelection = (props : ServerSelectionProps) => {
 
     async function startStopServer() {
-        const action = serverStarted(props.server) ? "stop" : "start";
+        // Stopping a queued server takes it out of the queue, and stopping a crashed server cancels its restart
+        const action = serverStarted(props.server) || serverQueuePosition(props.server) !== null ||
+                       serverRestartPending(props.server) ? "stop" : "start";
         await post("/api/manage", {"name": props.server, "action": action});
         props.onServerStartStop();
     }
@@ -25,6 +27,24 @@ const ServerSelection = (props : ServerSelectionProps) => {
         return false;
     }
 
+    function serverQueuePosition(server: string) : number | null {
+        for (const s of props.servers) {
+            if (s.name === server) {
+                return s.queue_position;
+            }
+        }
+        return null;
+    }
+
+    function serverRestartPending(server: string) : boolean {
+        for (const s of props.servers) {
+            if (s.name === server) {
+                return s.restart_at !== null && s.restart_at !== undefined;
+            }
+        }
+        return false;
+    }
+
     function serverHasModpack(server: string) {
         for (const s of props.servers) {
             if (s.name === server) {
@@ -39,8 +59,17 @@ const ServerSelection = (props : ServerSelectionProps) => {
     }
 
     const serverOpen = serverStarted(props.server);
+    const queuePosition = serverQueuePosition(props.server);
+    const restartPending = serverRestartPending(props.server);
+    let buttonText = serverOpen ? "Stop Server" : "Start Server";
+    if (queuePosition !== null) {
+        buttonText = `Queued (#${queuePosition}), Cancel`;
+    } else if (restartPending) {
+        buttonText = "Crashed, Cancel Restart";
+    }
     const button = <Button onClick={startStopServer}
-                           variant={serverOpen ? "danger" : "success"}>{serverOpen ? "Stop Server" : "Start Server"}</Button>
+                           variant={serverOpen || queuePosition !== null || restartPending ? "danger" : "success"}>
+        {buttonText}</Button>
     const runningServers = props.servers.filter(server => server.running);
     const runningServersHeader = runningServers.length === 0 ? <></> : <h2>Running Servers:</h2>;
     return (
@@ -72,7 +101,9 @@ const ServerSelection = (props : ServerSelectionProps) => {
                 <ListGroup>
                     {runningServers.map((server) => (
                         <ListGroup.Item action
-                                        onClick={() => props.setServer(server.name)}>{server.name}</ListGroup.Item>
+                                        onClick={() => props.setServer(server.name)}>
+                            {server.name}{server.status ? ` (${server.status.online}/${server.status.max} online)` : ""}
+                        </ListGroup.Item>
                     ))}
                 </ListGroup>
             </Col>
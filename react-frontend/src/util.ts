@@ -1,19 +1,25 @@
-export async function post(url : string, data : object | null = null, show_alert : boolean = true) : Promise<Array<any>> {
+export async function post(url : string, data : object | null = null, show_alert : boolean = true,
+                           headers : Record<string, string> = {}) : Promise<Array<any>> {
     if (data === undefined || data === null) {
         data = {};
     }
     const resp = await fetch(url, {
         method: "POST",
         headers: {
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            ...headers
         },
         body: JSON.stringify(data)
     })
+    if (resp.status === 304) {
+        // Not modified, so there's no body to parse
+        return [null, resp.status, resp.headers];
+    }
     const resp_data = await resp.json();
     if (show_alert) {
         alert(resp_data.message);
     }
-    return [resp_data, resp.status];
+    return [resp_data, resp.status, resp.headers];
 }
 
 export function login() {
@@ -0,0 +1,29 @@
+import logging
+import os
+import sys
+import threading
+
+os.environ["MC_SERVER_WEB_ROLE"] = "agent"  # Must be set before config is imported
+
+import agent
+import config
+from AgentServer import AgentServer
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    config_err: str = config.agent_startup()
+    if config_err:
+        logging.critical(config_err)
+        sys.exit(1)
+    agent_server = AgentServer(config.AGENT_HOST, config.AGENT_PORT, config.AGENT_TOKEN, agent.HANDLERS,
+                               lambda: config.snapshot,
+                               lambda: list({**config.servers, **config.running_servers}.values()),
+                               config.AGENT_PUSH_INTERVAL)
+    try:
+        agent_server.start()
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent_server.stop()
+        config.shutdown()
@@ -9,4 +9,7 @@ if __name__ == "__main__":
         app.app.logger.critical(config_err)
         sys.exit(1)
     app.app.secret_key = config.FLASK_SECRET_KEY
-    serve(app.app, host="0.0.0.0", port=config.PORT)
+    try:
+        serve(app.app, host="0.0.0.0", port=config.PORT, threads=config.WAITRESS_THREADS)
+    finally:
+        config.shutdown()
@@ -0,0 +1,55 @@
+import time
+import unittest
+
+from CrashSupervisor import CrashSupervisor
+from StartupQueue import StartupQueue
+from tests.test_startup_queue import FakeServer, launch
+
+BACKOFF = 0.5
+
+
+class CrashSupervisorTest(unittest.TestCase):
+    def test_backoff_doubles(self):
+        supervisor = CrashSupervisor(10, 600, 5, 1800)
+        server = FakeServer("server")
+        for crash_time, restart_at in ((0, 10), (20, 40), (50, 90)):
+            supervisor.on_crash(server, crash_time)
+            self.assertEqual(supervisor.get_due(restart_at - 1), [])
+            self.assertEqual(supervisor.get_due(restart_at), ["server"])
+
+    def test_circuit_opens_after_crash_limit(self):
+        supervisor = CrashSupervisor(10, 600, 3, 1800)
+        server = FakeServer("server")
+        for crash_time in (0, 1, 2):
+            supervisor.on_crash(server, crash_time)
+        self.assertTrue(server.circuit_open)
+        self.assertEqual(supervisor.get_due(10000), [])
+
+    def test_crash_during_boot_restarts_after_backoff(self):
+        # Booting and staggering take far longer than the backoff, as with the default settings
+        queue = StartupQueue(launch, lambda: None, max_booting=1, boot_seconds=120, stagger_seconds=30,
+                             min_free_memory_mb=0)
+        queue.start()
+        self.addCleanup(queue.stop)
+        supervisor = CrashSupervisor(BACKOFF, 600, 5, 1800)
+        server = FakeServer("server")
+        queue.enqueue(server)
+        self.assertTrue(server.started.wait(2))
+
+        server.running = False  # Crashed while booting
+        server.started.clear()
+        crashed_at = time.time()
+        supervisor.on_crash(server, crashed_at)
+        # What config.restart_crashed_servers() does on every poll
+        while not server.started.is_set() and time.time() - crashed_at < 5:
+            for _ in supervisor.get_due():
+                queue.enqueue(server)
+            time.sleep(0.05)
+
+        self.assertTrue(server.started.is_set())
+        self.assertGreaterEqual(time.time() - crashed_at, BACKOFF)
+        self.assertLess(time.time() - crashed_at, BACKOFF + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+
+from StartupQueue import StartupQueue
+
+
+class FakeEvents:
+    def publish(self, event_type: str, data: dict):
+        pass
+
+
+class FakeServer:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.queue_position = None
+        self.start_error = None
+        self.events: FakeEvents = FakeEvents()
+        self.running: bool = False
+        self.started: threading.Event = threading.Event()
+
+    def is_running(self) -> bool:
+        return self.running
+
+
+def launch(server: FakeServer) -> str:
+    server.running = True
+    server.started.set()
+    return ""
+
+
+class StartupQueueTest(unittest.TestCase):
+    def make_queue(self) -> StartupQueue:
+        # One server may boot at a time, and booting takes far longer than any of these tests
+        queue = StartupQueue(launch, lambda: None, max_booting=1, boot_seconds=120, stagger_seconds=0,
+                             min_free_memory_mb=0)
+        queue.start()
+        self.addCleanup(queue.stop)
+        return queue
+
+    def test_booting_server_holds_up_queue(self):
+        queue = self.make_queue()
+        first, second = FakeServer("first"), FakeServer("second")
+        queue.enqueue(first)
+        self.assertTrue(first.started.wait(2))
+        self.assertEqual(queue.enqueue(second), 1)
+        self.assertFalse(second.started.wait(0.5))
+
+    def test_crash_during_boot_frees_slot(self):
+        queue = self.make_queue()
+        first, second = FakeServer("first"), FakeServer("second")
+        queue.enqueue(first)
+        self.assertTrue(first.started.wait(2))
+        first.running = False  # Crashed right after starting
+        start = time.monotonic()
+        queue.enqueue(second)
+        self.assertTrue(second.started.wait(2))
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_crashed_server_can_restart_straight_away(self):
+        queue = self.make_queue()
+        server = FakeServer("server")
+        queue.enqueue(server)
+        self.assertTrue(server.started.wait(2))
+        server.running = False
+        server.started.clear()
+        queue.enqueue(server)
+        self.assertTrue(server.started.wait(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
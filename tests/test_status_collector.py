@@ -0,0 +1,154 @@
+import io
+import json
+import socket
+import struct
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from typing import Union
+
+from StatusCollector import StatusCollector, encode_varint, make_packet, ping, read_exactly, read_varint
+
+STATUS = {
+    "version": {"name": "1.20.4", "protocol": 765},
+    "players": {"max": 20, "online": 2, "sample": [{"name": "Alice", "id": "0"}, {"name": "Bob", "id": "1"}]},
+    "description": {"text": "§aHello", "extra": [{"text": " §lworld"}, " !"]},
+}
+
+
+class Responder:
+    """A stand-in Minecraft server on localhost that answers Server List Pings with a canned status, or never answers
+    if status is None."""
+
+    def __init__(self, status: Union[dict, None], packet_id: int = 0):
+        self.status: Union[dict, None] = status
+        self.packet_id: int = packet_id  # ID of the status response packet, to send a wrong one
+        self.handshake: Union[tuple, None] = None  # Protocol version, host, port and next state the client sent
+        self.listener: socket.socket = socket.create_server(("127.0.0.1", 0))
+        self.port: int = self.listener.getsockname()[1]
+        self.done: threading.Event = threading.Event()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def close(self):
+        self.done.set()
+        self.listener.close()
+
+    def _serve(self):
+        try:
+            sock, _ = self.listener.accept()
+        except OSError:
+            return
+        with sock, sock.makefile("rb") as f:
+            if self.status is None:
+                self.done.wait(5)  # Hold the connection open without ever answering
+                return
+            read_varint(f)
+            read_varint(f)  # Handshake packet ID
+            version = read_varint(f)
+            host = read_exactly(f, read_varint(f)).decode("utf-8")
+            port = struct.unpack(">H", read_exactly(f, 2))[0]
+            self.handshake = (version, host, port, read_varint(f))
+            read_varint(f)
+            read_varint(f)  # Status request packet ID
+            body = json.dumps(self.status).encode("utf-8")
+            sock.sendall(make_packet(encode_varint(self.packet_id) + encode_varint(len(body)) + body))
+            try:
+                read_varint(f)
+                read_varint(f)  # Ping packet ID
+                sock.sendall(make_packet(b"\x01" + read_exactly(f, 8)))
+            except (OSError, EOFError):
+                pass  # The client gave up after the status response, such as when it was the wrong packet
+
+
+class FakeServer(SimpleNamespace):
+    def is_running(self) -> bool:
+        return True
+
+    def set_status(self, status: Union[dict, None]):
+        self.status = status
+        self.status_set.set()
+
+
+class VarintTest(unittest.TestCase):
+    def test_round_trip(self):
+        for value in (0, 1, 127, 128, 255, 25565, 2097151, 2 ** 31 - 1, -1, -(2 ** 31)):
+            with self.subTest(value=value):
+                self.assertEqual(read_varint(io.BytesIO(encode_varint(value))), value)
+
+    def test_known_encodings(self):
+        self.assertEqual(encode_varint(0), b"\x00")
+        self.assertEqual(encode_varint(300), b"\xac\x02")
+        self.assertEqual(encode_varint(-1), b"\xff\xff\xff\xff\x0f")
+
+    def test_too_big(self):
+        with self.assertRaises(ValueError):
+            read_varint(io.BytesIO(b"\xff" * 6))
+
+    def test_truncated(self):
+        with self.assertRaises(EOFError):
+            read_varint(io.BytesIO(b"\xff"))
+
+    def test_packet_is_length_prefixed(self):
+        data = b"x" * 200
+        f = io.BytesIO(make_packet(data))
+        self.assertEqual(read_exactly(f, read_varint(f)), data)
+
+
+class PingTest(unittest.TestCase):
+    def test_round_trip(self):
+        responder = Responder(STATUS)
+        self.addCleanup(responder.close)
+        status = ping("127.0.0.1", responder.port, 2)
+        self.assertEqual(responder.handshake[1:], ("127.0.0.1", responder.port, 1))
+        self.assertEqual(status["online"], 2)
+        self.assertEqual(status["max"], 20)
+        self.assertEqual(status["players"], ["Alice", "Bob"])
+        self.assertEqual(status["motd"], "Hello world !")
+        self.assertEqual(status["version"], "1.20.4")
+        self.assertGreaterEqual(status["latency_ms"], 0)
+
+    def test_never_answers(self):
+        responder = Responder(None)
+        self.addCleanup(responder.close)
+        start = time.monotonic()
+        with self.assertRaises(OSError):
+            ping("127.0.0.1", responder.port, 0.2)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_wrong_packet(self):
+        responder = Responder(STATUS, packet_id=5)
+        self.addCleanup(responder.close)
+        with self.assertRaises(ValueError):
+            ping("127.0.0.1", responder.port, 2)
+
+
+class StatusCollectorTest(unittest.TestCase):
+    def collect(self, port: int) -> FakeServer:
+        collector = StatusCollector(0.2)
+        self.addCleanup(collector.shutdown)
+        server = FakeServer(name="test", metadata=SimpleNamespace(status_port=port), status="unset",
+                            status_set=threading.Event())
+        collector.collect([server])
+        self.assertTrue(server.status_set.wait(5))
+        return server
+
+    def test_collects_status(self):
+        responder = Responder(STATUS)
+        self.addCleanup(responder.close)
+        self.assertEqual(self.collect(responder.port).status["online"], 2)
+
+    def test_falls_back_to_none_when_server_never_answers(self):
+        responder = Responder(None)
+        self.addCleanup(responder.close)
+        self.assertIsNone(self.collect(responder.port).status)
+
+    def test_falls_back_to_none_when_server_is_down(self):
+        listener = socket.create_server(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+        listener.close()
+        self.assertIsNone(self.collect(port).status)
+
+
+if __name__ == "__main__":
+    unittest.main()